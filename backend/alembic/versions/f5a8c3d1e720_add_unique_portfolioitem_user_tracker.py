@@ -0,0 +1,71 @@
+"""Add unique portfolioitem (user_id, tracker_id) index
+
+Revision ID: f5a8c3d1e720
+Revises: d47a91c3e5b2
+Create Date: 2026-10-18 10:12:37.418206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5a8c3d1e720'
+down_revision: Union[str, Sequence[str], None] = 'd47a91c3e5b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _merge_duplicate_items(bind) -> None:
+    """
+    Folds duplicate (user_id, tracker_id) items left by concurrent orders into
+    the oldest one, positions included. Run `python -m app.jobs.rebuild_summaries`
+    afterwards: their tracker counts included the duplicates.
+    """
+    duplicates = bind.execute(sa.text(
+        "SELECT user_id, tracker_id, MIN(id) FROM portfolioitem "
+        "GROUP BY user_id, tracker_id HAVING COUNT(*) > 1"
+    )).all()
+    for user_id, tracker_id, keep_id in duplicates:
+        key = {"user_id": user_id, "tracker_id": tracker_id, "keep_id": keep_id}
+        bind.execute(sa.text(
+            "UPDATE portfolioitem SET "
+            "invested_amount_clp = (SELECT SUM(invested_amount_clp) FROM portfolioitem "
+            "WHERE user_id = :user_id AND tracker_id = :tracker_id), "
+            "current_value_clp = (SELECT SUM(current_value_clp) FROM portfolioitem "
+            "WHERE user_id = :user_id AND tracker_id = :tracker_id) "
+            "WHERE id = :keep_id"
+        ), key)
+        positions = bind.execute(sa.text(
+            "SELECT p.id, p.ticker, p.shares, p.cost_basis_clp, p.market_value_clp FROM position p "
+            "JOIN portfolioitem i ON i.id = p.portfolio_item_id "
+            "WHERE i.user_id = :user_id AND i.tracker_id = :tracker_id AND i.id != :keep_id"
+        ), key).all()
+        for position_id, ticker, shares, cost_basis_clp, market_value_clp in positions:
+            merged = bind.execute(sa.text(
+                "UPDATE position SET shares = shares + :shares, cost_basis_clp = cost_basis_clp + :cost, "
+                "market_value_clp = market_value_clp + :value WHERE portfolio_item_id = :keep_id AND ticker = :ticker"
+            ), {"shares": shares, "cost": cost_basis_clp, "value": market_value_clp, "keep_id": keep_id, "ticker": ticker})
+            if merged.rowcount:
+                bind.execute(sa.text("DELETE FROM position WHERE id = :id"), {"id": position_id})
+            else:
+                bind.execute(
+                    sa.text("UPDATE position SET portfolio_item_id = :keep_id WHERE id = :id"),
+                    {"keep_id": keep_id, "id": position_id}
+                )
+        bind.execute(sa.text(
+            "DELETE FROM portfolioitem WHERE user_id = :user_id AND tracker_id = :tracker_id AND id != :keep_id"
+        ), key)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _merge_duplicate_items(op.get_bind())
+    op.create_index('ix_portfolioitem_user_id_tracker_id', 'portfolioitem', ['user_id', 'tracker_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_portfolioitem_user_id_tracker_id', table_name='portfolioitem')
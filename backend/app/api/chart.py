@@ -1,86 +1,158 @@
-import altair as alt
-import yfinance as yf
-import polars as pl
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-
-
-class ChartRequest(BaseModel):
-    val: int
-    tracker_id: int
-
-
-router = APIRouter(prefix="/chart")
-
-
-@router.post("/test")
-def test(request: ChartRequest):
-
-    data = [
-        {  # warren
-            "x": ["2025-01-01", "2025-03-11", "2025-05-20", "2025-07-29", "2025-10-07", "2025-11-21"],
-            "y": [0.0, 2.91, -3.52, 5.89, 27.31, 23.45]
-        },
-        {  # Li Lu REAL
-            "x": ["2025-01-01", "2025-03-11", "2025-05-20", "2025-07-29", "2025-10-07", "2025-11-21"],
-            "y": [0.0, 2.75, -3.75, 6.24, 26.94, 23.73]
-        },
-        {  # bill ackman REAL
-            "x": ["2025-01-01", "2025-03-11", "2025-05-20", "2025-07-29", "2025-10-07", "2025-11-21"],
-            "y": [0.0, 2.42, -2.89, 0.29, 5.83, 5.52]
-        },
-        {  # risky norris
-            "x": ["2025-01-01", "2025-03-11", "2025-05-20", "2025-07-29", "2025-10-07", "2025-11-21"],
-            "y": [0.0, -3.82, -1.25, 0.57, 1.37, 0.65]
-        },
-        {  # bryan lawrence
-            "x": ["2025-01-01", "2025-03-11", "2025-05-20", "2025-07-29", "2025-10-07", "2025-11-21"],
-            "y": [0.0, -4.13, -0.88, 0.43, 1.68, 0.53]
-        },
-        {  # norbert lou REAL
-            "x": ["2025-01-01", "2025-03-11", "2025-05-20", "2025-07-29", "2025-10-07", "2025-11-21"],
-            "y": [0.0, 4.10, 7.78, 3.74, 4.23, 3.44]
-        },
-        {  # dan crenshaw
-            "x": ["2025-01-01", "2025-03-11", "2025-05-20", "2025-07-29", "2025-10-07", "2025-11-21"],
-            "y": [0.0, 3.12, -2.45, 5.12, 15.34, 11.30]
-        },
-        {  # ro kanna
-            "x": ["2025-01-01", "2025-03-11", "2025-05-20", "2025-07-29", "2025-10-07", "2025-11-21"],
-            "y": [0.0, 2.98, -4.17, 6.39, 26.27, 24.07]
-        },
-        {  # nancy
-            "x": ["2025-01-01", "2025-03-11", "2025-05-20", "2025-07-29", "2025-10-07", "2025-11-21"],
-            "y": [0.0, 2.98, -4.17, 6.39, 26.27, 24.07]
-        }
-    ]
-
-    # Build an interactive line chart
-    chart = (
-        alt.Chart(pl.DataFrame(data[request.tracker_id-1]))
-        .mark_area(
-            line={'color': '#4c78a8'},  # colour of the line itself
-            color=alt.Gradient(
-                gradient='linear',
-                stops=[alt.GradientStop(color='#4c78a8', offset=0),
-                       alt.GradientStop(color='#4c78a800', offset=1)],  # add transparency at the bottom
-                x1=0, x2=0, y1=0, y2=1   # vertical gradient
-            )
-        )
-        .encode(
-            x=alt.X("x:T").axis(title=None, labelFontSize=14),
-            y=alt.Y("y:Q").axis(title="Retorno acumulado", labelFontSize=14, titleFontSize=16)
-        )
-        .configure_axis(
-            labelFontSize=14,
-            titleFontSize=16
-        )
-        .properties(width=500)
-    )
-
-    chart_spec = chart.to_dict()
-
-    return {
-        "status": "success",
-        "spec": chart_spec
-    }
+"""
+Chart API Routes
+
+Performance charts as Vega-Lite specs, built by ChartService from the
+backtested returns and served from its cache with a strong ETag.
+
+The chart endpoints negotiate their representation on Accept:
+- application/json (default): the full spec with the data embedded;
+- application/vnd.hedgie.columns+json: data only, as parallel arrays with
+  dates as days since 1970-01-01;
+- application/vnd.apache.arrow.stream: data only, as an Arrow IPC stream.
+Data-only clients fetch the spec once from /chart/specs/{style} and feed the
+data to its "series" dataset. A tracker that was never backtested gets an
+empty series ("backtested": false) rather than an error.
+
+ChartService (polars, numpy, altair) is imported by the handlers on first
+use rather than with the router, to keep worker startup fast.
+"""
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlmodel import Session
+from app.core.config import settings
+from app.core.db import get_session
+from app.models import Tracker
+from app.services.catalog_cache import CachedJSON, etag_matches
+from app.services.chart_types import ChartFormat, ChartRange, ChartStyle
+
+router = APIRouter(prefix="/chart", tags=["chart"])
+
+MAX_POINTS_LIMIT = 5000
+MAX_COMPARED_TRACKERS = 10
+
+
+MEDIA_TYPES = {
+    "spec": "application/json",
+    "columns": "application/vnd.hedgie.columns+json",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+_FORMATS_BY_MEDIA_TYPE = {media_type: chart_format for chart_format, media_type in MEDIA_TYPES.items()}
+
+
+def negotiate_format(accept: Optional[str]) -> ChartFormat:
+    """
+    The chart format with the highest q-value in an Accept header ("spec"
+    for */* or no header). Raises 406 if none of them is acceptable.
+    """
+    if not accept:
+        return "spec"
+    best, best_q = None, 0.0
+    for item in accept.split(","):
+        media_type, *params = (part.strip() for part in item.split(";"))
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        chart_format = _FORMATS_BY_MEDIA_TYPE.get(media_type.lower())
+        if chart_format is None and media_type in ("*/*", "application/*"):
+            chart_format = "spec"
+        if chart_format is not None and q > best_q:
+            best, best_q = chart_format, q
+    if best is None:
+        raise HTTPException(status_code=406, detail=f"Supported types: {', '.join(MEDIA_TYPES.values())}")
+    return best
+
+
+def _chart_response(
+    entry: CachedJSON,
+    if_none_match: Optional[str],
+    chart_format: ChartFormat = "spec",
+    cache_control: str = "no-cache"
+) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": cache_control, "Vary": "Accept"}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=MEDIA_TYPES[chart_format], headers=headers)
+
+
+@router.get("/specs/{style}")
+def get_chart_spec(style: ChartStyle, if_none_match: Optional[str] = Header(default=None)):
+    """
+    Get a chart style's Vega-Lite spec without data ("area" for tracker
+    charts, "comparison" for comparisons). It reads the named dataset
+    "series", so clients can cache it and fetch only the data.
+    """
+    from app.services.chart_service import spec_template_json
+
+    return _chart_response(spec_template_json(style), if_none_match, cache_control="public, max-age=3600")
+
+
+@router.get("/trackers/{tracker_id}")
+def get_tracker_chart(
+    tracker_id: int,
+    chart_range: ChartRange = Query(default="ytd", alias="range", description="1m, 3m, 6m, ytd, 1y, 5y or max"),
+    max_points: Optional[int] = Query(
+        default=None, ge=3, le=MAX_POINTS_LIMIT, description="Downsampling target (default CHART_MAX_POINTS)"
+    ),
+    session: Session = Depends(get_session),
+    accept: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    Get the cumulative return chart of a follower of the tracker over `range`,
+    with at most `max_points` points (LTTB-downsampled), or an empty series if
+    the tracker hasn't been backtested yet.
+    Public endpoint - no authentication required.
+    """
+    from app.services.chart_service import chart_service
+
+    chart_format = negotiate_format(accept)
+    entry = chart_service.tracker_chart(tracker_id, chart_range, max_points, chart_format)
+    if entry is None:
+        if session.get(Tracker, tracker_id) is None:
+            raise HTTPException(status_code=404, detail="Tracker not found")
+        entry = chart_service.pending_tracker_chart(tracker_id, chart_range, chart_format)
+    return _chart_response(entry, if_none_match, chart_format)
+
+
+@router.get("/compare")
+def get_comparison_chart(
+    trackers: str = Query(description="Comma-separated tracker ids, e.g. 1,2,3"),
+    benchmark: str = Query(
+        default=settings.CHART_BENCHMARK_TICKER, description="Benchmark ticker; empty for none"
+    ),
+    chart_range: ChartRange = Query(default="ytd", alias="range", description="1m, 3m, 6m, ytd, 1y, 5y or max"),
+    max_points: Optional[int] = Query(
+        default=None, ge=3, le=MAX_POINTS_LIMIT, description="Downsampling target (default CHART_MAX_POINTS)"
+    ),
+    session: Session = Depends(get_session),
+    accept: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    Compare the cumulative returns of several trackers and a benchmark
+    (S&P 500 by default) over `range` on one layered chart.
+    Public endpoint - no authentication required.
+    """
+    from app.services.chart_service import chart_service
+
+    chart_format = negotiate_format(accept)
+    try:
+        tracker_ids = list(dict.fromkeys(int(part) for part in trackers.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="trackers must be comma-separated ids")
+    if not tracker_ids or len(tracker_ids) > MAX_COMPARED_TRACKERS:
+        raise HTTPException(status_code=400, detail=f"Compare 1 to {MAX_COMPARED_TRACKERS} trackers")
+
+    try:
+        entry = chart_service.comparison_chart(tracker_ids, benchmark, session, chart_range, max_points, chart_format)
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return _chart_response(entry, if_none_match, chart_format)
@@ -1,11 +1,14 @@
 """
 Investment API Routes
 """
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
 from pydantic import BaseModel, Field
-from sqlmodel import Session
-from app.core.db import get_session
-from app.services import investment_service
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.db import get_async_session
+from app.services import async_investment_service
+from app.services.idempotency_service import idempotency_service
+from app.services.order_worker import order_worker_pool
 
 router = APIRouter(prefix="/invest", tags=["investment"])
 
@@ -17,10 +20,11 @@ class InvestmentRequest(BaseModel):
     amount_clp: float = Field(gt=0, description="Amount to invest in CLP (must be positive)")
 
 
-@router.post("/")
+@router.post("/", status_code=202)
 async def execute_investment(
     request: InvestmentRequest,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
 ):
     """
     Execute an investment in a tracker.
@@ -28,17 +32,41 @@ async def execute_investment(
     This endpoint:
     1. Validates the user has sufficient funds
     2. Deducts the amount from their balance
-    3. Creates or updates a PortfolioItem
-    4. Records the transaction
-    """
-    result = await investment_service.execute_investment(
-        user_id=request.user_id,
-        tracker_id=request.tracker_id,
-        amount_clp=request.amount_clp,
-        session=session
-    )
+    3. Queues an order and returns 202 with its order_id
     
-    if not result.get("success"):
-        raise HTTPException(status_code=400, detail=result.get("error", "Investment failed"))
+    The order workers then place the broker orders, create or update the
+    PortfolioItem and record the transaction (or refund on failure).
+    Poll GET /invest/orders/{order_id} for the outcome.
     
-    return result
+    Send an Idempotency-Key header to make retries safe: a retry with the
+    same key returns the original response without investing again.
+    """
+    async def invest():
+        result = await async_investment_service.enqueue_investment(
+            user_id=request.user_id,
+            tracker_id=request.tracker_id,
+            amount_clp=request.amount_clp,
+            session=session
+        )
+        
+        if not result.get("success"):
+            raise HTTPException(status_code=400, detail=result.get("error", "Investment failed"))
+        
+        order_worker_pool.notify()
+        return result
+    
+    return await idempotency_service.run(
+        idempotency_key, "invest", request.model_dump(), invest, session, success_status=202
+    )
+
+
+@router.get("/orders/{order_id}")
+async def get_order_status(order_id: int, session: AsyncSession = Depends(get_async_session)):
+    """
+    Returns the status of a queued investment:
+    'queued', 'submitted', 'filled' (with fills), 'failed' or 'expired' (with error).
+    """
+    order = await async_investment_service.get_order(order_id, session)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
@@ -0,0 +1,52 @@
+"""
+Metrics API Routes
+
+Exposes in-process counters in the Prometheus text format so they can be
+scraped alongside the health check.
+"""
+import sys
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services import broker_service, tracker_service
+from app.services.order_aggregator import order_aggregator
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+def _collect() -> dict:
+    """Gathers every exported counter as {metric_name: value}."""
+    quotes = broker_service.quote_cache.stats()
+    catalog = tracker_service.catalog_cache.stats()
+    # Charts load lazily: until one is served there is nothing to report
+    chart_module = sys.modules.get("app.services.chart_service")
+    charts = chart_module.chart_service.cache.stats() if chart_module else {"hits": 0, "misses": 0, "size": 0}
+    return {
+        "hedgie_quote_cache_hits_total": quotes["hits"],
+        "hedgie_quote_cache_misses_total": quotes["misses"],
+        "hedgie_quote_cache_coalesced_total": quotes["coalesced"],
+        "hedgie_quote_cache_evictions_total": quotes["evictions"],
+        "hedgie_quote_cache_size": quotes["size"],
+        "hedgie_catalog_cache_hits_total": catalog["hits"],
+        "hedgie_catalog_cache_misses_total": catalog["misses"],
+        "hedgie_catalog_cache_size": catalog["size"],
+        "hedgie_catalog_version": catalog["version"],
+        "hedgie_chart_cache_hits_total": charts["hits"],
+        "hedgie_chart_cache_misses_total": charts["misses"],
+        "hedgie_chart_cache_size": charts["size"],
+        "hedgie_order_netting_orders_received_total": order_aggregator.orders_received,
+        "hedgie_order_netting_broker_orders_total": order_aggregator.broker_orders_sent,
+        "hedgie_order_netting_flushes_total": order_aggregator.flush_count,
+    }
+
+
+@router.get("", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Returns counters in the Prometheus text exposition format.
+    """
+    lines = []
+    for name, value in _collect().items():
+        metric_type = "counter" if name.endswith("_total") else "gauge"
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
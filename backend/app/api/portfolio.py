@@ -2,15 +2,15 @@
 Portfolio API Routes
 """
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session
-from app.core.db import get_session
-from app.services import portfolio_service
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.db import get_async_session
+from app.services import async_portfolio_service
 
 router = APIRouter(prefix="/portfolio", tags=["portfolio"])
 
 
 @router.get("/{user_id}")
-def get_user_portfolio(user_id: int, session: Session = Depends(get_session)):
+async def get_user_portfolio(user_id: int, session: AsyncSession = Depends(get_async_session)):
     """
     Get the complete portfolio summary for a user.
 
@@ -21,7 +21,7 @@ def get_user_portfolio(user_id: int, session: Session = Depends(get_session)):
     - Overall P&L
     - List of active trackers with individual P&L
     """
-    portfolio = portfolio_service.get_user_portfolio(user_id, session)
+    portfolio = await async_portfolio_service.get_user_portfolio(user_id, session)
 
     if "error" in portfolio:
         raise HTTPException(status_code=404, detail=portfolio["error"])
@@ -0,0 +1,58 @@
+"""
+Price History API Routes
+
+Serves daily closes from the local Parquet price store, aligned on a common
+date axis, as columnar JSON: one `dates` array and one price array per ticker.
+The store (polars) is imported on the first request, not at startup.
+"""
+from datetime import date
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+
+router = APIRouter(prefix="/prices", tags=["prices"])
+
+MAX_TICKERS = 50
+
+
+class PriceMatrixResponse(BaseModel):
+    tickers: List[str]
+    dates: List[date]
+    prices: Dict[str, List[Optional[float]]]
+
+
+@router.get("", response_model=PriceMatrixResponse)
+def get_price_matrix(
+    tickers: str = Query(description="Comma-separated tickers, e.g. AAPL,MSFT"),
+    start: Optional[date] = Query(default=None, description="First day, inclusive"),
+    end: Optional[date] = Query(default=None, description="Last day, inclusive")
+):
+    """
+    Get daily closes for several tickers on the union of their trading days.
+    Gaps are forward-filled; days before a ticker's first price are null.
+    Public endpoint - no authentication required.
+    """
+    requested = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers.split(",") if ticker.strip()))
+    if not requested:
+        raise HTTPException(status_code=400, detail="No tickers given")
+    if len(requested) > MAX_TICKERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_TICKERS} tickers per request")
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+    from app.services.price_store import price_store
+
+    try:
+        matrix = price_store.matrix(requested, start, end)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    missing = [ticker for ticker in requested if ticker not in matrix.columns]
+    if len(missing) == len(requested):
+        raise HTTPException(status_code=404, detail=f"No prices for {', '.join(missing)}")
+
+    present = [ticker for ticker in requested if ticker not in missing]
+    return {
+        "tickers": present,
+        "dates": matrix["date"].to_list(),
+        "prices": {ticker: matrix[ticker].to_list() for ticker in present},
+    }
@@ -1,46 +1,143 @@
 """
 Tracker API Routes
+
+Catalog responses are served from TrackerService's in-process cache as
+pre-serialized JSON with a strong ETag; a matching If-None-Match gets a 304.
 """
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from pydantic import BaseModel
 from sqlmodel import Session
 from app.core.db import get_session
 from app.services import tracker_service
+from app.services.catalog_cache import CachedJSON, etag_matches
 from app.models import Tracker, TrackerHolding
 
 router = APIRouter(prefix="/trackers", tags=["trackers"])
 
 
+class HoldingChangeResponse(BaseModel):
+    ticker: str
+    company_name: str
+    change: Literal["added", "removed", "reweighted"]
+    previous_percent: float
+    allocation_percent: float
+    delta_percent: float
+
+
+class HoldingsDiffResponse(BaseModel):
+    tracker_id: int
+    from_period: Optional[date]
+    to_period: Optional[date]
+    changes: List[HoldingChangeResponse]
+
+
+def _catalog_response(entry: CachedJSON, if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if entry.next_cursor:
+        headers["X-Next-Cursor"] = entry.next_cursor
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
 @router.get("/", response_model=List[Tracker])
-def get_all_trackers(session: Session = Depends(get_session)):
+def get_all_trackers(
+    session: Session = Depends(get_session),
+    tracker_type: Optional[str] = Query(default=None, alias="type", description="'fund' or 'politician'"),
+    risk_level: Optional[str] = Query(default=None, description="Exact risk level, e.g. 'High'"),
+    sort: Literal["id", "ytd_return", "followers_count", "average_delay"] = "id",
+    order: Optional[Literal["asc", "desc"]] = Query(
+        default=None, description="Defaults to asc for id and desc for the other sort keys"
+    ),
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor from the previous page"),
+    include: Optional[Literal["holdings"]] = Query(default=None, description="'holdings' nests each tracker's holdings"),
+    if_none_match: Optional[str] = Header(default=None)
+):
     """
-    Get all available trackers (Marketplace view).
+    Get available trackers (Marketplace view), one page at a time.
     Public endpoint - no authentication required.
+    
+    Supports filtering by type and risk level and sorting by YTD return,
+    followers or reporting delay. When more trackers follow, the response
+    carries an X-Next-Cursor header; pass it back as `cursor` for the next page.
+    
+    With include=holdings every tracker also carries a "holdings" list, so
+    the marketplace can render from this single request.
     """
-    trackers = tracker_service.get_all_trackers(session)
-    return trackers
+    try:
+        entry = tracker_service.list_trackers_json(
+            session, tracker_type, risk_level, sort, order, limit, cursor, include_holdings=include == "holdings"
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return _catalog_response(entry, if_none_match)
 
 
 @router.get("/{tracker_id}", response_model=Tracker)
-def get_tracker_detail(tracker_id: int, session: Session = Depends(get_session)):
+def get_tracker_detail(
+    tracker_id: int,
+    session: Session = Depends(get_session),
+    if_none_match: Optional[str] = Header(default=None)
+):
     """
     Get detailed information about a specific tracker.
     """
-    tracker = tracker_service.get_tracker_by_id(tracker_id, session)
-    if not tracker:
+    entry = tracker_service.get_tracker_json(tracker_id, session)
+    if not entry:
         raise HTTPException(status_code=404, detail="Tracker not found")
-    return tracker
+    return _catalog_response(entry, if_none_match)
 
 
 @router.get("/{tracker_id}/holdings", response_model=List[TrackerHolding])
-def get_tracker_holdings(tracker_id: int, session: Session = Depends(get_session)):
+def get_tracker_holdings(
+    tracker_id: int,
+    session: Session = Depends(get_session),
+    if_none_match: Optional[str] = Header(default=None)
+):
     """
     Get the portfolio composition (holdings) for a specific tracker.
     """
-    # First check if tracker exists
-    tracker = tracker_service.get_tracker_by_id(tracker_id, session)
-    if not tracker:
+    entry = tracker_service.get_tracker_holdings_json(tracker_id, session)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Tracker not found")
+    return _catalog_response(entry, if_none_match)
+
+
+@router.get("/{tracker_id}/holdings/periods", response_model=List[date])
+def get_tracker_holding_periods(
+    tracker_id: int,
+    session: Session = Depends(get_session),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    Get the filing periods with a holdings snapshot, newest first.
+    """
+    entry = tracker_service.get_holding_periods_json(tracker_id, session)
+    if not entry:
         raise HTTPException(status_code=404, detail="Tracker not found")
+    return _catalog_response(entry, if_none_match)
 
-    holdings = tracker_service.get_tracker_holdings(tracker_id, session)
-    return holdings
+
+@router.get("/{tracker_id}/holdings/diff", response_model=HoldingsDiffResponse)
+def get_tracker_holdings_diff(
+    tracker_id: int,
+    session: Session = Depends(get_session),
+    from_period: Optional[date] = Query(default=None, alias="from", description="Defaults to the period before `to`"),
+    to_period: Optional[date] = Query(default=None, alias="to", description="Defaults to the latest period"),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    Get the tickers added, removed and re-weighted between two filing periods.
+    Without parameters, returns what changed in the latest filing
+    (precomputed at ingest time).
+    """
+    try:
+        entry = tracker_service.get_holdings_diff_json(tracker_id, session, from_period, to_period)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if not entry:
+        raise HTTPException(status_code=404, detail="Tracker not found")
+    return _catalog_response(entry, if_none_match)
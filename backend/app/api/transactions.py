@@ -2,18 +2,18 @@
 Transaction API Routes
 """
 from fastapi import APIRouter, Depends
-from sqlmodel import Session
-from app.core.db import get_session
-from app.services.transaction_service import transaction_service
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.db import get_async_session
+from app.services.transaction_service import async_transaction_service
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
 
 @router.get("/{user_id}")
-def get_user_transactions(
+async def get_user_transactions(
     user_id: int,
     limit: int = None,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Get transaction history for a user.
@@ -25,7 +25,7 @@ def get_user_transactions(
     Returns:
         List of transactions with tracker information
     """
-    transactions = transaction_service.get_user_transactions(
+    transactions = await async_transaction_service.get_user_transactions(
         user_id=user_id,
         session=session,
         limit=limit
@@ -5,13 +5,16 @@ Handles user account operations:
 - Deposit funds (mock)
 - Withdraw funds (mock)
 """
-from fastapi import APIRouter, HTTPException, Depends
-from sqlmodel import Session, select
+from fastapi import APIRouter, HTTPException, Depends, Header
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
 
-from app.core.db import get_session
+from app.core.db import get_session, get_async_session
 from app.models.user import User
+from app.services.balance_service import async_balance_service
+from app.services.idempotency_service import idempotency_service
 
 router = APIRouter(prefix="/user", tags=["user"])
 
@@ -32,10 +35,11 @@ class BalanceResponse(BaseModel):
 
 
 @router.post("/{user_id}/deposit", response_model=BalanceResponse)
-def deposit_funds(
+async def deposit_funds(
     user_id: int,
     request: DepositRequest,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
 ):
     """
     Deposit funds into user account (mock operation).
@@ -43,6 +47,7 @@ def deposit_funds(
     Args:
         user_id: ID of the user
         request: Deposit amount in CLP
+        idempotency_key: Optional key that makes retries return the first response
         
     Returns:
         Updated user balance
@@ -51,34 +56,35 @@ def deposit_funds(
         HTTPException 400: If amount is invalid
         HTTPException 404: If user not found
     """
-    # Validate amount
-    if request.amount_clp <= 0:
-        raise HTTPException(status_code=400, detail="Deposit amount must be positive")
-    
-    # Get user
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Update balance (mock deposit)
-    user.balance_clp += request.amount_clp
-    session.add(user)
-    session.commit()
-    session.refresh(user)
+    async def deposit():
+        # Validate amount
+        if request.amount_clp <= 0:
+            raise HTTPException(status_code=400, detail="Deposit amount must be positive")
+        
+        # Update balance atomically (mock deposit)
+        user = await async_balance_service.credit(user_id, request.amount_clp, session)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        await session.commit()
+        
+        return BalanceResponse(
+            user_id=user.id,
+            name=user.name,
+            balance_clp=user.balance_clp,
+            message=f"Successfully deposited {request.amount_clp:,.0f} CLP"
+        )
     
-    return BalanceResponse(
-        user_id=user.id,
-        name=user.name,
-        balance_clp=user.balance_clp,
-        message=f"Successfully deposited {request.amount_clp:,.0f} CLP"
+    return await idempotency_service.run(
+        idempotency_key, f"user:{user_id}:deposit", request.model_dump(), deposit, session
     )
 
 
 @router.post("/{user_id}/withdraw", response_model=BalanceResponse)
-def withdraw_funds(
+async def withdraw_funds(
     user_id: int,
     request: WithdrawRequest,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
 ):
     """
     Withdraw funds from user account (mock operation).
@@ -86,6 +92,7 @@ def withdraw_funds(
     Args:
         user_id: ID of the user
         request: Withdrawal amount in CLP
+        idempotency_key: Optional key that makes retries return the first response
         
     Returns:
         Updated user balance
@@ -94,33 +101,33 @@ def withdraw_funds(
         HTTPException 400: If amount is invalid or exceeds balance
         HTTPException 404: If user not found
     """
-    # Validate amount
-    if request.amount_clp <= 0:
-        raise HTTPException(status_code=400, detail="Withdrawal amount must be positive")
-    
-    # Get user
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Check sufficient balance
-    if user.balance_clp < request.amount_clp:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Insufficient balance. Available: {user.balance_clp:,.0f} CLP, Requested: {request.amount_clp:,.0f} CLP"
+    async def withdraw():
+        # Validate amount
+        if request.amount_clp <= 0:
+            raise HTTPException(status_code=400, detail="Withdrawal amount must be positive")
+        
+        # Check sufficient balance and debit it in one statement (mock withdrawal)
+        user = await async_balance_service.debit(user_id, request.amount_clp, session)
+        if not user:
+            await session.rollback()
+            current = await session.get(User, user_id)
+            if not current:
+                raise HTTPException(status_code=404, detail="User not found")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Insufficient balance. Available: {current.balance_clp:,.0f} CLP, Requested: {request.amount_clp:,.0f} CLP"
+            )
+        await session.commit()
+        
+        return BalanceResponse(
+            user_id=user.id,
+            name=user.name,
+            balance_clp=user.balance_clp,
+            message=f"Successfully withdrew {request.amount_clp:,.0f} CLP"
         )
     
-    # Update balance (mock withdrawal)
-    user.balance_clp -= request.amount_clp
-    session.add(user)
-    session.commit()
-    session.refresh(user)
-    
-    return BalanceResponse(
-        user_id=user.id,
-        name=user.name,
-        balance_clp=user.balance_clp,
-        message=f"Successfully withdrew {request.amount_clp:,.0f} CLP"
+    return await idempotency_service.run(
+        idempotency_key, f"user:{user_id}:withdraw", request.model_dump(), withdraw, session
     )
 
 
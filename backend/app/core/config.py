@@ -10,10 +10,59 @@ class Settings:
     API_V1_STR: str = os.getenv("API_V1_STR", "/api/v1")
     
     # Broker Settings
-    BROKER_MODE: str = os.getenv("BROKER_MODE", "mock")  # 'mock' or 'real'
+    BROKER_MODE: str = os.getenv("BROKER_MODE", "mock")  # 'mock' or 'http'
+    BROKER_URL: str = os.getenv("BROKER_URL", "http://localhost:8001")  # Used when BROKER_MODE=http
+    BROKER_MAX_CONNECTIONS: int = int(os.getenv("BROKER_MAX_CONNECTIONS", "20"))
+    BROKER_TIMEOUT_SECONDS: float = float(os.getenv("BROKER_TIMEOUT_SECONDS", "10"))
+    BROKER_BATCH_SIZE: int = int(os.getenv("BROKER_BATCH_SIZE", "50"))  # Max orders per broker request
+    BROKER_MAX_CONCURRENCY: int = int(os.getenv("BROKER_MAX_CONCURRENCY", "8"))  # Max in-flight orders per investment
+    # Orders from concurrent investments are netted per ticker over this window (0 disables netting)
+    ORDER_NETTING_WINDOW_MS: int = int(os.getenv("ORDER_NETTING_WINDOW_MS", "25"))
+    ORDER_NETTING_MAX_ORDERS: int = int(os.getenv("ORDER_NETTING_MAX_ORDERS", "1000"))  # Flush early at this size
+    QUOTE_CACHE_TTL_SECONDS: float = float(os.getenv("QUOTE_CACHE_TTL_SECONDS", "5"))
+    QUOTE_CACHE_MAX_SIZE: int = int(os.getenv("QUOTE_CACHE_MAX_SIZE", "5000"))
+    USD_CLP_RATE: float = float(os.getenv("USD_CLP_RATE", "950"))  # Broker quotes are in USD, balances in CLP
+    
+    # Idempotency Settings
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))  # In-memory LRU in front of the table
+    IDEMPOTENCY_LEASE_SECONDS: int = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60"))  # Unfinished claims older than this are taken over
+    IDEMPOTENCY_RETENTION_HOURS: int = int(os.getenv("IDEMPOTENCY_RETENTION_HOURS", "24"))  # Keys older than this are pruned
+    
+    # Catalog Settings
+    # Tracker catalog responses are cached in-process until a catalog write or this TTL
+    CATALOG_CACHE_TTL_SECONDS: float = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "300"))
+    CATALOG_CACHE_MAX_SIZE: int = int(os.getenv("CATALOG_CACHE_MAX_SIZE", "2000"))  # Cached responses (pages, details, holdings)
+    
+    # Order Worker Settings
+    ORDER_WORKERS: int = int(os.getenv("ORDER_WORKERS", "2"))  # In-process workers draining the order queue (0 = run app.worker separately)
+    ORDER_CLAIM_BATCH_SIZE: int = int(os.getenv("ORDER_CLAIM_BATCH_SIZE", "20"))  # Queued orders claimed per worker round
+    ORDER_POLL_INTERVAL_SECONDS: float = float(os.getenv("ORDER_POLL_INTERVAL_SECONDS", "0.2"))  # Idle wait between claims
+    ORDER_LEASE_SECONDS: float = float(os.getenv("ORDER_LEASE_SECONDS", "300"))  # 'submitted' orders older than this are expired and refunded
+    
+    # Rebalancing Settings
+    REBALANCE_CHUNK_SIZE: int = int(os.getenv("REBALANCE_CHUNK_SIZE", "10000"))  # Followers loaded per query
+    REBALANCE_MIN_ORDER_CLP: float = float(os.getenv("REBALANCE_MIN_ORDER_CLP", "1000"))  # Smaller net trades aren't sent
+    
+    # Valuation Settings
+    VALUATION_CHUNK_SIZE: int = int(os.getenv("VALUATION_CHUNK_SIZE", "50000"))  # Portfolio item / user ids per UPDATE ... FROM chunk (one transaction each)
+    
+    # Price Store Settings
+    PRICE_STORE_DIR: str = os.getenv("PRICE_STORE_DIR", "data/prices")  # One <TICKER>.parquet per ticker
+    
+    # Backtest Settings
+    BACKTEST_YEARS: int = int(os.getenv("BACKTEST_YEARS", "10"))  # History replayed by each run
+    BACKTEST_CHUNK_SIZE: int = int(os.getenv("BACKTEST_CHUNK_SIZE", "200"))  # Trackers per matrix product
+    RETURNS_STORE_PATH: str = os.getenv("RETURNS_STORE_PATH", "data/tracker_returns.parquet")  # Backtested daily series
+    
+    # Chart Settings
+    CHART_CACHE_MAX_SIZE: int = int(os.getenv("CHART_CACHE_MAX_SIZE", "1024"))  # Serialized chart responses kept in memory
+    CHART_MAX_POINTS: int = int(os.getenv("CHART_MAX_POINTS", "500"))  # Series longer than this are downsampled (LTTB)
+    CHART_BENCHMARK_TICKER: str = os.getenv("CHART_BENCHMARK_TICKER", "SPY")  # S&P 500 ETF, from the price store
     
     # Database Settings
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    # Create tables and load the mock data when the server starts (dev only; otherwise run `python -m app.seed`)
+    SEED_ON_STARTUP: bool = os.getenv("SEED_ON_STARTUP", "false").lower() == "true"
     
     # CORS Settings
     CORS_ORIGINS: str = os.getenv(
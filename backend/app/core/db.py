@@ -1,7 +1,9 @@
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.core.config import settings
 # Import models so they are registered with SQLModel.metadata
-from app.models import User, Tracker, TrackerHolding, PortfolioItem, Transaction
+from app.models import User, Tracker, TrackerHolding, PortfolioItem, Transaction, PortfolioSummary, IdempotencyKey, InvestmentOrder
 
 # check_same_thread=False is needed only for SQLite. 
 # It's not needed for Postgres, but we keep it compatible if using sqlite for dev.
@@ -9,9 +11,31 @@ connect_args = {"check_same_thread": False} if "sqlite" in settings.DATABASE_URL
 
 engine = create_engine(settings.DATABASE_URL, echo=True, connect_args=connect_args)
 
+
+def get_async_database_url(url: str) -> str:
+    """
+    Maps a sync DATABASE_URL onto the equivalent async driver
+    (asyncpg for Postgres, aiosqlite for SQLite).
+    """
+    scheme, _, rest = url.partition("://")
+    if scheme.startswith("postgresql"):
+        return f"postgresql+asyncpg://{rest}"
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+
+# Async engine for async endpoints, so DB round trips don't block the event loop
+async_engine = create_async_engine(get_async_database_url(settings.DATABASE_URL), echo=True)
+
 def get_session():
     with Session(engine) as session:
         yield session
 
+async def get_async_session():
+    # expire_on_commit=False: attributes can't be lazily reloaded outside the event loop
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
@@ -0,0 +1,4 @@
+"""
+Data ingestion pipelines for tracker filings, run from the command line with
+`python -m app.ingest.<name>`.
+"""
@@ -0,0 +1,316 @@
+"""
+Stock Act Periodic Transaction Report (PTR) Ingestion
+
+Loads members of Congress' disclosed trades from local House/Senate dumps
+(CSV or JSON, in the house-/senate-stock-watcher layouts) into
+PoliticianTrade, then derives per politician, in one columnar polars pass
+over the full history:
+
+- the trade-to-disclosure delay distribution (mean, median, p90), whose mean
+  is written to Tracker.average_delay;
+- net holdings (purchases minus sales since the last full sale, valued at the
+  midpoint of the disclosed amount range), which replace TrackerHolding and
+  are recorded as the snapshot for the politician's latest disclosure date.
+
+Only politician trackers whose name matches a filer are updated; the other
+filers' stats are computed and reported but not stored.
+
+Dumps are normalized with polars expressions and inserted in bulk; every
+trade has a natural key, so re-loading an updated dump only adds new trades.
+
+How to run:
+    python -m app.ingest.ptr data/house_all_transactions.json data/senate_all_transactions.csv
+    python -m app.ingest.ptr    # recompute from the trades already loaded
+"""
+import argparse
+import sys
+from dataclasses import dataclass, field
+from typing import List, Tuple
+import polars as pl
+from sqlalchemy import delete, func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+from app.core.db import engine
+from app.models import PoliticianTrade, Tracker, TrackerHolding
+from app.services.holding_history_service import holding_history_service
+
+# Delays outside this range are typos in the filings (e.g. a year of 0202)
+MAX_DELAY_DAYS = 3 * 365
+
+INSERT_CHUNK_SIZE = 5000
+
+_DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y")
+
+TRADE_SCHEMA = {
+    "politician": pl.String,
+    "ticker": pl.String,
+    "asset_description": pl.String,
+    "transaction_type": pl.String,
+    "transaction_date": pl.Date,
+    "disclosure_date": pl.Date,
+    "amount_min_usd": pl.Float64,
+    "amount_max_usd": pl.Float64,
+}
+
+
+@dataclass
+class PtrReport:
+    files: int = 0
+    trades_read: int = 0
+    trades_loaded: int = 0
+    politicians: int = 0
+    trackers_updated: List[str] = field(default_factory=list)
+    holdings_written: int = 0
+    unmatched_trackers: List[str] = field(default_factory=list)
+
+
+def _clean_name(expr: pl.Expr) -> pl.Expr:
+    """Filer name without honorifics ('Hon. Nancy Pelosi' -> 'Nancy Pelosi')."""
+    return expr.str.strip_chars().str.replace(r"(?i)^hon\.?\s+", "").str.replace_all(r"\s+", " ")
+
+
+def _name_key(expr: pl.Expr) -> pl.Expr:
+    """Case-insensitive name, for matching filers to trackers."""
+    return _clean_name(expr).str.to_lowercase()
+
+
+def _blank_to_null(expr: pl.Expr) -> pl.Expr:
+    """Empty and placeholder values ('--', 'N/A') as nulls."""
+    expr = expr.str.strip_chars()
+    return pl.when(expr.is_in(["", "--", "N/A"])).then(None).otherwise(expr)
+
+
+def _parse_date(column: str) -> pl.Expr:
+    return pl.coalesce([pl.col(column).str.strip_chars().str.to_date(fmt, strict=False) for fmt in _DATE_FORMATS])
+
+
+def _transaction_type(column: str) -> pl.Expr:
+    """Maps 'Sale (Full)', 'sale_full', 'Purchase', ... onto the four canonical types."""
+    value = pl.col(column).str.to_lowercase()
+    return (
+        pl.when(value.str.contains("purchase")).then(pl.lit("purchase"))
+        .when(value.str.contains("full")).then(pl.lit("sale_full"))
+        .when(value.str.contains("sale")).then(pl.lit("sale_partial"))
+        .when(value.str.contains("exchange")).then(pl.lit("exchange"))
+        .otherwise(None)
+    )
+
+
+def normalize_ptr(frame: pl.DataFrame, chamber: str) -> pl.DataFrame:
+    """
+    Turns a raw dump into PoliticianTrade columns. Rows without a filer, a
+    recognized transaction type or valid dates are dropped.
+    """
+    name_column = next(column for column in ("politician", "representative", "senator") if column in frame.columns)
+    for column in ("owner", "ticker", "asset_description", "amount"):
+        if column not in frame.columns:
+            frame = frame.with_columns(pl.lit(None, pl.String).alias(column))
+    # "$1,001 - $15,000" -> [1001, 15000]; "Over $50,000,000" -> [50000000]
+    bounds = pl.col("amount").str.replace_all(",", "").str.extract_all(r"\d+(?:\.\d+)?").cast(pl.List(pl.Float64))
+
+    trades = (
+        frame.lazy()
+        .select(pl.all().cast(pl.String))
+        .select(
+            _clean_name(pl.col(name_column)).alias("politician"),
+            pl.lit(chamber).alias("chamber"),
+            _blank_to_null(pl.col("owner")).str.to_lowercase().alias("owner"),
+            _blank_to_null(pl.col("ticker")).str.to_uppercase().alias("ticker"),
+            pl.col("asset_description").str.strip_chars().fill_null("").alias("asset_description"),
+            _transaction_type("type").alias("transaction_type"),
+            _parse_date("transaction_date").alias("transaction_date"),
+            _parse_date("disclosure_date").alias("disclosure_date"),
+            bounds.list.first().fill_null(0.0).alias("amount_min_usd"),
+            bounds.list.last().fill_null(0.0).alias("amount_max_usd"),
+        )
+        .drop_nulls(["politician", "transaction_type", "transaction_date", "disclosure_date"])
+        .filter(pl.col("politician") != "")
+    )
+    return trades.with_columns(
+        pl.concat_str(
+            [
+                pl.col("politician"), pl.col("owner"), pl.col("ticker"), pl.col("asset_description"),
+                pl.col("transaction_type"), pl.col("transaction_date"), pl.col("disclosure_date"),
+                pl.col("amount_min_usd"), pl.col("amount_max_usd"),
+            ],
+            separator="|",
+            ignore_nulls=True
+        ).alias("trade_key")
+    ).collect()
+
+
+def read_ptr_file(path: str) -> pl.DataFrame:
+    """Reads and normalizes a House or Senate dump (.csv or .json)."""
+    if path.lower().endswith(".json"):
+        raw = pl.read_json(path, infer_schema_length=None)
+    else:
+        raw = pl.read_csv(path, infer_schema=False)
+    chamber = "senate" if "senator" in raw.columns else "house"
+    return normalize_ptr(raw, chamber)
+
+
+def _insert_statement(dialect_name: str):
+    """Bulk INSERT that skips trades already loaded (same trade_key)."""
+    if dialect_name == "postgresql":
+        return postgresql.insert(PoliticianTrade).on_conflict_do_nothing(index_elements=["trade_key"])
+    if dialect_name == "sqlite":
+        return sqlite.insert(PoliticianTrade).on_conflict_do_nothing(index_elements=["trade_key"])
+    return insert(PoliticianTrade)
+
+
+def load_trades(trades: pl.DataFrame, session: Session) -> int:
+    """Bulk-inserts normalized trades in chunks. Returns the number of new trades."""
+    count = select(func.count()).select_from(PoliticianTrade)
+    before = session.exec(count).one()
+    statement = _insert_statement(session.get_bind().dialect.name)
+    for chunk in trades.iter_slices(INSERT_CHUNK_SIZE):
+        session.exec(statement, params=chunk.to_dicts())
+    return session.exec(count).one() - before
+
+
+def trades_frame(session: Session) -> pl.DataFrame:
+    """Every loaded trade, with just the columns the analytics need."""
+    rows = session.exec(select(*(getattr(PoliticianTrade, column) for column in TRADE_SCHEMA))).all()
+    return pl.DataFrame(rows, schema=TRADE_SCHEMA, orient="row")
+
+
+def delay_stats(trades: pl.DataFrame) -> pl.DataFrame:
+    """
+    Per politician: trade count, mean/median/p90 disclosure delay in days and
+    the latest disclosure date.
+    """
+    delay = (pl.col("disclosure_date") - pl.col("transaction_date")).dt.total_days()
+    return (
+        trades.lazy()
+        .with_columns(delay.alias("delay_days"))
+        .filter(pl.col("delay_days").is_between(0, MAX_DELAY_DAYS))
+        .group_by("politician")
+        .agg(
+            pl.len().alias("trades"),
+            pl.col("delay_days").mean().alias("mean_delay"),
+            pl.col("delay_days").median().alias("median_delay"),
+            pl.col("delay_days").quantile(0.9, "linear").alias("p90_delay"),
+            pl.col("disclosure_date").max().alias("last_disclosure"),
+        )
+        .sort("politician")
+        .collect()
+    )
+
+
+def net_holdings(trades: pl.DataFrame) -> pl.DataFrame:
+    """
+    Per politician and ticker: purchases minus sales (at the midpoint of the
+    disclosed range) since the last full sale, kept when positive, with each
+    position's share of the politician's net total as allocation_percent.
+    """
+    position = ["politician", "ticker"]
+    midpoint = (pl.col("amount_min_usd") + pl.col("amount_max_usd")) / 2
+    sign = (
+        pl.when(pl.col("transaction_type") == "purchase").then(1.0)
+        .when(pl.col("transaction_type").str.starts_with("sale")).then(-1.0)
+        .otherwise(0.0)
+    )
+    last_full_sale = (
+        pl.col("transaction_date").filter(pl.col("transaction_type") == "sale_full").max().over(position)
+    )
+    return (
+        trades.lazy()
+        .filter(pl.col("ticker").is_not_null())
+        .sort("transaction_date")
+        .filter(last_full_sale.is_null() | (pl.col("transaction_date") > last_full_sale))
+        .group_by(position)
+        .agg(
+            (midpoint * sign).sum().alias("net_usd"),
+            pl.col("asset_description").last().alias("company_name"),
+        )
+        .filter(pl.col("net_usd") > 0)
+        .with_columns(
+            (pl.col("net_usd") / pl.col("net_usd").sum().over("politician") * 100).round(4).alias("allocation_percent")
+        )
+        .sort(["politician", "net_usd", "ticker"], descending=[False, True, False])
+        .collect()
+    )
+
+
+def apply_to_trackers(session: Session, stats: pl.DataFrame, holdings: pl.DataFrame, report: PtrReport) -> pl.DataFrame:
+    """
+    Writes the mean delay and net holdings of every politician tracker that
+    matches a filer. Runs in the caller's transaction. Returns the matched
+    trackers (tracker_id, name) with their delay stats.
+    """
+    rows = session.exec(select(Tracker.id, Tracker.name).where(Tracker.type == "politician")).all()
+    trackers = pl.DataFrame(rows, schema={"tracker_id": pl.Int64, "name": pl.String}, orient="row")
+    trackers = trackers.with_columns(_name_key(pl.col("name")).alias("key"))
+
+    matched = trackers.join(stats.with_columns(_name_key(pl.col("politician")).alias("key")), on="key", how="inner")
+    report.trackers_updated = matched["name"].to_list()
+    report.unmatched_trackers = trackers.filter(~pl.col("key").is_in(matched["key"].implode()))["name"].to_list()
+    if matched.is_empty():
+        return matched
+
+    session.exec(update(Tracker), params=matched.select(
+        pl.col("tracker_id").alias("id"),
+        pl.col("mean_delay").round(0).cast(pl.Int64).alias("average_delay")
+    ).to_dicts())
+
+    new_holdings = (
+        matched.select("tracker_id", "politician")
+        .join(holdings, on="politician", how="inner")
+        .select("tracker_id", "ticker", pl.col("company_name").fill_null(""), "allocation_percent")
+    )
+    if new_holdings.is_empty():
+        return matched
+    # Trackers without any open position keep their current holdings
+    tracker_ids = new_holdings["tracker_id"].unique().to_list()
+    session.exec(delete(TrackerHolding).where(TrackerHolding.tracker_id.in_(tracker_ids)))
+    session.exec(insert(TrackerHolding), params=new_holdings.to_dicts())
+    report.holdings_written = new_holdings.height
+
+    periods = dict(matched.select("tracker_id", "last_disclosure").iter_rows())
+    for (tracker_id,), tracker_holdings in new_holdings.partition_by("tracker_id", as_dict=True).items():
+        holding_history_service.record_snapshot(tracker_id, periods[tracker_id], tracker_holdings.to_dicts(), session)
+    return matched
+
+
+def ingest(paths: List[str], session: Session) -> Tuple[PtrReport, pl.DataFrame]:
+    """
+    Loads the given dumps, then recomputes every politician's stats and
+    holdings from the full trade history. Returns the report and the delay
+    stats of the trackers that were updated. The caller commits.
+    """
+    report = PtrReport(files=len(paths))
+    for path in paths:
+        trades = read_ptr_file(path)
+        report.trades_read += trades.height
+        report.trades_loaded += load_trades(trades, session)
+
+    history = trades_frame(session)
+    stats = delay_stats(history)
+    report.politicians = stats.height
+    return report, apply_to_trackers(session, stats, net_holdings(history), report)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load Stock Act PTR dumps and refresh politician trackers")
+    parser.add_argument("paths", nargs="*", help="House/Senate transaction dumps (.csv or .json)")
+    args = parser.parse_args(argv)
+
+    with Session(engine) as session:
+        report, updated = ingest(args.paths, session)
+        session.commit()
+
+    print(f"Loaded {report.trades_loaded} new of {report.trades_read} trades from {report.files} files")
+    print(f"Computed delays for {report.politicians} politicians")
+    for row in updated.iter_rows(named=True):
+        print(
+            f"  {row['name']}: {row['trades']} trades, delay mean={row['mean_delay']:.1f} "
+            f"median={row['median_delay']:.1f} p90={row['p90_delay']:.1f} days"
+        )
+    print(f"Updated {len(report.trackers_updated)} trackers, wrote {report.holdings_written} holdings")
+    if report.unmatched_trackers:
+        print(f"  no filings found for: {', '.join(report.unmatched_trackers)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
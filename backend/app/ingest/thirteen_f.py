@@ -0,0 +1,216 @@
+"""
+SEC 13F Information Table Ingestion
+
+Loads a fund's holdings from a 13F-HR information table XML file into
+TrackerHolding for the matching Tracker.
+
+The file is stream-parsed with iterparse and every <infoTable> element is
+discarded once read, so memory stays flat even for filings with tens of
+thousands of rows. Rows are aggregated per ticker (a position is often split
+across several rows by manager or voting authority) and the tracker's holdings
+are replaced with a single bulk DELETE + INSERT in one transaction. The same
+holdings are recorded as the tracker's snapshot for the filing period (the
+quarter end the 13F reports on), which refreshes the precomputed diff against
+the previous filing. Backfilling a filing older than the tracker's latest
+snapshot only records the snapshot: the current holdings are left alone.
+
+13F filings identify securities by CUSIP, not ticker. CUSIPs are mapped with
+seed_data/cusip_tickers.csv (or --cusip-map); unmapped positions are skipped
+and reported, and allocations are computed over the mapped positions. Option
+rows (putCall) and principal amounts (sshPrnamtType PRN, i.e. bonds) are
+skipped too: followers can only buy the shares.
+
+How to run:
+    python -m app.ingest.thirteen_f path/to/infotable.xml --tracker "Warren Buffett" --period 2025-09-30
+"""
+import argparse
+import csv
+import os
+import sys
+import xml.etree.ElementTree as ET
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy import delete, insert
+from sqlmodel import Session, select
+from app.core.db import engine
+from app.models import Tracker, TrackerHolding
+from app.services.holding_history_service import holding_history_service
+
+DEFAULT_CUSIP_MAP = os.path.join(os.path.dirname(__file__), "..", "seed_data", "cusip_tickers.csv")
+
+
+@dataclass
+class InfoTableRow:
+    """One <infoTable> entry of a 13F information table."""
+    cusip: str
+    issuer: str
+    value: float
+    shares: float
+    share_type: str
+    put_call: Optional[str]
+
+
+@dataclass
+class IngestReport:
+    tracker_id: int
+    rows: int = 0
+    skipped_options: int = 0
+    skipped_principal: int = 0
+    holdings: int = 0
+    current: bool = True  # False when an older filing was only recorded as a snapshot
+    unmapped: Counter = field(default_factory=Counter)  # cusip -> value skipped
+
+
+def last_quarter_end(today: date) -> date:
+    """The most recent calendar quarter end strictly before `today`."""
+    quarter_start = date(today.year, 3 * ((today.month - 1) // 3) + 1, 1)
+    previous_month = quarter_start.month - 1 or 12
+    year = quarter_start.year - (quarter_start.month == 1)
+    return date(year, previous_month, 31 if previous_month in (3, 12) else 30)
+
+
+def _local(tag: str) -> str:
+    """Tag name without its XML namespace."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child_text(elem: ET.Element, *path: str) -> Optional[str]:
+    """Text of the first descendant matching the namespace-less `path`."""
+    for name in path:
+        elem = next((child for child in elem if _local(child.tag) == name), None)
+        if elem is None:
+            return None
+    return (elem.text or "").strip()
+
+
+def iter_info_table(path: str) -> Iterator[InfoTableRow]:
+    """
+    Streams the rows of an information table. Works with or without the
+    SEC namespace; each row element is cleared as soon as it's read.
+    """
+    context = ET.iterparse(path, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end" or _local(elem.tag) != "infoTable":
+            continue
+        yield InfoTableRow(
+            cusip=(_child_text(elem, "cusip") or "").upper(),
+            issuer=_child_text(elem, "nameOfIssuer") or "",
+            value=float(_child_text(elem, "value") or 0),
+            shares=float(_child_text(elem, "shrsOrPrnAmt", "sshPrnamt") or 0),
+            share_type=(_child_text(elem, "shrsOrPrnAmt", "sshPrnamtType") or "SH").upper(),
+            put_call=_child_text(elem, "putCall") or None,
+        )
+        # Drop the parsed row (and the root's reference to it) to keep memory flat
+        elem.clear()
+        root.clear()
+
+
+def load_cusip_map(path: str = DEFAULT_CUSIP_MAP) -> Dict[str, str]:
+    """Reads a cusip,ticker CSV into {CUSIP: ticker}."""
+    with open(path, newline="") as f:
+        return {row["cusip"].strip().upper(): row["ticker"].strip().upper() for row in csv.DictReader(f)}
+
+
+def aggregate_holdings(rows: Iterator[InfoTableRow], cusip_map: Dict[str, str], report: IngestReport) -> List[Dict]:
+    """
+    Sums market value per ticker and turns it into allocation percentages.
+    Returns TrackerHolding column dicts (without tracker_id), largest first.
+    """
+    values: Dict[str, float] = {}
+    names: Dict[str, str] = {}
+    for row in rows:
+        report.rows += 1
+        if row.put_call:
+            report.skipped_options += 1
+            continue
+        if row.share_type != "SH":
+            report.skipped_principal += 1
+            continue
+        ticker = cusip_map.get(row.cusip)
+        if ticker is None:
+            report.unmapped[row.cusip] += row.value
+            continue
+        values[ticker] = values.get(ticker, 0.0) + row.value
+        names.setdefault(ticker, row.issuer)
+
+    total = sum(values.values())
+    if total <= 0:
+        return []
+    return [
+        {"ticker": ticker, "company_name": names[ticker], "allocation_percent": round(value / total * 100, 4)}
+        for ticker, value in sorted(values.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+
+def ingest_filing(
+    path: str,
+    tracker: Tracker,
+    session: Session,
+    cusip_map: Optional[Dict[str, str]] = None,
+    period: Optional[date] = None
+) -> IngestReport:
+    """
+    Records the positions in the 13F file as the tracker's snapshot for
+    `period` (default: the last quarter end) and, unless the tracker already
+    has a later snapshot, replaces its holdings with them. Everything runs in
+    the caller's transaction.
+    """
+    report = IngestReport(tracker_id=tracker.id)
+    holdings = aggregate_holdings(iter_info_table(path), cusip_map or load_cusip_map(), report)
+    period = period or last_quarter_end(date.today())
+
+    periods = holding_history_service.get_periods(tracker.id, session)
+    report.current = not periods or period >= periods[0]
+    if report.current:
+        session.exec(delete(TrackerHolding).where(TrackerHolding.tracker_id == tracker.id))
+        if holdings:
+            session.exec(insert(TrackerHolding), params=[{**holding, "tracker_id": tracker.id} for holding in holdings])
+    holding_history_service.record_snapshot(tracker.id, period, holdings, session)
+    report.holdings = len(holdings)
+    return report
+
+
+def find_tracker(session: Session, tracker_id: Optional[int], name: Optional[str]) -> Optional[Tracker]:
+    if tracker_id is not None:
+        return session.get(Tracker, tracker_id)
+    return session.exec(select(Tracker).where(Tracker.name == name)).first()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load a 13F information table into a tracker's holdings")
+    parser.add_argument("path", help="13F-HR information table XML file")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--tracker", help="tracker name, e.g. 'Warren Buffett'")
+    target.add_argument("--tracker-id", type=int)
+    parser.add_argument("--cusip-map", default=DEFAULT_CUSIP_MAP, help="cusip,ticker CSV")
+    parser.add_argument(
+        "--period", type=date.fromisoformat, help="period of report, YYYY-MM-DD (default: last quarter end)"
+    )
+    args = parser.parse_args(argv)
+
+    with Session(engine) as session:
+        tracker = find_tracker(session, args.tracker_id, args.tracker)
+        if tracker is None:
+            print(f"Tracker not found: {args.tracker or args.tracker_id}")
+            return 1
+
+        tracker_name = tracker.name
+        report = ingest_filing(args.path, tracker, session, load_cusip_map(args.cusip_map), args.period)
+        session.commit()
+
+    print(f"Loaded {report.holdings} holdings for {tracker_name} from {report.rows} rows")
+    if not report.current:
+        print("  older than the latest snapshot: recorded as history, current holdings kept")
+    print(f"  skipped: {report.skipped_options} option rows, {report.skipped_principal} principal-amount rows")
+    if report.unmapped:
+        print(f"  {len(report.unmapped)} unmapped CUSIPs (add them to the CUSIP map):")
+        for cusip, value in report.unmapped.most_common(10):
+            print(f"    {cusip} value={value:,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
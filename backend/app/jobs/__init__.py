@@ -0,0 +1,3 @@
+"""
+Batch jobs, run from the command line with `python -m app.jobs.<name>`.
+"""
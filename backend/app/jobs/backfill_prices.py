@@ -0,0 +1,91 @@
+"""
+Price History Backfill
+
+Loads daily closes into the local Parquet price store (one file per ticker
+under PRICE_STORE_DIR). Re-running is safe: rows are merged by date and the
+newest value wins.
+
+Accepted CSV layouts:
+- yfinance / Yahoo exports: Date, ..., Close[, Adj Close] (Adj Close is
+  preferred); the ticker comes from --ticker or the file name (AAPL.csv);
+- long files with date, ticker and close columns, any number of tickers.
+
+How to run:
+    python -m app.jobs.backfill_prices exports/AAPL.csv exports/MSFT.csv
+    python -m app.jobs.backfill_prices closes.csv                       # date,ticker,close
+    python -m app.jobs.backfill_prices --yfinance AAPL MSFT --start 2020-01-01
+"""
+import argparse
+import os
+import sys
+from datetime import date
+from typing import Dict, List, Optional
+import polars as pl
+from app.services.price_store import price_store
+
+
+def read_csv(path: str, ticker: Optional[str] = None) -> Dict[str, pl.DataFrame]:
+    """{ticker: (date, close) frame} from one CSV export."""
+    frame = pl.read_csv(path, infer_schema_length=0)
+    columns = {name.strip().lower(): name for name in frame.columns}
+    if "date" not in columns:
+        raise ValueError(f"{path}: no Date column")
+    close = columns.get("adj close") or columns.get("close")
+    if close is None:
+        raise ValueError(f"{path}: no Close or Adj Close column")
+
+    frame = frame.select(
+        pl.col(columns["date"]).str.slice(0, 10).str.to_date(strict=False).alias("date"),
+        pl.col(close).cast(pl.Float64, strict=False).alias("close"),
+        *([pl.col(columns["ticker"]).str.strip_chars().str.to_uppercase().alias("ticker")] if "ticker" in columns else [])
+    ).drop_nulls(["date", "close"])
+
+    if "ticker" in frame.columns and ticker is None:
+        return {key[0]: group.drop("ticker") for key, group in frame.group_by("ticker")}
+    ticker = ticker or os.path.splitext(os.path.basename(path))[0]
+    return {ticker.upper(): frame.select("date", "close")}
+
+
+def download(tickers: List[str], start: date) -> Dict[str, pl.DataFrame]:
+    """Adjusted daily closes from Yahoo Finance (needs network and yfinance)."""
+    import yfinance as yf
+
+    history = yf.download(tickers, start=start.isoformat(), auto_adjust=True, progress=False, group_by="column")
+    closes = history["Close"]
+    frames = {}
+    for ticker in tickers:
+        series = closes[ticker] if ticker in getattr(closes, "columns", []) else closes
+        series = series.dropna()
+        frames[ticker.upper()] = pl.DataFrame({
+            "date": [timestamp.date() for timestamp in series.index],
+            "close": series.to_numpy(dtype=float),
+        })
+    return frames
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Backfill the local Parquet price store")
+    parser.add_argument("paths", nargs="*", help="CSV exports to import")
+    parser.add_argument("--ticker", help="ticker for single-ticker CSVs (default: the file name)")
+    parser.add_argument("--yfinance", nargs="+", metavar="TICKER", help="download these tickers instead")
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2015, 1, 1), help="first day to download")
+    args = parser.parse_args(argv)
+    if not args.paths and not args.yfinance:
+        parser.error("give CSV paths or --yfinance TICKER ...")
+
+    frames: Dict[str, pl.DataFrame] = {}
+    for path in args.paths:
+        for ticker, frame in read_csv(path, args.ticker).items():
+            frames[ticker] = pl.concat([frames[ticker], frame]) if ticker in frames else frame
+    if args.yfinance:
+        frames.update(download(args.yfinance, args.start))
+
+    for ticker, frame in sorted(frames.items()):
+        stored = price_store.write(ticker, frame)
+        print(f"{ticker}: +{frame.height} rows, {stored} stored")
+    print(f"Backfilled {len(frames)} tickers into {price_store.root}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
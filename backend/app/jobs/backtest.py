@@ -0,0 +1,47 @@
+"""
+Tracker Backtest
+
+Replays every tracker's holdings snapshots over the local price store (see
+app.jobs.backfill_prices) as a follower would have copied them, writes the
+daily series to the returns store and updates each tracker's ytd_return.
+Meant to run nightly, after the day's prices are backfilled. API processes
+drop their cached catalog when they see the returns store replaced, so the new
+ytd_return values show up without waiting for CATALOG_CACHE_TTL_SECONDS.
+
+How to run:
+    python -m app.jobs.backtest
+    python -m app.jobs.backtest --end 2025-11-21 --years 5
+"""
+import argparse
+import sys
+from datetime import date
+from sqlmodel import Session
+from app.core.config import settings
+from app.core.db import engine
+from app.services.backtest_service import backtest_service
+from app.services.returns_store import returns_store
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Backtest every tracker and refresh ytd_return")
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today(), help="last day, YYYY-MM-DD")
+    parser.add_argument("--years", type=int, default=settings.BACKTEST_YEARS, help="years of history to replay")
+    args = parser.parse_args(argv)
+
+    with Session(engine) as session:
+        report = backtest_service.run(session, args.end, args.years)
+
+    if report.missing_tickers:
+        print(f"No prices for {len(report.missing_tickers)} tickers: {', '.join(report.missing_tickers)}")
+    if not report.trackers:
+        print("Nothing backtested: no prices in the window")
+        return 1
+    print(
+        f"Backtested {report.trackers} trackers ({report.switches} allocation switches) over "
+        f"{report.days} trading days in {report.elapsed_seconds:.2f}s -> {returns_store.path}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
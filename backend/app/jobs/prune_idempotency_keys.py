@@ -0,0 +1,43 @@
+"""
+Idempotency Key Retention
+
+Deletes IdempotencyKey rows first used more than IDEMPOTENCY_RETENTION_HOURS
+ago, so the table only holds keys clients may still retry. Meant to run daily.
+
+How to run:
+    python -m app.jobs.prune_idempotency_keys                   # keep IDEMPOTENCY_RETENTION_HOURS
+    python -m app.jobs.prune_idempotency_keys --older-than 48   # hours
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.config import settings
+from app.core.db import async_engine
+from app.services.idempotency_service import idempotency_service
+
+
+async def prune(older_than: datetime) -> int:
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            return await idempotency_service.prune(older_than, session)
+    finally:
+        await async_engine.dispose()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Delete expired Idempotency-Key records")
+    parser.add_argument(
+        "--older-than", type=float, default=settings.IDEMPOTENCY_RETENTION_HOURS,
+        help="retention in hours (default: IDEMPOTENCY_RETENTION_HOURS)"
+    )
+    args = parser.parse_args(argv)
+    
+    pruned = asyncio.run(prune(datetime.utcnow() - timedelta(hours=args.older_than)))
+    print(f"Deleted {pruned} idempotency keys older than {args.older_than:g} hours")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
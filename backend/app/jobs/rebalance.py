@@ -0,0 +1,57 @@
+"""
+Follower Rebalancing
+
+Moves every follower of a tracker from its previous holdings snapshot to the
+latest one, sending one netted order per ticker to the broker and writing
+each follower's share of the fills to its positions and transactions. Run it
+after ingesting a filing that changed the tracker's holdings; running it
+again once the followers hold the latest allocation sends nothing.
+
+How to run:
+    python -m app.jobs.rebalance --tracker-id 1             # plan and execute
+    python -m app.jobs.rebalance --tracker-id 1 --dry-run   # only print the plan
+"""
+import argparse
+import asyncio
+import sys
+import time
+from sqlmodel import Session
+from app.core.db import engine
+from app.services.broker_service import broker_service
+from app.services.rebalance_service import rebalance_service
+
+
+async def execute(plan, session):
+    try:
+        return await rebalance_service.execute(plan, session)
+    finally:
+        await broker_service.aclose()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Rebalance a tracker's followers to its latest holdings")
+    parser.add_argument("--tracker-id", type=int, required=True)
+    parser.add_argument("--dry-run", action="store_true", help="print the netted trades without sending them")
+    args = parser.parse_args(argv)
+    
+    started = time.perf_counter()
+    with Session(engine) as session:
+        plan = rebalance_service.plan_latest_change(args.tracker_id, session)
+        if plan is None:
+            print(f"Tracker {args.tracker_id} has fewer than two holdings snapshots; nothing to rebalance")
+            return 0
+        
+        print(f"Planned {plan.followers} followers in {time.perf_counter() - started:.2f}s")
+        for ticker, net, gross in zip(plan.tickers, plan.net_clp, plan.gross_clp):
+            print(f"  {ticker}: net {net:,.0f} CLP (gross {gross:,.0f})")
+        if args.dry_run:
+            return 0
+        
+        result = asyncio.run(execute(plan, session))
+    failed = [fill for fill in result.fills if not fill.get("success")]
+    print(f"Sent {len(result.orders)} netted orders, {len(failed)} failed; recorded trades for {result.recorded} followers")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
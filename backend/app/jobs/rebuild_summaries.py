@@ -0,0 +1,51 @@
+"""
+Portfolio Summary Rebuild
+
+Recomputes every user's PortfolioSummary from User and PortfolioItem in bulk
+and reports drift between the stored and recomputed totals.
+
+How to run:
+    python -m app.jobs.rebuild_summaries            # report drift, then rebuild
+    python -m app.jobs.rebuild_summaries --verify   # only report drift
+
+Exits with status 1 in --verify mode when drift is found, so it can run as a
+scheduled consistency check.
+"""
+import argparse
+import sys
+from sqlmodel import Session
+from app.core.db import engine
+from app.services.summary_service import summary_service
+
+
+def report(drift) -> None:
+    for row in drift:
+        if row["stored_tracker_count"] is None:
+            print(f"  user {row['user_id']}: missing summary")
+            continue
+        for field in ("available_balance_clp", "total_invested_clp", "total_current_value_clp", "tracker_count"):
+            if row[field] != row[f"stored_{field}"]:
+                print(f"  user {row['user_id']}: {field} stored={row[f'stored_{field}']} expected={row[field]}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild or verify portfolio summaries")
+    parser.add_argument("--verify", action="store_true", help="only report drift, don't rebuild")
+    args = parser.parse_args(argv)
+    
+    with Session(engine) as session:
+        drift = summary_service.find_drift(session)
+        print(f"{len(drift)} summaries drifted")
+        report(drift)
+        
+        if args.verify:
+            return 1 if drift else 0
+        
+        rebuilt = summary_service.rebuild(session)
+        session.commit()
+        print(f"Rebuilt {rebuilt} summaries")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Mark-to-Market Valuation
+
+Stores the day's closing prices as a PriceSnapshot, then reprices every
+Position and rolls the values up into PortfolioItem and PortfolioSummary
+with chunked, set-based UPDATE ... FROM statements. Meant to run once after
+the market close.
+
+How to run:
+    python -m app.jobs.revalue --prices closes.csv --as-of 2025-11-21   # ticker,close_usd CSV
+    python -m app.jobs.revalue                                          # today's broker quotes
+"""
+import argparse
+import asyncio
+import csv
+import sys
+from datetime import date
+from typing import Dict, List
+from sqlmodel import Session
+from app.core.db import engine
+from app.services.broker_service import broker_service
+from app.services.valuation_service import valuation_service
+
+
+def read_prices(path: str) -> Dict[str, float]:
+    with open(path, newline="") as f:
+        return {row["ticker"].strip().upper(): float(row["close_usd"]) for row in csv.DictReader(f)}
+
+
+async def fetch_prices(tickers: List[str]) -> Dict[str, float]:
+    try:
+        return await broker_service.get_current_prices(tickers)
+    finally:
+        await broker_service.aclose()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reprice every position and roll up portfolio values")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=date.today(), help="trading day, YYYY-MM-DD")
+    parser.add_argument("--prices", help="ticker,close_usd CSV (default: current broker quotes)")
+    args = parser.parse_args(argv)
+    
+    with Session(engine) as session:
+        if args.prices:
+            prices = read_prices(args.prices)
+        else:
+            prices = asyncio.run(fetch_prices(valuation_service.position_tickers(session)))
+        stored = valuation_service.store_prices(args.as_of, prices, session)
+        session.commit()
+        print(f"Stored {stored} prices for {args.as_of.isoformat()}")
+        
+        report = valuation_service.revalue(args.as_of, session)
+    
+    print(
+        f"Repriced {report.positions} positions, {report.portfolio_items} portfolio items "
+        f"and {report.summaries} summaries in {report.elapsed_seconds:.2f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,28 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-import app.seed
-from app.api import trackers, invest, portfolio, auth, chart, user, transactions
+from app.api import trackers, invest, portfolio, auth, chart, prices, user, transactions, metrics
+from app.services import broker_service
+from app.services.order_worker import order_worker_pool
 
-app.seed.main()
 
-app = FastAPI(title=settings.PROJECT_NAME, version="0.1.0")
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Schema creation and seeding are opt-in so new workers boot without touching the database
+    if settings.SEED_ON_STARTUP:
+        from app.seed import main as seed_database
+        await asyncio.to_thread(seed_database)
+    # Drain queued investments in-process (ORDER_WORKERS=0 leaves it to app.worker)
+    order_worker_pool.start()
+    yield
+    await order_worker_pool.stop()
+    # Close the pooled broker connections (no-op for the mock broker)
+    await broker_service.aclose()
+
+
+app = FastAPI(title=settings.PROJECT_NAME, version="0.1.0", lifespan=lifespan)
 
 # CORS middleware to allow frontend requests
 app.add_middleware(
@@ -15,6 +31,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 # Include routers
@@ -23,8 +40,10 @@ app.include_router(trackers.router, prefix=settings.API_V1_STR)
 app.include_router(invest.router, prefix=settings.API_V1_STR)
 app.include_router(portfolio.router, prefix=settings.API_V1_STR)
 app.include_router(chart.router, prefix=settings.API_V1_STR)
+app.include_router(prices.router, prefix=settings.API_V1_STR)
 app.include_router(user.router, prefix=settings.API_V1_STR)
 app.include_router(transactions.router, prefix=settings.API_V1_STR)
+app.include_router(metrics.router, prefix=settings.API_V1_STR)
 
 
 @app.get("/")
@@ -1,5 +1,9 @@
 from .user import User
-from .tracker import Tracker, TrackerHolding
-from .portfolio import PortfolioItem, Transaction
+from .tracker import Tracker, TrackerHolding, HoldingSnapshot, HoldingChange
+from .portfolio import PortfolioItem, Transaction, PortfolioSummary
+from .idempotency import IdempotencyKey
+from .order import InvestmentOrder
+from .trade import PoliticianTrade
+from .position import Position, PriceSnapshot
 
-__all__ = ["User", "Tracker", "TrackerHolding", "PortfolioItem", "Transaction"]
+__all__ = ["User", "Tracker", "TrackerHolding", "HoldingSnapshot", "HoldingChange", "PortfolioItem", "Transaction", "PortfolioSummary", "IdempotencyKey", "InvestmentOrder", "PoliticianTrade", "Position", "PriceSnapshot"]
@@ -0,0 +1,18 @@
+from typing import Optional
+from datetime import datetime
+from sqlmodel import Field, SQLModel
+
+class IdempotencyKey(SQLModel, table=True):
+    """
+    Outcome of a request sent with an Idempotency-Key header.
+    Retries with the same key replay the stored response instead of running again.
+    """
+    scope: str = Field(primary_key=True, description="Operation the key was used for (e.g. 'invest', 'user:1:deposit')")
+    key: str = Field(primary_key=True, description="Client-supplied Idempotency-Key header value")
+    
+    request_hash: str = Field(description="SHA-256 of the request body, to reject key reuse with a different payload")
+    status: str = Field(default="in_progress", description="'in_progress' while the first request runs, 'applied' once it has committed changes, then 'completed'")
+    response_status: Optional[int] = Field(default=None, description="HTTP status code of the stored response")
+    response_body: Optional[str] = Field(default=None, description="JSON body of the stored response")
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True, description="UTC timestamp of the first request")
+    claimed_at: datetime = Field(default_factory=datetime.utcnow, description="UTC timestamp of the current claim; an 'in_progress' claim older than IDEMPOTENCY_LEASE_SECONDS is taken over")
@@ -0,0 +1,28 @@
+from typing import Optional
+from datetime import datetime
+from sqlmodel import Field, SQLModel, Index
+
+class InvestmentOrder(SQLModel, table=True):
+    """
+    An investment queued for asynchronous execution by the order workers.
+    Lifecycle: 'queued' -> 'submitted' -> 'filled' | 'failed' | 'expired'.
+    Funds are debited when the order is queued and refunded if it fails or its
+    lease expires. An 'expired' order whose worker finishes late still becomes
+    'filled', and its invested amount is debited again.
+    """
+    __table_args__ = (
+        # Workers claim the oldest queued orders first
+        Index("ix_investmentorder_status_id", "status", "id"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id", description="The investor")
+    tracker_id: Optional[int] = Field(default=None, foreign_key="tracker.id", description="The strategy being followed")
+    
+    amount_clp: float = Field(description="Amount to invest in CLP (already debited from the user)")
+    status: str = Field(default="queued", description="'queued', 'submitted', 'filled', 'failed' or 'expired'")
+    error: Optional[str] = Field(default=None, description="Failure reason when status is 'failed' or 'expired'")
+    result: Optional[str] = Field(default=None, description="JSON execution result (fills, portfolio item) once filled")
+    
+    created_at: datetime = Field(default_factory=datetime.utcnow, description="UTC timestamp when the order was queued")
+    updated_at: datetime = Field(default_factory=datetime.utcnow, description="UTC timestamp of the last status change")
@@ -1,6 +1,6 @@
 from typing import Optional
 from datetime import datetime
-from sqlmodel import Field, SQLModel, Relationship
+from sqlmodel import Field, SQLModel, Relationship, Index
 # Forward references to avoid circular imports if needed, though here we import for type hints
 # Note: In SQLModel, string forward references in Relationship are often safer.
 from .user import User
@@ -11,6 +11,13 @@ class PortfolioItem(SQLModel, table=True):
     Represents a user's active investment in a specific Tracker.
     Tracks how much was invested and its current simulated value.
     """
+    __table_args__ = (
+        # Rebalancing walks a tracker's followers in id order
+        Index("ix_portfolioitem_tracker_id_id", "tracker_id", "id"),
+        # One item per (user, tracker): investments upsert into it
+        Index("ix_portfolioitem_user_id_tracker_id", "user_id", "tracker_id", unique=True),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: Optional[int] = Field(default=None, foreign_key="user.id", description="The investor")
     tracker_id: Optional[int] = Field(default=None, foreign_key="tracker.id", description="The strategy being followed")
@@ -38,3 +45,19 @@ class Transaction(SQLModel, table=True):
     # Relationships
     user: Optional[User] = Relationship(back_populates="transactions")
     tracker: Optional[Tracker] = Relationship(back_populates="transactions")
+
+class PortfolioSummary(SQLModel, table=True):
+    """
+    Per-user read model of the portfolio totals, kept up to date in the same
+    transaction as every balance change, investment and revaluation so
+    /portfolio can serve totals with a primary-key lookup.
+    Rebuild or verify it with `python -m app.jobs.rebuild_summaries`.
+    """
+    user_id: int = Field(foreign_key="user.id", primary_key=True, description="The investor")
+    
+    available_balance_clp: float = Field(default=0.0, description="Mirror of User.balance_clp")
+    total_invested_clp: float = Field(default=0.0, description="Sum of invested_amount_clp over the user's portfolio items")
+    total_current_value_clp: float = Field(default=0.0, description="Sum of current_value_clp over the user's portfolio items")
+    tracker_count: int = Field(default=0, description="Number of trackers the user follows")
+    
+    updated_at: datetime = Field(default_factory=datetime.utcnow, description="UTC timestamp of the last change")
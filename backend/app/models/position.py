@@ -0,0 +1,37 @@
+from typing import Optional
+from datetime import date, datetime
+from sqlmodel import Field, SQLModel, Index
+
+class Position(SQLModel, table=True):
+    """
+    Shares of one ticker held for a user through one PortfolioItem, built up
+    from broker fills. The valuation job reprices market_value_clp from a
+    PriceSnapshot and rolls the totals up into PortfolioItem.current_value_clp.
+    """
+    __table_args__ = (
+        Index("ix_position_portfolio_item_id_ticker", "portfolio_item_id", "ticker", unique=True),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    portfolio_item_id: int = Field(foreign_key="portfolioitem.id", description="The investment the shares belong to")
+    user_id: int = Field(foreign_key="user.id", description="The investor")
+    
+    ticker: str = Field(description="Stock ticker symbol (e.g., 'NVDA')")
+    shares: float = Field(default=0.0, description="Shares held (fractional)")
+    cost_basis_clp: float = Field(default=0.0, description="Total CLP paid for the shares")
+    market_value_clp: float = Field(default=0.0, description="Value at the last valuation (cost basis until then)")
+    
+    updated_at: datetime = Field(default_factory=datetime.utcnow, description="UTC timestamp of the last fill or valuation")
+
+class PriceSnapshot(SQLModel, table=True):
+    """
+    Closing price of a ticker on a given day, used to value positions.
+    """
+    __table_args__ = (
+        Index("ix_pricesnapshot_as_of_ticker", "as_of", "ticker", unique=True),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    as_of: date = Field(description="Trading day the price is for")
+    ticker: str = Field(description="Stock ticker symbol")
+    close_usd: float = Field(description="Closing price in USD")
@@ -1,10 +1,35 @@
 from typing import Optional, List
-from sqlmodel import Field, SQLModel, Relationship
+from datetime import date
+from sqlmodel import Field, SQLModel, Relationship, Index
+
+# Marketplace sort keys and the filter combinations GET /trackers/ supports
+TRACKER_SORT_FIELDS = ("ytd_return", "followers_count", "average_delay")
+TRACKER_FILTER_FIELDS = ((), ("type",), ("risk_level",), ("type", "risk_level"))
+
+
+def _marketplace_indexes():
+    """
+    One composite index per (filters, sort key) combination: equality filter
+    columns first, then the sort key and id, so every filtered + sorted page is
+    an index range scan that also serves the keyset cursor. Sorting by id
+    alone uses the primary key.
+    """
+    indexes = []
+    for filters in TRACKER_FILTER_FIELDS:
+        for sort_field in TRACKER_SORT_FIELDS + ("id",):
+            if not filters and sort_field == "id":
+                continue
+            columns = (*filters, sort_field) if sort_field == "id" else (*filters, sort_field, "id")
+            indexes.append(Index(f"ix_tracker_{'_'.join(columns)}", *columns))
+    return tuple(indexes)
+
 
 class Tracker(SQLModel, table=True):
     """
     Represents a 'Whale' entity (Hedge Fund or Politician) that users can copy-trade.
     """
+    __table_args__ = _marketplace_indexes()
+    
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(description="Name of the fund or politician (e.g., 'Nancy Pelosi')")
     type: str = Field(description="Type of entity: 'fund' or 'politician'")
@@ -26,7 +51,7 @@ class TrackerHolding(SQLModel, table=True):
     Defines the composition of the strategy (e.g., 40% NVDA).
     """
     id: Optional[int] = Field(default=None, primary_key=True)
-    tracker_id: Optional[int] = Field(default=None, foreign_key="tracker.id", description="ID of the parent Tracker")
+    tracker_id: Optional[int] = Field(default=None, foreign_key="tracker.id", index=True, description="ID of the parent Tracker")
     
     ticker: str = Field(description="Stock ticker symbol (e.g., 'NVDA')")
     company_name: str = Field(description="Full company name")
@@ -34,3 +59,38 @@ class TrackerHolding(SQLModel, table=True):
     
     # Relationships
     tracker: Optional[Tracker] = Relationship(back_populates="holdings")
+
+
+class HoldingSnapshot(SQLModel, table=True):
+    """
+    A tracker's holdings as of one filing period (e.g. a 13F quarter end).
+    TrackerHolding is the current composition; snapshots keep the history.
+    """
+    __table_args__ = (
+        Index("ix_holdingsnapshot_tracker_id_period_ticker", "tracker_id", "period", "ticker", unique=True),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tracker_id: int = Field(foreign_key="tracker.id", description="ID of the Tracker")
+    period: date = Field(description="Filing period the composition belongs to")
+    
+    ticker: str = Field(description="Stock ticker symbol (e.g., 'NVDA')")
+    company_name: str = Field(description="Full company name")
+    allocation_percent: float = Field(description="Allocation percentage in this period (0-100)")
+
+class HoldingChange(SQLModel, table=True):
+    """
+    One line of the precomputed diff between a tracker's latest snapshot and
+    the one before it, refreshed whenever a snapshot is recorded.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tracker_id: int = Field(foreign_key="tracker.id", index=True, description="ID of the Tracker")
+    period: date = Field(description="Latest period")
+    previous_period: Optional[date] = Field(default=None, description="Period compared against (None for the first snapshot)")
+    
+    ticker: str = Field(description="Stock ticker symbol")
+    company_name: str = Field(description="Full company name")
+    change: str = Field(description="'added', 'removed' or 'reweighted'")
+    previous_percent: float = Field(description="Allocation in the previous period (0 if added)")
+    allocation_percent: float = Field(description="Allocation in the latest period (0 if removed)")
+    delta_percent: float = Field(description="allocation_percent - previous_percent")
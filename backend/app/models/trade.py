@@ -0,0 +1,24 @@
+from typing import Optional
+from datetime import date
+from sqlmodel import Field, SQLModel
+
+class PoliticianTrade(SQLModel, table=True):
+    """
+    A single transaction disclosed in a member of Congress' periodic
+    transaction report (PTR) under the Stock Act.
+    Loaded from House/Senate disclosure dumps by app.ingest.ptr.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    trade_key: str = Field(unique=True, description="Natural key of the normalized row; re-loading a dump skips known trades")
+    
+    politician: str = Field(description="Member's name as disclosed, without honorifics (e.g., 'Nancy Pelosi')")
+    chamber: str = Field(description="'house' or 'senate'")
+    owner: Optional[str] = Field(default=None, description="Account owner: 'self', 'spouse', 'joint', 'dependent'")
+    ticker: Optional[str] = Field(default=None, description="Stock ticker symbol, if the asset has one")
+    asset_description: str = Field(default="", description="Asset as described in the filing")
+    transaction_type: str = Field(description="'purchase', 'sale_full', 'sale_partial' or 'exchange'")
+    
+    transaction_date: date = Field(description="Date the trade was executed")
+    disclosure_date: date = Field(description="Date the trade was reported")
+    amount_min_usd: float = Field(default=0.0, description="Lower bound of the disclosed amount range")
+    amount_max_usd: float = Field(default=0.0, description="Upper bound of the disclosed amount range")
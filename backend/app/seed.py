@@ -15,6 +15,7 @@ When to use:
 
 How to run:
     python -m app.seed
+or set SEED_ON_STARTUP=true to run it when the API starts (docker-compose does).
 
 What it does:
 1. Creates all database tables (if they don't exist)
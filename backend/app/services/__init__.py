@@ -1,11 +1,52 @@
+import importlib
 from .broker_service import broker_service
+from .summary_service import summary_service, async_summary_service
+from .balance_service import balance_service, async_balance_service
+from .holding_history_service import holding_history_service
 from .tracker_service import tracker_service
-from .investment_service import investment_service
-from .portfolio_service import portfolio_service
+from .position_service import position_service, async_position_service
+from .investment_service import investment_service, async_investment_service
+from .portfolio_service import portfolio_service, async_portfolio_service
+from .valuation_service import valuation_service
+from .transaction_service import transaction_service, async_transaction_service
+
+# Analytics services pull in numpy, polars and altair. They are imported on
+# first access so the API process starts without them.
+_LAZY_SERVICES = {
+    "rebalance_service": ".rebalance_service",
+    "price_store": ".price_store",
+    "returns_store": ".returns_store",
+    "backtest_service": ".backtest_service",
+    "chart_service": ".chart_service",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_SERVICES:
+        return getattr(importlib.import_module(_LAZY_SERVICES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     "broker_service",
+    "summary_service",
+    "async_summary_service",
+    "balance_service",
+    "async_balance_service",
+    "holding_history_service",
     "tracker_service",
+    "position_service",
+    "async_position_service",
     "investment_service",
+    "async_investment_service",
     "portfolio_service",
+    "async_portfolio_service",
+    "rebalance_service",
+    "valuation_service",
+    "price_store",
+    "returns_store",
+    "backtest_service",
+    "chart_service",
+    "transaction_service",
+    "async_transaction_service",
 ]
@@ -0,0 +1,211 @@
+"""
+Backtest Service
+
+Replays every tracker's holdings snapshots over the local price history and
+produces the daily value of 1 CLP invested by a follower, which is what
+ytd_return and the performance charts are derived from.
+
+A follower can only copy a snapshot once it is public. 13F snapshots are
+dated by their period of report and reach the follower `average_delay` days
+later. PTR snapshots are dated by their disclosure, so their trades already
+carry the politician's reporting delay and are copied on that date. On the
+first trading day on or after that date the follower sells everything at
+the close and buys the snapshot's weights, then holds (weights drift with
+prices) until the next one. The earliest known allocation is assumed held
+from the start of the window; trackers without snapshots hold their current
+holdings throughout. Tickers without prices on the switch day are left out
+and the rest re-weighted.
+
+The replay is batched across trackers: every switch of every tracker in a
+chunk is one column of a single (days x tickers) @ (tickers x switches)
+matrix product, and each tracker's daily return is gathered from the column
+of the switch active that day. No Python loop runs per day or per ticker.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import List, Optional
+import numpy as np
+import polars as pl
+from sqlalchemy import update
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models import HoldingSnapshot, Tracker, TrackerHolding
+from app.services.price_store import price_store
+from app.services.returns_store import returns_store, year_start_base
+
+_EVENT_SCHEMA = {"tracker_id": pl.Int64, "effective": pl.Date, "ticker": pl.String, "weight": pl.Float64}
+
+
+def replay(prices: np.ndarray, starts: np.ndarray, owners: np.ndarray, weights: np.ndarray, trackers: int) -> np.ndarray:
+    """
+    Follower value of each tracker on each day, 1.0 on day 0.
+
+    prices: (days x tickers) closes, NaN before a ticker's first close.
+    starts: (switches,) day on whose close each allocation is bought.
+    owners: (switches,) tracker column of each switch.
+    weights: (switches x tickers) target weights of each switch.
+    Switches must be sorted by (owner, start) with one switch per owner and day.
+    """
+    days = prices.shape[0]
+    priced = np.isfinite(prices[starts])
+    held = np.where(priced, weights, 0.0)
+    totals = held.sum(axis=1, keepdims=True)
+    held = np.divide(held, totals, out=np.zeros_like(held), where=totals > 0)
+    start_prices = np.where(priced, prices[starts], 1.0)
+    units = held / start_prices  # Shares bought per 1 CLP of value
+
+    values = np.nan_to_num(prices) @ units.T  # (days x switches), 1.0 on each switch's start
+    values[:, totals[:, 0] <= 0] = 1.0  # Nothing priced: the follower sits in cash
+
+    # Column of the switch holding each tracker's position at each day's close
+    active = np.full((days, trackers), -1, dtype=np.int64)
+    active[starts, owners] = np.arange(len(starts))
+    active = np.maximum.accumulate(active, axis=0)
+
+    held_yesterday = active[:-1]
+    columns = np.maximum(held_yesterday, 0)
+    gross = np.where(
+        held_yesterday >= 0,
+        np.take_along_axis(values[1:], columns, axis=1) / np.take_along_axis(values[:-1], columns, axis=1),
+        1.0
+    )
+    return np.vstack([np.ones((1, trackers)), np.cumprod(gross, axis=0)])
+
+
+def ytd_returns(dates: np.ndarray, growth: np.ndarray) -> np.ndarray:
+    """Year-to-date return in percent of each column, as of the last day."""
+    last = dates[-1].astype(object)
+    base = np.searchsorted(dates, np.datetime64(year_start_base(last)), side="right") - 1
+    return (growth[-1] / growth[max(base, 0)] - 1) * 100
+
+
+@dataclass
+class BacktestReport:
+    start: Optional[date] = None
+    end: Optional[date] = None
+    trackers: int = 0
+    switches: int = 0
+    days: int = 0
+    missing_tickers: List[str] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+
+class BacktestService:
+    """
+    Backtests every tracker in one batched run, stores the series in the
+    returns store and writes ytd_return back to the trackers.
+    """
+
+    def allocation_events(self, session: Session) -> pl.DataFrame:
+        """
+        Every allocation a follower switches to: (tracker_id, effective,
+        ticker, weight), effective being the day the snapshot became public.
+        """
+        trackers = pl.DataFrame(
+            session.exec(select(Tracker.id, Tracker.type, Tracker.average_delay)).all(),
+            schema={"tracker_id": pl.Int64, "type": pl.String, "average_delay": pl.Int64},
+            orient="row"
+        )
+        snapshots = pl.DataFrame(
+            session.exec(select(
+                HoldingSnapshot.tracker_id, HoldingSnapshot.period, HoldingSnapshot.ticker, HoldingSnapshot.allocation_percent
+            )).all(),
+            schema={"tracker_id": pl.Int64, "period": pl.Date, "ticker": pl.String, "weight": pl.Float64},
+            orient="row"
+        )
+        current = pl.DataFrame(
+            session.exec(select(TrackerHolding.tracker_id, TrackerHolding.ticker, TrackerHolding.allocation_percent)).all(),
+            schema={"tracker_id": pl.Int64, "ticker": pl.String, "weight": pl.Float64},
+            orient="row"
+        ).filter(~pl.col("tracker_id").is_in(snapshots["tracker_id"].unique().implode()))
+
+        lag_days = pl.when(pl.col("type") == "fund").then(pl.col("average_delay")).otherwise(0)
+        dated = snapshots.join(trackers, on="tracker_id", how="inner").select(
+            "tracker_id",
+            (pl.col("period") + pl.duration(days=lag_days)).alias("effective"),
+            "ticker",
+            "weight",
+        )
+        undated = current.select("tracker_id", pl.lit(date.min).alias("effective"), "ticker", "weight")
+        return pl.concat([dated, undated.cast(_EVENT_SCHEMA)]).filter(pl.col("weight") > 0)
+
+    def run(self, session: Session, end: Optional[date] = None, years: Optional[int] = None) -> BacktestReport:
+        """
+        Backtests every tracker over the `years` up to `end` (default: today),
+        replaces the stored series and updates ytd_return. Commits.
+        """
+        started = time.perf_counter()
+        end = end or date.today()
+        start = end - timedelta(days=round(365.25 * (years or settings.BACKTEST_YEARS)))
+        report = BacktestReport(start, end)
+
+        events = self.allocation_events(session)
+        tickers = sorted(events["ticker"].unique().to_list())
+        matrix = price_store.matrix(tickers, start, end)
+        report.missing_tickers = [ticker for ticker in tickers if ticker not in matrix.columns]
+        if matrix.height < 2:
+            return report
+
+        dates = matrix["date"].to_numpy()
+        prices = matrix.drop("date").cast(pl.Float64).to_numpy(writable=True)
+        prices[prices <= 0] = np.nan
+        switches = self._switches(events, dates, matrix.columns[1:])
+        tracker_ids = switches["tracker_id"].unique(maintain_order=True).to_list()
+
+        series, ytd = [], []
+        chunk_size = settings.BACKTEST_CHUNK_SIZE
+        for first in range(0, len(tracker_ids), chunk_size):
+            chunk_ids = tracker_ids[first:first + chunk_size]
+            chunk = switches.filter(pl.col("tracker_id").is_in(chunk_ids))
+            owners = chunk["tracker_id"].replace_strict(chunk_ids, list(range(len(chunk_ids)))).to_numpy()
+            growth = replay(
+                prices,
+                chunk["start"].to_numpy(),
+                owners,
+                chunk.drop("tracker_id", "start").to_numpy(),
+                len(chunk_ids)
+            )
+            series.append(pl.DataFrame({
+                "tracker_id": np.repeat(np.array(chunk_ids, dtype=np.int64), len(dates)),
+                "date": np.tile(dates, len(chunk_ids)),
+                "value": growth.T.ravel(),
+            }))
+            ytd.extend(zip(chunk_ids, ytd_returns(dates, growth).round(2).tolist()))
+
+        if ytd:
+            session.exec(update(Tracker), params=[{"id": tracker_id, "ytd_return": value} for tracker_id, value in ytd])
+        session.commit()
+        # Replaced after the commit: API processes drop their cached catalog
+        # when the file changes, and must then read the new ytd_return
+        returns_store.write(pl.concat(series))
+
+        report.trackers = len(tracker_ids)
+        report.switches = switches.height
+        report.days = len(dates)
+        report.elapsed_seconds = time.perf_counter() - started
+        return report
+
+    def _switches(self, events: pl.DataFrame, dates: np.ndarray, tickers: List[str]) -> pl.DataFrame:
+        """
+        One row per (tracker_id, start day index) with a weight column per
+        ticker, sorted by tracker and day.
+        """
+        day = np.searchsorted(dates, events["effective"].to_numpy(), side="left")
+        located = events.with_columns(pl.Series("start", day, dtype=pl.Int64))
+        located = located.filter(pl.col("start") < len(dates)).with_columns(
+            # The earliest allocation counts as held since the window start
+            pl.when(pl.col("start") == pl.col("start").min().over("tracker_id")).then(0).otherwise(pl.col("start")).alias("start")
+        )
+        # Several snapshots public before the same trading day: the latest wins
+        located = located.filter(pl.col("effective") == pl.col("effective").max().over("tracker_id", "start"))
+        wide = located.pivot(on="ticker", index=["tracker_id", "start"], values="weight", aggregate_function="sum")
+        return wide.select(
+            "tracker_id",
+            "start",
+            *(pl.col(ticker).fill_null(0.0) if ticker in wide.columns else pl.lit(0.0).alias(ticker) for ticker in tickers)
+        ).sort("tracker_id", "start")
+
+
+# Singleton instance
+backtest_service = BacktestService()
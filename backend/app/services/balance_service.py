@@ -0,0 +1,90 @@
+"""
+Balance Service
+
+Moves money in and out of a user's CLP balance with single conditional
+UPDATE statements, so the funds check and the debit happen in one round trip
+and concurrent requests for the same user can never overdraw the account.
+The new balance is mirrored into the user's PortfolioSummary in the same
+transaction.
+"""
+from typing import Optional
+from sqlalchemy import update
+from sqlalchemy.engine import Row
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models import User
+from app.services.summary_service import summary_service, async_summary_service
+
+
+def _debit_statement(user_id: int, amount_clp: float):
+    """UPDATE user SET balance = balance - :amt WHERE id = :id AND balance >= :amt RETURNING ..."""
+    return (
+        update(User)
+        .where(User.id == user_id, User.balance_clp >= amount_clp)
+        .values(balance_clp=User.balance_clp - amount_clp)
+        .returning(User.id, User.name, User.balance_clp)
+    )
+
+
+def _credit_statement(user_id: int, amount_clp: float):
+    """UPDATE user SET balance = balance + :amt WHERE id = :id RETURNING ..."""
+    return (
+        update(User)
+        .where(User.id == user_id)
+        .values(balance_clp=User.balance_clp + amount_clp)
+        .returning(User.id, User.name, User.balance_clp)
+    )
+
+
+def insufficient_funds_error(balance_clp: float, amount_clp: float) -> str:
+    return f"Insufficient funds. Available: {balance_clp} CLP, Required: {amount_clp} CLP"
+
+
+class BalanceService:
+    """
+    Atomic balance operations. Callers own the transaction and must commit.
+    """
+
+    def debit(self, user_id: int, amount_clp: float, session: Session) -> Optional[Row]:
+        """
+        Debits `amount_clp` if the user has enough balance.
+        Returns the (id, name, balance_clp) row after the debit, or None when
+        the user doesn't exist or has insufficient funds.
+        """
+        row = session.exec(_debit_statement(user_id, amount_clp)).first()
+        if row is not None:
+            summary_service.apply(user_id, session, balance_clp=row.balance_clp)
+        return row
+
+    def credit(self, user_id: int, amount_clp: float, session: Session) -> Optional[Row]:
+        """
+        Credits `amount_clp` to the user.
+        Returns the (id, name, balance_clp) row, or None if the user doesn't exist.
+        """
+        row = session.exec(_credit_statement(user_id, amount_clp)).first()
+        if row is not None:
+            summary_service.apply(user_id, session, balance_clp=row.balance_clp)
+        return row
+
+
+class AsyncBalanceService:
+    """
+    Async counterpart of BalanceService for use with an AsyncSession.
+    """
+
+    async def debit(self, user_id: int, amount_clp: float, session: AsyncSession) -> Optional[Row]:
+        row = (await session.exec(_debit_statement(user_id, amount_clp))).first()
+        if row is not None:
+            await async_summary_service.apply(user_id, session, balance_clp=row.balance_clp)
+        return row
+
+    async def credit(self, user_id: int, amount_clp: float, session: AsyncSession) -> Optional[Row]:
+        row = (await session.exec(_credit_statement(user_id, amount_clp))).first()
+        if row is not None:
+            await async_summary_service.apply(user_id, session, balance_clp=row.balance_clp)
+        return row
+
+
+# Singleton instances
+balance_service = BalanceService()
+async_balance_service = AsyncBalanceService()
@@ -5,8 +5,10 @@ This service simulates all broker interactions for the MVP.
 In production, this would be replaced with real broker API integration.
 """
 import asyncio
-from typing import Dict
+from typing import Dict, List, Optional
+import httpx
 from app.core.config import settings
+from app.services.quote_cache import QuoteCache
 
 
 class MockBrokerService:
@@ -25,6 +27,7 @@ class MockBrokerService:
     
     def __init__(self):
         self.broker_mode = settings.BROKER_MODE
+        self.quote_cache = QuoteCache()
     
     async def get_buying_power(self, user_id: int, session) -> float:
         """
@@ -37,8 +40,13 @@ class MockBrokerService:
         """
         from app.models import User
         from sqlmodel import select
+        from sqlmodel.ext.asyncio.session import AsyncSession
         
-        user = session.exec(select(User).where(User.id == user_id)).first()
+        statement = select(User).where(User.id == user_id)
+        if isinstance(session, AsyncSession):
+            user = (await session.exec(statement)).first()
+        else:
+            user = session.exec(statement).first()
         if not user:
             return 0.0
         return user.balance_clp
@@ -46,6 +54,20 @@ class MockBrokerService:
     async def get_current_price(self, ticker: str) -> float:
         """
         Returns the current market price for a ticker.
+        Quotes are served from the quote cache and only fetched on a miss.
+        """
+        return await self.quote_cache.get(ticker, self._fetch_price)
+    
+    async def get_current_prices(self, tickers: List[str]) -> Dict[str, float]:
+        """
+        Returns current prices for several tickers, fetching all cache misses
+        in a single bulk request.
+        """
+        return await self.quote_cache.get_many(tickers, self._fetch_prices)
+    
+    async def _fetch_price(self, ticker: str) -> float:
+        """
+        Fetches a quote from the market-data backend, bypassing the cache.
         
         # TODO: Real Broker Integration
         # In production, this would fetch real-time quotes:
@@ -54,6 +76,11 @@ class MockBrokerService:
         """
         return self.MOCK_PRICES.get(ticker, 100.0)  # Default to 100 if ticker unknown
     
+    async def _fetch_prices(self, tickers: List[str]) -> Dict[str, float]:
+        """Fetches several quotes from the market-data backend."""
+        prices = await asyncio.gather(*(self._fetch_price(t) for t in tickers))
+        return dict(zip(tickers, prices))
+    
     async def execute_trade(
         self, 
         user_id: int, 
@@ -78,6 +105,65 @@ class MockBrokerService:
         # Simulate network latency
         await asyncio.sleep(0.5)
         
+        return await self._fill(ticker, shares, action)
+    
+    async def execute_trades(self, orders: List[Dict]) -> List[Dict]:
+        """
+        Simulates a batch order submission: all orders share one round trip.
+        
+        Each order is a dict with 'ticker', 'shares' and optionally 'action'.
+        Fills are returned in the same order as the input.
+        
+        # TODO: Real Broker Integration
+        # Most broker APIs accept a list of orders per request, e.g.:
+        # fills = await broker_client.place_orders([...])
+        """
+        # Simulate network latency (once for the whole batch)
+        await asyncio.sleep(0.5)
+        
+        return [
+            await self._fill(order["ticker"], order["shares"], order.get("action", "buy"))
+            for order in orders
+        ]
+    
+    async def submit_orders(
+        self,
+        orders: List[Dict],
+        max_concurrency: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Sends any number of orders through execute_trades.
+        
+        Orders are grouped into batches of BROKER_BATCH_SIZE (one round trip
+        each) and at most `max_concurrency` batches are in flight at once
+        (defaults to BROKER_MAX_CONCURRENCY). A batch that raises is reported
+        as failed fills instead of failing the other batches.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or settings.BROKER_MAX_CONCURRENCY)
+        batch_size = settings.BROKER_BATCH_SIZE
+        batches = [orders[i:i + batch_size] for i in range(0, len(orders), batch_size)]
+        
+        async def place(batch: List[Dict]) -> List[Dict]:
+            async with semaphore:
+                return await self.execute_trades(batch)
+        
+        results = await asyncio.gather(*(place(b) for b in batches), return_exceptions=True)
+        
+        fills = []
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                result = [
+                    {"success": False, "ticker": order["ticker"], "error": str(result)}
+                    for order in batch
+                ]
+            fills.extend(result)
+        return fills
+    
+    async def aclose(self) -> None:
+        """Releases broker resources. Nothing to release for the mock."""
+    
+    async def _fill(self, ticker: str, shares: float, action: str) -> Dict:
+        """Builds a filled order at the current mock price."""
         price = await self.get_current_price(ticker)
         total_value = shares * price
         
@@ -92,5 +178,89 @@ class MockBrokerService:
         }
 
 
+class HttpBrokerService(MockBrokerService):
+    """
+    Broker backend that talks to a broker over HTTP (BROKER_MODE="http").
+    
+    All requests go through one shared AsyncClient so connections are pooled
+    and kept alive between orders. In development and tests it points at the
+    stand-in broker in app.stub_broker.
+    """
+    
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        super().__init__()
+        self.base_url = base_url or settings.BROKER_URL
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared pooled client, created on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                transport=self._transport,
+                timeout=settings.BROKER_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=settings.BROKER_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.BROKER_MAX_CONNECTIONS,
+                ),
+            )
+        return self._client
+    
+    async def _fetch_price(self, ticker: str) -> float:
+        response = await self.client.get(f"/quotes/{ticker}")
+        response.raise_for_status()
+        return response.json()["price"]
+    
+    async def _fetch_prices(self, tickers: List[str]) -> Dict[str, float]:
+        response = await self.client.get("/quotes", params={"tickers": ",".join(tickers)})
+        response.raise_for_status()
+        return response.json()["prices"]
+    
+    async def execute_trade(
+        self, 
+        user_id: int, 
+        ticker: str, 
+        shares: float, 
+        action: str = "buy"
+    ) -> Dict:
+        fills = await self.execute_trades(
+            [{"user_id": user_id, "ticker": ticker, "shares": shares, "action": action}]
+        )
+        return fills[0]
+    
+    async def execute_trades(self, orders: List[Dict]) -> List[Dict]:
+        response = await self.client.post(
+            "/orders/batch",
+            json={"orders": [
+                {
+                    "ticker": order["ticker"],
+                    "shares": order["shares"],
+                    "action": order.get("action", "buy"),
+                }
+                for order in orders
+            ]},
+        )
+        response.raise_for_status()
+        return response.json()["fills"]
+    
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def create_broker_service() -> MockBrokerService:
+    """Builds the broker backend selected by BROKER_MODE."""
+    if settings.BROKER_MODE == "http":
+        return HttpBrokerService()
+    return MockBrokerService()
+
+
 # Singleton instance
-broker_service = MockBrokerService()
+broker_service = create_broker_service()
@@ -0,0 +1,105 @@
+"""
+Catalog Cache
+
+In-process cache for the tracker catalog (marketplace list, tracker detail and
+holdings). Entries are stored as pre-serialized JSON bytes with a strong ETag,
+so hits skip the database, validation and serialization, and conditional
+requests can be answered with 304 straight from memory.
+
+Entries belong to a catalog version. Commits that write Tracker or
+TrackerHolding rows bump the version (see tracker_service), which invalidates
+every entry at once. Writes made by other processes can't bump this process's
+version, so entries also expire after a TTL. The nightly backtest is the
+exception: tracker_service bumps the version when it sees the returns store
+replaced.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+from app.core.config import settings
+
+
+class CachedJSON(NamedTuple):
+    etag: str
+    body: bytes
+    next_cursor: Optional[str] = None  # Set on paginated marketplace pages
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the exact response bytes."""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluates an If-None-Match header against `etag` (weak comparison, per RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+class CatalogCache:
+    """
+    Version- and TTL-bounded cache of serialized catalog responses, with LRU
+    eviction (marketplace pages are keyed by their query parameters).
+    Thread-safe: the tracker routes are sync and run in the threadpool.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        max_size: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.CATALOG_CACHE_TTL_SECONDS
+        self.max_size = max_size or settings.CATALOG_CACHE_MAX_SIZE
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (version, expires_at, entry)
+        self._entries: "OrderedDict[Hashable, Tuple[int, float, CachedJSON]]" = OrderedDict()
+        self.version = 0
+
+        # Counters exposed through /metrics
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[CachedJSON]:
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is not None:
+                version, expires_at, entry = stored
+                if version == self.version and expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, body: bytes, version: int, next_cursor: Optional[str] = None) -> CachedJSON:
+        """
+        Stores `body` built from data read at catalog `version`. Pass the
+        version captured *before* reading, so a write that commits during the
+        read leaves the entry already stale.
+        """
+        entry = CachedJSON(make_etag(body), body, next_cursor)
+        with self._lock:
+            if version == self.version:
+                self._entries[key] = (version, self._clock() + self.ttl_seconds, entry)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def bump(self) -> None:
+        """Invalidates every entry (called after catalog writes commit)."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "version": self.version}
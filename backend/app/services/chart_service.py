@@ -0,0 +1,346 @@
+"""
+Chart Service
+
+Builds the Vega-Lite specs of the performance charts from the returns store:
+one tracker's cumulative return, or several trackers and a benchmark ticker
+(S&P 500 by default) compared on one layered chart. A comparison is computed
+in a single columnar pass: one scan for every tracker's series, one join
+with the benchmark's prices on the common date index and one rebase of all
+columns.
+
+Long series are downsampled to at most `max_points` with
+Largest-Triangle-Three-Buckets, which keeps the visually significant peaks
+and troughs, so the payload and the browser's render time stay flat however
+long the history is.
+
+Altair is only used to build each chart style's spec skeleton, once per
+process (it is imported then, not at startup): the skeleton reads its
+points from the named dataset "series", so a response is the cached
+skeleton plus that dataset. Finished responses are
+kept serialized in an LRU keyed by (tracker, range, returns store
+version, max_points, format), so a new backtest invalidates them without
+any explicit purge and each resolution is downsampled once.
+
+Besides the full spec, a chart can be served data-only: as compact parallel
+arrays or as an Arrow IPC stream, built straight from the columns. Clients
+that fetch the skeleton once (spec_template_json) then only need the data
+of the "series" dataset.
+"""
+import io
+import json
+from collections import Counter
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional
+import numpy as np
+import polars as pl
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models import Tracker
+from app.services.catalog_cache import CachedJSON, CatalogCache, make_etag
+from app.services.chart_types import ChartFormat, ChartRange, ChartStyle
+from app.services.price_store import price_store
+from app.services.returns_store import cumulative_returns, rebase, returns_store
+from app.services.tracker_service import tracker_service
+
+if TYPE_CHECKING:
+    import altair as alt
+
+SERIES_DATASET = "series"
+
+# Calendar days covered by the fixed-length ranges
+_RANGE_DAYS = {"1m": 30, "3m": 91, "6m": 182, "1y": 365, "5y": 1826}
+
+
+def range_start(chart_range: ChartRange, last: date) -> Optional[date]:
+    """Base date of a range ending on `last`; None means the YTD base."""
+    if chart_range == "ytd":
+        return None
+    if chart_range == "max":
+        return date.min
+    return last - timedelta(days=_RANGE_DAYS[chart_range])
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Positions of the points Largest-Triangle-Three-Buckets keeps out of
+    (x, y), x ascending: the first and last points plus, from each of
+    max_points - 2 equal buckets in between, the point forming the largest
+    triangle with the point kept from the previous bucket and the mean of
+    the next one. Bucket bounds, means and areas are numpy operations; only
+    the chain from one bucket's pick to the next is a loop.
+    """
+    length = len(x)
+    if max_points >= length or max_points < 3:
+        return np.arange(length)
+    x = x.astype(float)
+    y = y.astype(float)
+    edges = np.linspace(1, length - 1, max_points - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+    mean_x = np.add.reduceat(x[:-1], starts) / counts
+    mean_y = np.add.reduceat(y[:-1], starts) / counts
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, length - 1
+    anchor = 0
+    for bucket, (start, end) in enumerate(zip(starts, ends)):
+        ax, ay = x[anchor], y[anchor]
+        areas = np.abs((ax - next_x[bucket]) * (y[start:end] - ay) - (ax - x[start:end]) * (next_y[bucket] - ay))
+        anchor = start + int(np.argmax(areas))
+        kept[bucket + 1] = anchor
+    return kept
+
+
+def downsample(returns: pl.DataFrame, max_points: int) -> pl.DataFrame:
+    """`returns` (date, return_percent) reduced to at most max_points rows with LTTB."""
+    if returns.height <= max_points:
+        return returns
+    kept = lttb_indices(
+        returns["date"].cast(pl.Int32).to_numpy(), returns["return_percent"].to_numpy(), max_points
+    )
+    return returns[kept]
+
+
+def downsample_columns(returns: pl.DataFrame, max_points: int) -> pl.DataFrame:
+    """
+    A (date, series...) frame reduced to at most max_points rows: each
+    series gets an equal share of the budget and the rows LTTB keeps for any
+    of them are kept for all, so the series stay on one date index. Raises
+    ValueError if the budget is under LTTB's 3 points per series.
+    """
+    series = [name for name in returns.columns if name != "date"]
+    if not series:
+        return returns
+    if max_points < 3 * len(series):
+        raise ValueError(f"max_points must be at least {3 * len(series)} to chart {len(series)} series")
+    if returns.height <= max_points:
+        return returns
+    days = returns["date"].cast(pl.Int32).to_numpy()
+    share = max_points // len(series)
+    kept = np.unique(np.concatenate([
+        lttb_indices(days, returns[name].fill_null(strategy="zero").to_numpy(), share) for name in series
+    ]))
+    return returns[kept]
+
+
+def _area_chart() -> "alt.Chart":
+    """Cumulative return as a line over a fading area (tracker detail page)."""
+    import altair as alt
+
+    return (
+        alt.Chart(alt.NamedData(SERIES_DATASET))
+        .mark_area(
+            line={'color': '#4c78a8'},  # colour of the line itself
+            color=alt.Gradient(
+                gradient='linear',
+                stops=[alt.GradientStop(color='#4c78a8', offset=0),
+                       alt.GradientStop(color='#4c78a800', offset=1)],  # add transparency at the bottom
+                x1=0, x2=0, y1=0, y2=1   # vertical gradient
+            )
+        )
+        .encode(
+            x=alt.X("x:T").axis(title=None, labelFontSize=14),
+            y=alt.Y("y:Q").axis(title="Retorno acumulado", labelFontSize=14, titleFontSize=16)
+        )
+        .configure_axis(
+            labelFontSize=14,
+            titleFontSize=16
+        )
+        .properties(width=500)
+    )
+
+
+def _comparison_chart() -> "alt.LayerChart":
+    """Several trackers as solid lines and the benchmark dashed, on one axis."""
+    import altair as alt
+
+    base = alt.Chart(alt.NamedData(SERIES_DATASET)).encode(
+        x=alt.X("x:T").axis(title=None, labelFontSize=14),
+        y=alt.Y("y:Q").axis(title="Retorno acumulado", labelFontSize=14, titleFontSize=16),
+        color=alt.Color("series:N").legend(title=None, orient="bottom")
+    )
+    trackers = base.mark_line().transform_filter("!datum.benchmark")
+    benchmark = base.mark_line(strokeDash=[6, 4]).transform_filter("datum.benchmark")
+    return (
+        alt.layer(trackers, benchmark)
+        .configure_axis(
+            labelFontSize=14,
+            titleFontSize=16
+        )
+        .properties(width=500)
+    )
+
+
+CHART_STYLES = {
+    "area": _area_chart,
+    "comparison": _comparison_chart,
+}
+
+
+@lru_cache(maxsize=None)
+def spec_template(style: ChartStyle) -> Dict:
+    """
+    The style's Vega-Lite spec without data. Shared between requests: copy
+    before changing it.
+    """
+    return CHART_STYLES[style]().to_dict()
+
+
+def _to_json(payload) -> bytes:
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+@lru_cache(maxsize=None)
+def spec_template_json(style: ChartStyle) -> CachedJSON:
+    """The style's spec skeleton serialized, for clients that fetch data separately."""
+    body = _to_json(spec_template(style))
+    return CachedJSON(make_etag(body), body)
+
+
+def render(style: ChartStyle, dataset: pl.DataFrame, meta: Dict, chart_format: ChartFormat) -> bytes:
+    """
+    Serializes a chart's dataset (date column plus the style's fields):
+    - "spec": {**meta, "status", "spec"} with the rows embedded in the spec;
+    - "columns": {**meta, "style", "dataset", "columns"}, one array per
+      field and dates as days since 1970-01-01;
+    - "arrow": the dataset alone as an Arrow IPC stream (dates as date32).
+    Only "spec" builds one object per row.
+    """
+    if chart_format == "arrow":
+        buffer = io.BytesIO()
+        dataset.rename({"date": "x"}).write_ipc_stream(buffer)
+        return buffer.getvalue()
+    if chart_format == "columns":
+        columns = {"x": dataset["date"].cast(pl.Int32).to_list()}
+        columns.update((name, dataset[name].to_list()) for name in dataset.columns if name != "date")
+        return _to_json({**meta, "style": style, "dataset": SERIES_DATASET, "columns": columns})
+    points = dataset.with_columns(pl.col("date").dt.to_string("%Y-%m-%d")).rename({"date": "x"}).to_dicts()
+    spec = {**spec_template(style), "datasets": {SERIES_DATASET: points}}
+    return _to_json({"status": "success", **meta, "spec": spec})
+
+
+class ChartService:
+    """
+    Serves tracker performance charts as cached, pre-serialized responses.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        # Entries are keyed on the data version, so they never need a TTL
+        self.cache = CatalogCache(ttl_seconds=float("inf"), max_size=max_size or settings.CHART_CACHE_MAX_SIZE)
+
+    def tracker_chart(
+        self,
+        tracker_id: int,
+        chart_range: ChartRange = "ytd",
+        max_points: Optional[int] = None,
+        chart_format: ChartFormat = "spec"
+    ) -> Optional[CachedJSON]:
+        """
+        The tracker's cumulative return over `chart_range` ("area" style,
+        fields y), downsampled to at most `max_points` (default
+        CHART_MAX_POINTS) and rendered as `chart_format`, or None if it was
+        never backtested.
+        """
+        max_points = max_points or settings.CHART_MAX_POINTS
+        key = ("tracker", tracker_id, chart_range, max_points, chart_format, returns_store.version)
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry
+
+        series = returns_store.series(tracker_id)
+        if series.is_empty():
+            return None
+        returns = cumulative_returns(series, range_start(chart_range, series["date"][-1]))
+        dataset = downsample(returns, max_points).select("date", pl.col("return_percent").round(2).alias("y"))
+        meta = {"tracker_id": tracker_id, "range": chart_range}
+        return self.cache.put(key, render("area", dataset, meta, chart_format), self.cache.version)
+
+    def pending_tracker_chart(
+        self,
+        tracker_id: int,
+        chart_range: ChartRange = "ytd",
+        chart_format: ChartFormat = "spec"
+    ) -> CachedJSON:
+        """
+        An empty tracker chart ("backtested": false) for a tracker that exists
+        but has no returns yet, e.g. on a fresh database before
+        `python -m app.jobs.backtest` has run.
+        """
+        dataset = pl.DataFrame(schema={"date": pl.Date, "y": pl.Float64})
+        meta = {"tracker_id": tracker_id, "range": chart_range, "backtested": False}
+        body = render("area", dataset, meta, chart_format)
+        return CachedJSON(make_etag(body), body)
+
+    def comparison_chart(
+        self,
+        tracker_ids: List[int],
+        benchmark: Optional[str],
+        session: Session,
+        chart_range: ChartRange = "ytd",
+        max_points: Optional[int] = None,
+        chart_format: ChartFormat = "spec"
+    ) -> CachedJSON:
+        """
+        The trackers' and the benchmark's cumulative returns over
+        `chart_range` as one layered chart ("comparison" style, fields
+        series, y and benchmark). Raises LookupError for unknown or never
+        backtested trackers and a benchmark without prices, ValueError for an
+        invalid benchmark ticker or a `max_points` too small for the series.
+        """
+        max_points = max_points or settings.CHART_MAX_POINTS
+        benchmark = benchmark.strip().upper() if benchmark else None
+        key = (
+            "comparison", tuple(tracker_ids), benchmark, chart_range, max_points, chart_format, returns_store.version,
+            price_store.file_version(benchmark) if benchmark else 0, tracker_service.catalog_cache.version
+        )
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry
+
+        names = dict(session.exec(select(Tracker.id, Tracker.name).where(Tracker.id.in_(tracker_ids))).all())
+        unknown = [str(tracker_id) for tracker_id in tracker_ids if tracker_id not in names]
+        if unknown:
+            raise LookupError(f"Trackers not found: {', '.join(unknown)}")
+        long = returns_store.frame(tracker_ids)
+        untested = [names[tracker_id] for tracker_id in tracker_ids if tracker_id not in set(long["tracker_id"].to_list())]
+        if untested:
+            raise LookupError(f"No backtest yet for {', '.join(untested)}")
+
+        # One column per tracker, joined with the benchmark's closes on the backtest's trading days
+        aligned = long.pivot(on="tracker_id", index="date", values="value").lazy()
+        if benchmark:
+            closes = price_store.scan([benchmark]).select("date", pl.col("close").alias(benchmark))
+            aligned = aligned.join(closes, on="date", how="left")
+        aligned = aligned.sort("date").select(pl.all().forward_fill()).collect()
+        if benchmark and aligned[benchmark].null_count() == aligned.height:
+            raise LookupError(f"No prices for benchmark {benchmark}")
+
+        returns = rebase(aligned, range_start(chart_range, aligned["date"][-1]))
+        returns = downsample_columns(returns, max_points)
+        # Trackers sharing a name (with each other or the benchmark) are told apart by id
+        taken = Counter(names[tracker_id] for tracker_id in tracker_ids)
+        if benchmark:
+            taken[benchmark] += 1
+        labels = {
+            str(tracker_id): names[tracker_id] if taken[names[tracker_id]] == 1 else f"{names[tracker_id]} (#{tracker_id})"
+            for tracker_id in tracker_ids
+        }
+        dataset = (
+            returns.unpivot(index="date", variable_name="key", value_name="y")
+            .drop_nulls("y")
+            .select(
+                "date",
+                pl.col("key").replace_strict(labels, default=pl.col("key")).alias("series"),
+                pl.col("y").round(2),
+                (pl.col("key") == benchmark).alias("benchmark") if benchmark else pl.lit(False).alias("benchmark")
+            )
+        )
+        meta = {"tracker_ids": tracker_ids, "benchmark": benchmark, "range": chart_range}
+        return self.cache.put(key, render("comparison", dataset, meta, chart_format), self.cache.version)
+
+
+# Singleton instance
+chart_service = ChartService()
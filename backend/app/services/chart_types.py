@@ -0,0 +1,12 @@
+"""
+Chart Types
+
+The parameters of the chart endpoints, kept apart from ChartService so the
+API can declare its routes without importing the analytics stack (polars,
+numpy, altair) at startup.
+"""
+from typing import Literal
+
+ChartRange = Literal["1m", "3m", "6m", "ytd", "1y", "5y", "max"]
+ChartStyle = Literal["area", "comparison"]
+ChartFormat = Literal["spec", "columns", "arrow"]
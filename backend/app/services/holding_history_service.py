@@ -0,0 +1,196 @@
+"""
+Holding History Service
+
+Records versioned snapshots of a tracker's holdings per filing period and
+diffs any two of them: tickers added, removed and re-weighted.
+
+Diffs are a single outer join of the two snapshots on ticker (polars), never a
+per-ticker loop. The diff between a tracker's latest period and the one before
+it is precomputed into HoldingChange whenever a snapshot is recorded, so the
+common "what changed in the last filing?" read is a plain indexed SELECT.
+Polars is imported by the functions that diff, so the catalog API (which
+imports this module) does not load it at startup.
+"""
+from datetime import date
+from typing import TYPE_CHECKING, Dict, List, Optional
+from sqlalchemy import delete, insert
+from sqlmodel import Session, select
+from app.models import HoldingChange, HoldingSnapshot
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# Re-weightings smaller than this are rounding, not a change of position
+REWEIGHT_TOLERANCE_PERCENT = 0.01
+
+_CHANGE_ORDER = {"added": 0, "removed": 1, "reweighted": 2}
+
+
+def _periods_statement(tracker_id: int):
+    return (
+        select(HoldingSnapshot.period)
+        .where(HoldingSnapshot.tracker_id == tracker_id)
+        .distinct()
+        .order_by(HoldingSnapshot.period.desc())
+    )
+
+
+def _snapshot_frame(tracker_id: int, period: Optional[date], session: Session) -> "pl.DataFrame":
+    """The snapshot's (ticker, company_name, allocation_percent) rows; empty for period None."""
+    import polars as pl
+
+    schema = {"ticker": pl.String, "company_name": pl.String, "allocation_percent": pl.Float64}
+    if period is None:
+        return pl.DataFrame(schema=schema)
+    rows = session.exec(
+        select(HoldingSnapshot.ticker, HoldingSnapshot.company_name, HoldingSnapshot.allocation_percent)
+        .where(HoldingSnapshot.tracker_id == tracker_id, HoldingSnapshot.period == period)
+    ).all()
+    return pl.DataFrame(rows, schema=schema, orient="row")
+
+
+def diff_snapshots(previous: "pl.DataFrame", current: "pl.DataFrame") -> "pl.DataFrame":
+    """
+    Changed tickers between two snapshots: 'added', 'removed' or 'reweighted'
+    (by more than REWEIGHT_TOLERANCE_PERCENT), with both allocations and the
+    delta. Added first, then removed, then re-weighted; largest moves first.
+    """
+    import polars as pl
+
+    previous_percent = pl.col("previous_percent")
+    allocation_percent = pl.col("allocation_percent")
+    joined = previous.rename({"allocation_percent": "previous_percent", "company_name": "previous_name"}).join(
+        current, on="ticker", how="full", coalesce=True
+    )
+    return (
+        joined.lazy()
+        .with_columns(
+            pl.when(previous_percent.is_null()).then(pl.lit("added"))
+            .when(allocation_percent.is_null()).then(pl.lit("removed"))
+            .when((allocation_percent - previous_percent).abs() > REWEIGHT_TOLERANCE_PERCENT).then(pl.lit("reweighted"))
+            .otherwise(None)
+            .alias("change"),
+            pl.coalesce("company_name", "previous_name").alias("company_name"),
+            previous_percent.fill_null(0.0),
+            allocation_percent.fill_null(0.0),
+        )
+        .drop_nulls("change")
+        .with_columns((allocation_percent - previous_percent).round(4).alias("delta_percent"))
+        .sort(
+            [pl.col("change").replace_strict(_CHANGE_ORDER), pl.col("delta_percent").abs(), "ticker"],
+            descending=[False, True, False]
+        )
+        .select("ticker", "company_name", "change", "previous_percent", "allocation_percent", "delta_percent")
+        .collect()
+    )
+
+
+class HoldingHistoryService:
+    """
+    Service for holdings snapshots and the diffs between them. Writes run in
+    the caller's transaction.
+    """
+
+    def record_snapshot(self, tracker_id: int, period: date, holdings: List[Dict], session: Session) -> None:
+        """
+        Stores `holdings` (ticker, company_name, allocation_percent dicts) as
+        the tracker's snapshot for `period`, replacing any earlier one for the
+        same period, and refreshes the precomputed latest diff.
+        """
+        session.exec(
+            delete(HoldingSnapshot)
+            .where(HoldingSnapshot.tracker_id == tracker_id, HoldingSnapshot.period == period)
+        )
+        if holdings:
+            session.exec(insert(HoldingSnapshot), params=[
+                {
+                    "tracker_id": tracker_id,
+                    "period": period,
+                    "ticker": holding["ticker"],
+                    "company_name": holding["company_name"],
+                    "allocation_percent": holding["allocation_percent"],
+                }
+                for holding in holdings
+            ])
+        self.refresh_latest_diff(tracker_id, session)
+
+    def refresh_latest_diff(self, tracker_id: int, session: Session) -> int:
+        """Recomputes HoldingChange for the tracker's latest period. Returns the row count."""
+        import polars as pl
+
+        periods = self.get_periods(tracker_id, session)
+        session.exec(delete(HoldingChange).where(HoldingChange.tracker_id == tracker_id))
+        if not periods:
+            return 0
+        latest = periods[0]
+        previous = periods[1] if len(periods) > 1 else None
+        changes = diff_snapshots(
+            _snapshot_frame(tracker_id, previous, session),
+            _snapshot_frame(tracker_id, latest, session)
+        )
+        if changes.is_empty():
+            return 0
+        session.exec(insert(HoldingChange), params=changes.with_columns(
+            pl.lit(tracker_id).alias("tracker_id"),
+            pl.lit(latest).alias("period"),
+            pl.lit(previous, pl.Date).alias("previous_period"),
+        ).to_dicts())
+        return changes.height
+
+    def get_periods(self, tracker_id: int, session: Session) -> List[date]:
+        """The tracker's snapshot periods, newest first."""
+        return list(session.exec(_periods_statement(tracker_id)).all())
+
+    def get_allocations(self, tracker_id: int, period: date, session: Session) -> Dict[str, float]:
+        """The snapshot for `period` as {ticker: allocation_percent}."""
+        return dict(_snapshot_frame(tracker_id, period, session).select("ticker", "allocation_percent").iter_rows())
+
+    def get_diff(
+        self,
+        tracker_id: int,
+        session: Session,
+        from_period: Optional[date] = None,
+        to_period: Optional[date] = None
+    ) -> Dict:
+        """
+        Changes between two periods. `to_period` defaults to the latest and
+        `from_period` to the one before `to_period`. The latest diff is read
+        from HoldingChange; other pairs are computed from the snapshots.
+        Raises ValueError for a period the tracker has no snapshot for.
+        """
+        periods = self.get_periods(tracker_id, session)
+        for period in (from_period, to_period):
+            if period is not None and period not in periods:
+                raise ValueError(f"No holdings snapshot for period {period.isoformat()}")
+        if not periods:
+            return {"tracker_id": tracker_id, "from_period": None, "to_period": None, "changes": []}
+
+        to_period = to_period or periods[0]
+        if from_period is None:
+            older = [period for period in periods if period < to_period]
+            from_period = older[0] if older else None
+
+        latest_previous = periods[1] if len(periods) > 1 else None
+        if to_period == periods[0] and from_period == latest_previous:
+            rows = session.exec(
+                select(HoldingChange).where(HoldingChange.tracker_id == tracker_id).order_by(HoldingChange.id)
+            ).all()
+            changes = [
+                row.model_dump(include={"ticker", "company_name", "change", "previous_percent", "allocation_percent", "delta_percent"})
+                for row in rows
+            ]
+        else:
+            changes = diff_snapshots(
+                _snapshot_frame(tracker_id, from_period, session),
+                _snapshot_frame(tracker_id, to_period, session)
+            ).to_dicts()
+        return {
+            "tracker_id": tracker_id,
+            "from_period": from_period.isoformat() if from_period else None,
+            "to_period": to_period.isoformat(),
+            "changes": changes,
+        }
+
+
+# Singleton instance
+holding_history_service = HoldingHistoryService()
@@ -0,0 +1,283 @@
+"""
+Idempotency Service
+
+Makes money-moving POST endpoints safe to retry. A request sent with an
+Idempotency-Key header runs once; retries with the same key get the stored
+response back without touching balances, portfolio items or transactions.
+
+Completed responses are kept in the IdempotencyKey table (shared by all
+workers) and in an in-memory LRU in front of it. Concurrent duplicates within
+a worker wait for the first request to finish instead of racing it; a
+duplicate that arrives at another worker while the first is still running gets
+409 Conflict and can retry.
+
+The first commit the handler makes also marks the key 'applied', in the same
+transaction, so a key whose side effects may be committed is never run again.
+A claim that is still 'in_progress' after IDEMPOTENCY_LEASE_SECONDS (its
+worker crashed before changing anything) is taken over by the next retry; if
+the original handler was only slow, its commit then fails instead of applying
+the request twice. Keys older than IDEMPOTENCY_RETENTION_HOURS are pruned by
+`python -m app.jobs.prune_idempotency_keys`.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, event, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.config import settings
+from app.models import IdempotencyKey
+
+# (request_hash, status_code, body)
+StoredResponse = Tuple[str, int, Any]
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def request_fingerprint(payload: Dict) -> str:
+    """Stable hash of a request body."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _mark_applied_listener(scope: str, key: str, claimed_at: datetime) -> Callable:
+    """
+    A before_commit listener for the handler's session: marks our claim
+    'applied' in the transaction that commits the handler's changes, and
+    fails that commit if another request has taken the claim over.
+    """
+    def mark_applied(session) -> None:
+        result = session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.claimed_at == claimed_at)
+            .where(IdempotencyKey.status.in_(("in_progress", "applied")))
+            .values(status="applied")
+        )
+        if result.rowcount == 0:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key was taken over by a retry"
+            )
+    return mark_applied
+
+
+class IdempotencyService:
+    """
+    Runs a handler at most once per (scope, Idempotency-Key).
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, lease_seconds: Optional[int] = None):
+        self.max_entries = max_entries or settings.IDEMPOTENCY_CACHE_SIZE
+        self.lease_seconds = lease_seconds or settings.IDEMPOTENCY_LEASE_SECONDS
+        self._cache: "OrderedDict[Tuple[str, str], StoredResponse]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def run(
+        self,
+        key: Optional[str],
+        scope: str,
+        payload: Dict,
+        handler: Callable[[], Awaitable[Any]],
+        session: AsyncSession,
+        success_status: int = 200
+    ) -> Any:
+        """
+        Runs `handler` unless a response for (scope, key) already exists.
+
+        Without a key the handler simply runs. With a key, the handler's
+        result (or the HTTPException it raises) is stored and replayed as a
+        JSONResponse for every retry that carries the same key and payload.
+        Stored successes use `success_status`, which should match the route's
+        status_code.
+        """
+        if key is None:
+            return await handler()
+
+        cache_key = (scope, key)
+        request_hash = request_fingerprint(payload)
+
+        while True:
+            stored = self._cache.get(cache_key)
+            if stored is not None:
+                self._cache.move_to_end(cache_key)
+                return self._replay(stored, request_hash)
+
+            inflight = self._inflight.get(cache_key)
+            if inflight is None:
+                break
+            # A duplicate is already running in this worker: wait for it. Its
+            # outcome doesn't matter here: the loop replays what it stored, or
+            # claims the key itself if it failed without storing anything
+            with contextlib.suppress(Exception):
+                await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        claimed_at = datetime.utcnow()
+        try:
+            stored = await self._claim(scope, key, request_hash, claimed_at, session)
+            if stored is not None:
+                self._remember(cache_key, stored)
+                future.set_result(None)
+                return self._replay(stored, request_hash)
+
+            mark_applied = _mark_applied_listener(scope, key, claimed_at)
+            event.listen(session.sync_session, "before_commit", mark_applied)
+            try:
+                status_code, body = success_status, jsonable_encoder(await handler())
+            except HTTPException as exc:
+                if exc.status_code >= 500:
+                    raise
+                # Whatever the handler left uncommitted is not part of the response
+                await session.rollback()
+                status_code, body = exc.status_code, {"detail": exc.detail}
+            finally:
+                event.remove(session.sync_session, "before_commit", mark_applied)
+
+            stored = (request_hash, status_code, body)
+            if await self._complete(scope, key, claimed_at, status_code, body, session):
+                self._remember(cache_key, stored)
+            future.set_result(None)
+            return JSONResponse(status_code=status_code, content=body)
+        except BaseException as exc:
+            if not future.done():
+                await self._release(scope, key, claimed_at, session)
+                future.set_exception(exc if isinstance(exc, Exception) else asyncio.CancelledError())
+                # Waiters retry on their own; don't log the exception as unretrieved
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(cache_key, None)
+
+    def _replay(self, stored: StoredResponse, request_hash: str) -> JSONResponse:
+        stored_hash, status_code, body = stored
+        if stored_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request body"
+            )
+        return JSONResponse(status_code=status_code, content=body, headers={REPLAYED_HEADER: "true"})
+
+    def _remember(self, cache_key: Tuple[str, str], stored: StoredResponse) -> None:
+        self._cache[cache_key] = stored
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _claim(
+        self,
+        scope: str,
+        key: str,
+        request_hash: str,
+        claimed_at: datetime,
+        session: AsyncSession
+    ) -> Optional[StoredResponse]:
+        """
+        Inserts an 'in_progress' row for the key, or takes over one whose
+        lease expired. Returns the stored response if the key already
+        completed; raises 422 if the key was used with another payload and
+        409 if it is still running (or was interrupted after taking effect).
+        """
+        existing = (await session.exec(
+            select(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+        )).first()
+        if existing is None:
+            try:
+                await session.exec(insert(IdempotencyKey).values(
+                    scope=scope, key=key, request_hash=request_hash, status="in_progress",
+                    created_at=claimed_at, claimed_at=claimed_at
+                ))
+                await session.commit()
+                return None
+            except IntegrityError:
+                await session.rollback()
+                existing = (await session.exec(
+                    select(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+                )).first()
+        elif (
+            existing.status == "in_progress"
+            and existing.request_hash == request_hash
+            and existing.claimed_at < claimed_at - timedelta(seconds=self.lease_seconds)
+        ):
+            # Nothing the claim's handler did has been committed (that would
+            # have marked it 'applied'). Matching on claimed_at lets only one
+            # retry take it over, and makes the old handler's commit fail
+            taken = (await session.exec(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+                .where(IdempotencyKey.status == "in_progress", IdempotencyKey.claimed_at == existing.claimed_at)
+                .values(claimed_at=claimed_at)
+                .returning(IdempotencyKey.key)
+            )).first()
+            await session.commit()
+            if taken is not None:
+                return None
+            existing = (await session.exec(
+                select(IdempotencyKey)
+                .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+                .execution_options(populate_existing=True)
+            )).first()
+
+        if existing is not None and existing.request_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request body"
+            )
+        if existing is None or existing.status != "completed":
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is already in progress"
+            )
+        return (existing.request_hash, existing.response_status, json.loads(existing.response_body))
+
+    async def _complete(
+        self,
+        scope: str,
+        key: str,
+        claimed_at: datetime,
+        status_code: int,
+        body: Any,
+        session: AsyncSession
+    ) -> bool:
+        """Stores the response. Returns False if the claim was taken over meanwhile."""
+        result = await session.exec(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.claimed_at == claimed_at)
+            .values(status="completed", response_status=status_code, response_body=json.dumps(body))
+        )
+        await session.commit()
+        return result.rowcount > 0
+
+    async def _release(self, scope: str, key: str, claimed_at: datetime, session: AsyncSession) -> None:
+        """
+        Drops an unfinished claim so the client can retry the request, unless
+        the handler already committed changes ('applied').
+        """
+        await session.rollback()
+        await session.exec(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            .where(IdempotencyKey.status == "in_progress", IdempotencyKey.claimed_at == claimed_at)
+        )
+        await session.commit()
+
+    async def prune(self, older_than: datetime, session: AsyncSession) -> int:
+        """
+        Deletes keys first used before `older_than` and returns how many.
+        Retries of a pruned key run the request again, so the retention
+        period must outlast any client's retry window.
+        """
+        result = await session.exec(delete(IdempotencyKey).where(IdempotencyKey.created_at < older_than))
+        await session.commit()
+        return result.rowcount
+
+
+# Singleton instance
+idempotency_service = IdempotencyService()
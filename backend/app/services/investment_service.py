@@ -3,10 +3,114 @@ Investment Service
 
 Handles the core logic of investing in a tracker.
 """
-from typing import Dict
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlmodel import Session, select
-from app.models import User, Tracker, PortfolioItem, Transaction, TrackerHolding
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.config import settings
+from app.models import User, Tracker, PortfolioItem, Transaction, TrackerHolding, InvestmentOrder
+from app.services.balance_service import (
+    balance_service,
+    async_balance_service,
+    insufficient_funds_error,
+)
 from app.services.broker_service import broker_service
+from app.services.order_aggregator import order_aggregator
+from app.services.position_service import position_service, async_position_service
+from app.services.summary_service import summary_service, async_summary_service
+
+
+def _holdings_statement(tracker_id: int):
+    return select(TrackerHolding).where(TrackerHolding.tracker_id == tracker_id)
+
+
+def _portfolio_item_insert_statement(dialect_name: str, user_id: int, tracker_id: int, amount_clp: float):
+    """
+    Creates the user's PortfolioItem for the tracker unless one exists (DO
+    NOTHING on the unique (user_id, tracker_id)). RETURNING id, so a row
+    comes back only if this statement created the item.
+    """
+    if dialect_name == "postgresql":
+        statement = postgresql.insert(PortfolioItem)
+    elif dialect_name == "sqlite":
+        statement = sqlite.insert(PortfolioItem)
+    else:
+        statement = insert(PortfolioItem)
+    statement = statement.values(
+        user_id=user_id,
+        tracker_id=tracker_id,
+        invested_amount_clp=amount_clp,
+        current_value_clp=amount_clp  # Mock: initial value = invested amount
+    )
+    if dialect_name in ("postgresql", "sqlite"):
+        statement = statement.on_conflict_do_nothing(index_elements=["user_id", "tracker_id"])
+    return statement.returning(PortfolioItem.id)
+
+
+def _portfolio_item_add_statement(user_id: int, tracker_id: int, amount_clp: float):
+    """Adds `amount_clp` to the user's existing item for the tracker. RETURNING id."""
+    return (
+        update(PortfolioItem)
+        .where(PortfolioItem.user_id == user_id, PortfolioItem.tracker_id == tracker_id)
+        .values(
+            invested_amount_clp=PortfolioItem.invested_amount_clp + amount_clp,
+            current_value_clp=PortfolioItem.current_value_clp + amount_clp
+        )
+        .returning(PortfolioItem.id)
+    )
+
+
+def _upsert_portfolio_item(user_id: int, tracker_id: int, amount_clp: float, session: Session) -> Tuple[int, bool]:
+    """
+    Creates the user's item for the tracker or adds `amount_clp` to it.
+    Returns (item id, whether it was created). A concurrent insert of the same
+    item makes ours do nothing once it commits, so ours then adds to it.
+    """
+    dialect_name = session.get_bind().dialect.name
+    created = session.exec(_portfolio_item_insert_statement(dialect_name, user_id, tracker_id, amount_clp)).first()
+    if created is not None:
+        return created.id, True
+    return session.exec(_portfolio_item_add_statement(user_id, tracker_id, amount_clp)).one().id, False
+
+
+async def _upsert_portfolio_item_async(
+    user_id: int,
+    tracker_id: int,
+    amount_clp: float,
+    session: AsyncSession
+) -> Tuple[int, bool]:
+    """Async counterpart of _upsert_portfolio_item."""
+    dialect_name = session.get_bind().dialect.name
+    created = (await session.exec(_portfolio_item_insert_statement(dialect_name, user_id, tracker_id, amount_clp))).first()
+    if created is not None:
+        return created.id, True
+    return (await session.exec(_portfolio_item_add_statement(user_id, tracker_id, amount_clp))).one().id, False
+
+
+def _filled_share(order: Dict, fill: Dict) -> float:
+    """The fraction of an order's shares that its fill covers (0 if it failed)."""
+    if not fill.get("success"):
+        return 0.0
+    if fill.get("status") == "partially_filled" and order["shares"] > 0:
+        return min(fill["shares"] / order["shares"], 1.0)
+    return 1.0
+
+
+def _order_status_statement(status: str, *conditions, current: str = "submitted", **values):
+    """
+    Moves `current` ('submitted') orders matching `conditions` to `status`.
+    Only one transition out of a status can win, so an order is settled (and
+    refunded) at most once. RETURNING id, user_id, amount_clp.
+    """
+    return (
+        update(InvestmentOrder)
+        .where(InvestmentOrder.status == current, *conditions)
+        .values(status=status, updated_at=datetime.utcnow(), **values)
+        .returning(InvestmentOrder.id, InvestmentOrder.user_id, InvestmentOrder.amount_clp)
+    )
 
 
 class InvestmentService:
@@ -24,14 +128,14 @@ class InvestmentService:
         """
         Validates an investment request.
         Returns a dict with 'valid' boolean and optional 'error' message.
-        """
-        # Check if user exists
-        user = session.get(User, user_id)
-        if not user:
-            return {"valid": False, "error": "User not found"}
         
+        The user's existence and buying power are not checked here: the
+        balance debit checks and reserves funds in one atomic statement.
+        """
+        return self._validate_request(session.get(Tracker, tracker_id), amount_clp)
+    
+    def _validate_request(self, tracker: Optional[Tracker], amount_clp: float) -> Dict:
         # Check if tracker exists
-        tracker = session.get(Tracker, tracker_id)
         if not tracker:
             return {"valid": False, "error": "Tracker not found"}
         
@@ -39,16 +143,68 @@ class InvestmentService:
         if amount_clp <= 0:
             return {"valid": False, "error": "Investment amount must be positive"}
         
-        # Check buying power
-        buying_power = await broker_service.get_buying_power(user_id, session)
-        if buying_power < amount_clp:
-            return {
-                "valid": False, 
-                "error": f"Insufficient funds. Available: {buying_power} CLP, Required: {amount_clp} CLP"
-            }
-        
         return {"valid": True}
     
+    async def allocate_orders(
+        self,
+        holdings: List[TrackerHolding],
+        amount_clp: float
+    ) -> List[Dict]:
+        """
+        Splits an investment amount into one market order per holding.
+        
+        Weights are normalised over the tracker's holdings so the full amount
+        is deployed even if the allocation percentages don't add up to 100.
+        """
+        holdings = [h for h in holdings if h.allocation_percent > 0]
+        total_weight = sum(h.allocation_percent for h in holdings)
+        if total_weight <= 0:
+            return []
+        
+        prices = await broker_service.get_current_prices([h.ticker for h in holdings])
+        
+        orders = []
+        for holding in holdings:
+            price = prices[holding.ticker]
+            order_amount_clp = amount_clp * holding.allocation_percent / total_weight
+            orders.append({
+                "ticker": holding.ticker,
+                "amount_clp": order_amount_clp,
+                "shares": order_amount_clp / (price * settings.USD_CLP_RATE),
+            })
+        return orders
+    
+    async def execute_orders(
+        self,
+        user_id: int,
+        orders: List[Dict],
+        max_concurrency: Optional[int] = None
+    ) -> Dict:
+        """
+        Sends orders to the broker and aggregates the fills.
+        
+        When ORDER_NETTING_WINDOW_MS is set, orders go through the order
+        aggregator and are netted with other users' orders before reaching the
+        broker. Otherwise they are sent directly in concurrent batches, so
+        latency is bounded by the slowest broker request rather than the sum.
+        """
+        orders = [{**order, "user_id": user_id, "action": "buy"} for order in orders]
+        if settings.ORDER_NETTING_WINDOW_MS > 0:
+            fills = await order_aggregator.submit(orders)
+        else:
+            fills = await broker_service.submit_orders(orders, max_concurrency)
+        
+        filled = [f for f in fills if f.get("success")]
+        return {
+            "success": all(f.get("status") == "filled" for f in filled) and len(filled) == len(fills),
+            "fills": fills,
+            "filled_value_clp": sum(f["total_value"] for f in filled) * settings.USD_CLP_RATE,
+            # The budget of the shares that did not fill, to be refunded
+            "unfilled_clp": sum(
+                order["amount_clp"] * (1.0 - _filled_share(order, fill)) for order, fill in zip(orders, fills)
+            ),
+        }
+    
     async def execute_investment(
         self, 
         user_id: int, 
@@ -59,67 +215,342 @@ class InvestmentService:
         """
         Executes an investment by:
         1. Validating the request
-        2. Deducting the amount from user's balance
-        3. Creating a PortfolioItem
-        4. Recording a Transaction
+        2. Checking and deducting the amount from user's balance in one UPDATE
+        3. Splitting the amount across the tracker's holdings and placing the orders
+        4. Creating a PortfolioItem and adding the fills to its Positions
+        5. Recording a Transaction
         
-        # TODO: Real Broker Integration
-        # In production, this would calculate share allocations and place real orders
+        Funds are reserved (debited and committed) before any order is placed.
+        If no order fills they are released again; if only some do, the
+        investment is recorded at the filled legs' budget and the rest is
+        refunded (see _place_orders).
         """
         # Validate first
-        validation = await self.validate_investment(user_id, tracker_id, amount_clp, session)
+        tracker = session.get(Tracker, tracker_id)
+        validation = self._validate_request(tracker, amount_clp)
         if not validation["valid"]:
             return {"success": False, "error": validation["error"]}
         
-        # Get user and tracker
-        user = session.get(User, user_id)
-        tracker = session.get(Tracker, tracker_id)
+        # Check buying power and reserve the funds in a single round trip
+        debited = balance_service.debit(user_id, amount_clp, session)
+        if debited is None:
+            session.rollback()
+            return {"success": False, "error": self._debit_error(session.get(User, user_id), amount_clp)}
+        session.commit()
         
-        # Deduct from user balance
-        user.balance_clp -= amount_clp
+        # Place one order per holding
+        holdings = session.exec(_holdings_statement(tracker_id)).all()
+        execution = await self._place_orders(user_id, list(holdings), amount_clp)
+        invested_clp = execution["invested_clp"]
+        if invested_clp <= 0:
+            # Release the reserved funds
+            balance_service.credit(user_id, amount_clp, session)
+            session.commit()
+            return {"success": False, "error": execution["error"]}
         
-        # Check if user already has a portfolio item for this tracker
-        statement = select(PortfolioItem).where(
-            PortfolioItem.user_id == user_id,
-            PortfolioItem.tracker_id == tracker_id
+        balance_clp = debited.balance_clp
+        if execution["refund_clp"]:
+            balance_clp = balance_service.credit(user_id, execution["refund_clp"], session).balance_clp
+        
+        # Create the user's portfolio item for this tracker or add to it
+        item_id, created = _upsert_portfolio_item(user_id, tracker_id, invested_clp, session)
+        session.add(self._transaction(user_id, tracker_id, invested_clp))
+        position_service.record_fills(item_id, user_id, execution["fills"], session)
+        summary_service.apply(
+            user_id,
+            session,
+            invested_clp=invested_clp,
+            current_value_clp=invested_clp,
+            trackers=int(created)
         )
-        portfolio_item = session.exec(statement).first()
         
-        if portfolio_item:
-            # Update existing portfolio item
-            portfolio_item.invested_amount_clp += amount_clp
-            portfolio_item.current_value_clp += amount_clp  # Mock: initial value = invested amount
+        # Commit changes
+        session.commit()
+        
+        return self._investment_result(tracker, item_id, balance_clp, execution)
+    
+    async def _place_orders(
+        self,
+        user_id: int,
+        holdings: List[TrackerHolding],
+        amount_clp: float
+    ) -> Dict:
+        """
+        Allocates the amount across holdings and executes the orders.
+        
+        Filled legs are kept rather than unwound: "invested_clp" is the budget
+        of the shares that filled (partial fills pro rata) and "refund_clp"
+        the rest, which the caller credits back. Nothing filled when
+        invested_clp is 0 (also when the tracker has no holdings or the quote
+        lookup or broker raised); "error" names the failed and partially
+        filled legs whenever there are any.
+        """
+        try:
+            orders = await self.allocate_orders(holdings, amount_clp)
+            if not orders:
+                return self._unfilled(amount_clp, "Tracker has no holdings to invest in")
+            execution = await self.execute_orders(user_id, orders)
+        except Exception as exc:
+            return self._unfilled(amount_clp, f"Order execution failed: {exc}")
+        fills = execution["fills"]
+        if fills and not any(f.get("success") and f.get("shares") for f in fills):
+            execution["refund_clp"], execution["invested_clp"] = amount_clp, 0.0
         else:
-            # Create new portfolio item
-            portfolio_item = PortfolioItem(
-                user_id=user_id,
-                tracker_id=tracker_id,
-                invested_amount_clp=amount_clp,
-                current_value_clp=amount_clp  # Mock: initial value = invested amount
-            )
-            session.add(portfolio_item)
-        
-        # Record transaction
-        transaction = Transaction(
+            execution["refund_clp"] = min(execution["unfilled_clp"], amount_clp)
+            execution["invested_clp"] = amount_clp - execution["refund_clp"]
+        if not execution["success"]:
+            failed = [f["ticker"] for f in fills if not f.get("success")]
+            partial = [f["ticker"] for f in fills if f.get("success") and f.get("status") == "partially_filled"]
+            problems = []
+            if failed:
+                problems.append(f"Order execution failed for: {', '.join(failed)}")
+            if partial:
+                problems.append(f"Partially filled: {', '.join(partial)}")
+            execution["error"] = "; ".join(problems)
+        return execution
+    
+    def _unfilled(self, amount_clp: float, error: str) -> Dict:
+        """A _place_orders result for orders that never reached the broker."""
+        return {"success": False, "fills": [], "invested_clp": 0.0, "refund_clp": amount_clp, "error": error}
+    
+    def _transaction(self, user_id: int, tracker_id: int, amount_clp: float) -> Transaction:
+        """The Transaction recording an executed investment; the caller adds and commits it."""
+        return Transaction(
             user_id=user_id,
             tracker_id=tracker_id,
             type="buy",
             amount_clp=amount_clp
         )
-        session.add(transaction)
+    
+    def _debit_error(self, user: Optional[User], amount_clp: float) -> str:
+        """Explains why the conditional debit matched no row."""
+        if not user:
+            return "User not found"
+        return insufficient_funds_error(user.balance_clp, amount_clp)
+    
+    def _investment_result(
+        self,
+        tracker: Tracker,
+        portfolio_item_id: int,
+        remaining_balance: float,
+        execution: Dict
+    ) -> Dict:
+        result = {
+            "success": True,
+            "message": f"Successfully invested {execution['invested_clp']} CLP in {tracker.name}",
+            "portfolio_item_id": portfolio_item_id,
+            "invested_clp": execution["invested_clp"],
+            "refunded_clp": execution["refund_clp"],
+            "remaining_balance": remaining_balance,
+            "fills": execution["fills"]
+        }
+        if execution["refund_clp"]:
+            result["message"] += f" ({execution['error']}; {execution['refund_clp']} CLP refunded)"
+        return result
+
+
+class AsyncInvestmentService(InvestmentService):
+    """
+    InvestmentService variant that takes an AsyncSession, so DB round trips
+    don't block the event loop while orders are in flight.
+    """
+    
+    async def validate_investment(
+        self,
+        user_id: int,
+        tracker_id: int,
+        amount_clp: float,
+        session: AsyncSession
+    ) -> Dict:
+        """
+        Validates an investment request; see InvestmentService.validate_investment.
+        """
+        return self._validate_request(await session.get(Tracker, tracker_id), amount_clp)
+    
+    async def execute_investment(
+        self,
+        user_id: int,
+        tracker_id: int,
+        amount_clp: float,
+        session: AsyncSession
+    ) -> Dict:
+        """
+        Executes an investment; see InvestmentService.execute_investment.
+        """
+        tracker = await session.get(Tracker, tracker_id)
+        validation = self._validate_request(tracker, amount_clp)
+        if not validation["valid"]:
+            return {"success": False, "error": validation["error"]}
+        
+        debited = await async_balance_service.debit(user_id, amount_clp, session)
+        if debited is None:
+            await session.rollback()
+            return {"success": False, "error": self._debit_error(await session.get(User, user_id), amount_clp)}
+        await session.commit()
+        
+        holdings = (await session.exec(_holdings_statement(tracker_id))).all()
+        execution = await self._place_orders(user_id, list(holdings), amount_clp)
+        invested_clp = execution["invested_clp"]
+        if invested_clp <= 0:
+            await async_balance_service.credit(user_id, amount_clp, session)
+            await session.commit()
+            return {"success": False, "error": execution["error"]}
+        
+        balance_clp = debited.balance_clp
+        if execution["refund_clp"]:
+            balance_clp = (await async_balance_service.credit(user_id, execution["refund_clp"], session)).balance_clp
+        
+        item_id, created = await _upsert_portfolio_item_async(user_id, tracker_id, invested_clp, session)
+        session.add(self._transaction(user_id, tracker_id, invested_clp))
+        await async_position_service.record_fills(item_id, user_id, execution["fills"], session)
+        await async_summary_service.apply(
+            user_id,
+            session,
+            invested_clp=invested_clp,
+            current_value_clp=invested_clp,
+            trackers=int(created)
+        )
         
-        # Commit changes
-        session.commit()
-        session.refresh(user)
-        session.refresh(portfolio_item)
+        await session.commit()
+        
+        return self._investment_result(tracker, item_id, balance_clp, execution)
+    
+    async def enqueue_investment(
+        self,
+        user_id: int,
+        tracker_id: int,
+        amount_clp: float,
+        session: AsyncSession
+    ) -> Dict:
+        """
+        Validates the request, reserves the funds and queues an
+        InvestmentOrder for the order workers, all in one transaction.
+        Broker execution happens later in process_order.
+        """
+        tracker = await session.get(Tracker, tracker_id)
+        validation = self._validate_request(tracker, amount_clp)
+        if not validation["valid"]:
+            return {"success": False, "error": validation["error"]}
+        
+        debited = await async_balance_service.debit(user_id, amount_clp, session)
+        if debited is None:
+            await session.rollback()
+            return {"success": False, "error": self._debit_error(await session.get(User, user_id), amount_clp)}
+        
+        order = InvestmentOrder(user_id=user_id, tracker_id=tracker_id, amount_clp=amount_clp)
+        session.add(order)
+        await session.commit()
+        await session.refresh(order)
         
         return {
             "success": True,
-            "message": f"Successfully invested {amount_clp} CLP in {tracker.name}",
-            "portfolio_item_id": portfolio_item.id,
-            "remaining_balance": user.balance_clp
+            "message": f"Investment of {amount_clp} CLP in {tracker.name} queued",
+            "order_id": order.id,
+            "status": order.status,
+            "remaining_balance": debited.balance_clp
+        }
+    
+    async def process_order(self, order: InvestmentOrder, session: AsyncSession) -> Dict:
+        """
+        Executes a claimed ('submitted') order: places the broker orders and
+        then either records the PortfolioItem/Transaction for what filled
+        (refunding the legs that did not) and marks the order 'filled', or
+        refunds the reserved funds and marks it 'failed'.
+        
+        If the lease ran out meanwhile, the reaper has marked the order
+        'expired' and refunded all of it. Shares that filled are still
+        recorded and the order still ends up 'filled'; the invested amount is
+        then taken back from the balance, which can leave it negative.
+        """
+        holdings = (await session.exec(_holdings_statement(order.tracker_id))).all()
+        execution = await self._place_orders(order.user_id, list(holdings), order.amount_clp)
+        
+        invested_clp = execution["invested_clp"]
+        if invested_clp <= 0:
+            await self.fail_order(order.id, execution["error"], session)
+            return {"success": False, "order_id": order.id, "error": execution["error"]}
+        
+        item_id, created = await _upsert_portfolio_item_async(order.user_id, order.tracker_id, invested_clp, session)
+        session.add(self._transaction(order.user_id, order.tracker_id, invested_clp))
+        await async_position_service.record_fills(item_id, order.user_id, execution["fills"], session)
+        await async_summary_service.apply(
+            order.user_id,
+            session,
+            invested_clp=invested_clp,
+            current_value_clp=invested_clp,
+            trackers=int(created)
+        )
+        
+        result = {
+            "portfolio_item_id": item_id,
+            "invested_clp": invested_clp,
+            "refunded_clp": execution["refund_clp"],
+            "fills": execution["fills"]
+        }
+        if execution["refund_clp"]:
+            result["error"] = execution["error"]
+        filled = (await session.exec(
+            _order_status_statement("filled", InvestmentOrder.id == order.id, result=json.dumps(result))
+        )).first()
+        if filled is not None:
+            balance_change_clp = execution["refund_clp"]
+        else:
+            # The reaper expired the order and refunded all of it
+            filled = (await session.exec(_order_status_statement(
+                "filled", InvestmentOrder.id == order.id, current="expired", error=None, result=json.dumps(result)
+            ))).first()
+            if filled is None:
+                await session.rollback()
+                return {"success": False, "order_id": order.id, "error": "Order was already settled"}
+            balance_change_clp = -invested_clp
+        if balance_change_clp:
+            await async_balance_service.credit(order.user_id, balance_change_clp, session)
+        await session.commit()
+        return {"success": True, "order_id": order.id, **result}
+    
+    async def fail_order(self, order_id: int, error: str, session: AsyncSession) -> bool:
+        """
+        Marks a 'submitted' order 'failed' and refunds its amount. Returns
+        False if the order was already settled.
+        """
+        failed = (await session.exec(_order_status_statement("failed", InvestmentOrder.id == order_id, error=error))).all()
+        return await self._refund(failed, session) > 0
+    
+    async def expire_orders(self, submitted_before: datetime, session: AsyncSession) -> int:
+        """
+        Expires and refunds every order still 'submitted' since before
+        `submitted_before` (its worker died or hung). A worker that was only
+        slow still records its fills (see process_order). Returns the order count.
+        """
+        expired = (await session.exec(_order_status_statement(
+            "expired", InvestmentOrder.updated_at < submitted_before, error="Order lease expired"
+        ))).all()
+        return await self._refund(expired, session)
+    
+    async def _refund(self, orders: List, session: AsyncSession) -> int:
+        for order in orders:
+            await async_balance_service.credit(order.user_id, order.amount_clp, session)
+        await session.commit()
+        return len(orders)
+    
+    async def get_order(self, order_id: int, session: AsyncSession) -> Optional[Dict]:
+        """Returns the order's current status, or None if it doesn't exist."""
+        order = await session.get(InvestmentOrder, order_id)
+        if order is None:
+            return None
+        return {
+            "order_id": order.id,
+            "user_id": order.user_id,
+            "tracker_id": order.tracker_id,
+            "amount_clp": order.amount_clp,
+            "status": order.status,
+            "error": order.error,
+            "result": json.loads(order.result) if order.result else None,
+            "created_at": order.created_at,
+            "updated_at": order.updated_at
         }
 
 
-# Singleton instance
+# Singleton instances
 investment_service = InvestmentService()
+async_investment_service = AsyncInvestmentService()
@@ -0,0 +1,167 @@
+"""
+Order Aggregator
+
+Nets orders from concurrent investments before they reach the broker
+(omnibus batching). When many users follow the same tracker at the same time,
+their per-ticker buys and sells are collected over a short window, netted into
+a single order per ticker, and the resulting fills are allocated back to each
+user pro rata.
+"""
+import asyncio
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.services.broker_service import broker_service
+
+
+def net_orders(orders: List[Dict]) -> Dict[str, float]:
+    """
+    Returns the signed net quantity per ticker (buys positive, sells negative).
+    """
+    net: Dict[str, float] = defaultdict(float)
+    for order in orders:
+        sign = -1.0 if order.get("action", "buy") == "sell" else 1.0
+        net[order["ticker"]] += sign * order["shares"]
+    return dict(net)
+
+
+def allocate_fill(orders: List[Dict], fill: Dict) -> List[Dict]:
+    """
+    Splits the broker fill for one ticker back across the orders that were
+    netted into it.
+
+    Orders on the smaller side are crossed internally against the larger side
+    and always fill in full. Orders on the larger side share the internally
+    crossed volume plus whatever the broker filled, pro rata to their size.
+    """
+    buys = sum(o["shares"] for o in orders if o.get("action", "buy") != "sell")
+    sells = sum(o["shares"] for o in orders if o.get("action", "buy") == "sell")
+    net_side = "sell" if sells > buys else "buy"
+    net_side_volume = max(buys, sells)
+    crossed_volume = min(buys, sells)
+
+    fill_ratio = 1.0
+    if net_side_volume > crossed_volume:
+        fill_ratio = min((crossed_volume + fill["shares"]) / net_side_volume, 1.0)
+        if math.isclose(fill_ratio, 1.0):
+            # Rounding in the netted sums, not a short fill
+            fill_ratio = 1.0
+
+    allocations = []
+    for order in orders:
+        action = order.get("action", "buy")
+        shares = order["shares"] * fill_ratio if action == net_side else order["shares"]
+        allocations.append({
+            "success": True,
+            "ticker": order["ticker"],
+            "shares": shares,
+            "price": fill["price"],
+            "total_value": shares * fill["price"],
+            "action": action,
+            "status": "filled" if shares >= order["shares"] else "partially_filled",
+        })
+    return allocations
+
+
+class OrderAggregator:
+    """
+    Collects orders over a time window (ORDER_NETTING_WINDOW_MS) or until a
+    size limit (ORDER_NETTING_MAX_ORDERS) is reached, then sends one netted
+    order per ticker to the broker.
+    """
+
+    def __init__(
+        self,
+        window_seconds: Optional[float] = None,
+        max_orders: Optional[int] = None
+    ):
+        self.window_seconds = (
+            window_seconds if window_seconds is not None
+            else settings.ORDER_NETTING_WINDOW_MS / 1000
+        )
+        self.max_orders = max_orders or settings.ORDER_NETTING_MAX_ORDERS
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+        # Counters for monitoring how much netting saves
+        self.orders_received = 0
+        self.broker_orders_sent = 0
+        self.flush_count = 0
+
+    async def submit(self, orders: List[Dict]) -> List[Dict]:
+        """
+        Queues orders (each with 'ticker', 'shares' and 'action') and waits for
+        the window to flush. Returns one fill per order, in input order.
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for order in orders:
+            future = loop.create_future()
+            self._pending.append((order, future))
+            futures.append(future)
+        self.orders_received += len(orders)
+
+        if len(self._pending) >= self.max_orders:
+            self.flush()
+        elif self._timer is None and self._pending:
+            self._timer = loop.call_later(self.window_seconds, self.flush)
+
+        return list(await asyncio.gather(*futures))
+
+    def flush(self) -> None:
+        """Sends everything collected so far to the broker."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._execute(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _execute(self, batch: List[Tuple[Dict, asyncio.Future]]) -> None:
+        try:
+            by_ticker: Dict[str, List[Tuple[Dict, asyncio.Future]]] = defaultdict(list)
+            for order, future in batch:
+                by_ticker[order["ticker"]].append((order, future))
+
+            net = net_orders([order for order, _ in batch])
+            broker_orders = [
+                {"ticker": ticker, "shares": abs(shares), "action": "buy" if shares > 0 else "sell"}
+                for ticker, shares in net.items()
+                if shares != 0
+            ]
+            self.flush_count += 1
+            self.broker_orders_sent += len(broker_orders)
+
+            fills = await broker_service.submit_orders(broker_orders)
+            fills_by_ticker = {order["ticker"]: fill for order, fill in zip(broker_orders, fills)}
+
+            for ticker, entries in by_ticker.items():
+                fill = fills_by_ticker.get(ticker)
+                if fill is None:
+                    # Fully crossed internally: nothing reached the broker
+                    price = await broker_service.get_current_price(ticker)
+                    fill = {"success": True, "shares": 0.0, "price": price}
+
+                if fill.get("success"):
+                    results = allocate_fill([order for order, _ in entries], fill)
+                else:
+                    error = fill.get("error", "Order rejected by broker")
+                    results = [{"success": False, "ticker": ticker, "error": error} for _ in entries]
+
+                for (_, future), result in zip(entries, results):
+                    if not future.done():
+                        future.set_result(result)
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+
+
+# Singleton instance
+order_aggregator = OrderAggregator()
@@ -0,0 +1,184 @@
+"""
+Order Worker Pool
+
+Drains the InvestmentOrder queue in the background so POST /invest can
+return as soon as the funds are reserved.
+
+Each worker claims a batch of 'queued' orders with a single
+UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING, which
+moves them to 'submitted' atomically. On Postgres SKIP LOCKED lets any number
+of workers (in this process or in `python -m app.worker`) claim disjoint
+batches without blocking each other; SQLite has no row locks but serializes
+writers, so the same statement is still atomic there.
+
+Orders that stay 'submitted' longer than ORDER_LEASE_SECONDS (their worker
+crashed or hung between claim and commit) are failed and refunded by a
+periodic sweep in every pool (reap).
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.config import settings
+from app.core.db import async_engine
+from app.models import InvestmentOrder
+from app.services.investment_service import async_investment_service
+
+logger = logging.getLogger(__name__)
+
+
+def _claim_statement(batch_size: int):
+    """Moves up to `batch_size` of the oldest queued orders to 'submitted'."""
+    queued = (
+        select(InvestmentOrder.id)
+        .where(InvestmentOrder.status == "queued")
+        .order_by(InvestmentOrder.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(InvestmentOrder)
+        .where(InvestmentOrder.id.in_(queued), InvestmentOrder.status == "queued")
+        .values(status="submitted", updated_at=datetime.utcnow())
+        .returning(
+            InvestmentOrder.id,
+            InvestmentOrder.user_id,
+            InvestmentOrder.tracker_id,
+            InvestmentOrder.amount_clp,
+            InvestmentOrder.status
+        )
+    )
+
+
+def _default_session_factory() -> AsyncSession:
+    return AsyncSession(async_engine, expire_on_commit=False)
+
+
+class OrderWorkerPool:
+    """
+    A fixed number of asyncio workers that claim and execute queued orders.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        session_factory: Optional[Callable[[], AsyncSession]] = None,
+        lease_seconds: Optional[float] = None
+    ):
+        self.workers = settings.ORDER_WORKERS if workers is None else workers
+        self.batch_size = batch_size or settings.ORDER_CLAIM_BATCH_SIZE
+        self.poll_interval = settings.ORDER_POLL_INTERVAL_SECONDS if poll_interval is None else poll_interval
+        self.session_factory = session_factory or _default_session_factory
+        self.lease_seconds = settings.ORDER_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self._next_reap = 0.0
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def claim(self) -> List[InvestmentOrder]:
+        """Claims the next batch of queued orders (committed as 'submitted')."""
+        async with self.session_factory() as session:
+            rows = (await session.exec(_claim_statement(self.batch_size))).all()
+            await session.commit()
+        return [InvestmentOrder(**row._mapping) for row in rows]
+
+    async def run_once(self) -> int:
+        """
+        Claims one batch and executes its orders concurrently, each in its own
+        session. Orders for the same (user, tracker) run one after another
+        within a batch; across batches and workers the PortfolioItem upsert
+        keeps them consistent. Returns the number of orders processed.
+        """
+        orders = await self.claim()
+        groups: Dict[Tuple[int, int], List[InvestmentOrder]] = defaultdict(list)
+        for order in orders:
+            groups[(order.user_id, order.tracker_id)].append(order)
+        await asyncio.gather(*(self._process_in_order(group) for group in groups.values()))
+        return len(orders)
+
+    async def _process_in_order(self, orders: List[InvestmentOrder]) -> None:
+        for order in orders:
+            await self._process(order)
+
+    async def drain(self) -> int:
+        """Processes batches until the queue is empty. Returns the order count."""
+        total = 0
+        while True:
+            processed = await self.run_once()
+            if not processed:
+                return total
+            total += processed
+
+    async def reap(self) -> int:
+        """Expires and refunds orders whose lease ran out. Returns the order count."""
+        submitted_before = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        async with self.session_factory() as session:
+            expired = await async_investment_service.expire_orders(submitted_before, session)
+        if expired:
+            logger.warning("Expired and refunded %s orders whose lease ran out", expired)
+        return expired
+
+    async def _process(self, order: InvestmentOrder) -> None:
+        try:
+            async with self.session_factory() as session:
+                await async_investment_service.process_order(order, session)
+        except Exception as exc:
+            logger.exception("Order %s failed unexpectedly", order.id)
+            try:
+                async with self.session_factory() as session:
+                    await async_investment_service.fail_order(order.id, f"Order processing failed: {exc}", session)
+            except Exception:
+                # Still 'submitted': the reaper refunds it once the lease expires
+                logger.exception("Could not fail order %s", order.id)
+
+    def notify(self) -> None:
+        """Wakes idle workers after an order has been queued."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """Starts the workers on the running event loop."""
+        if self._tasks or self.workers <= 0:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Lets every worker finish its current batch, then stops them."""
+        self._stopping = True
+        self.notify()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            try:
+                if time.monotonic() >= self._next_reap:
+                    # Workers share the schedule: one reap per interval per pool
+                    self._next_reap = time.monotonic() + min(self.lease_seconds, 60.0)
+                    await self.reap()
+                processed = await self.run_once()
+            except Exception:
+                logger.exception("Order worker failed to claim orders")
+                processed = 0
+            if processed or self._stopping:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            if not self._stopping:
+                self._wakeup.clear()
+
+
+# Singleton instance
+order_worker_pool = OrderWorkerPool()
@@ -4,8 +4,69 @@ Portfolio Service
 Handles user portfolio queries and calculations.
 """
 from typing import List, Dict
+from sqlalchemy.engine import Row
 from sqlmodel import Session, select
-from app.models import User, PortfolioItem, Tracker
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models import PortfolioItem, PortfolioSummary, Tracker
+from app.services.summary_service import summary_service, async_summary_service
+
+
+def _holdings_statement(user_id: int):
+    """Each portfolio item joined with the tracker fields the summary shows."""
+    return (
+        select(
+            Tracker.id.label("tracker_id"),
+            Tracker.name,
+            Tracker.avatar_url,
+            Tracker.type,
+            Tracker.risk_level,
+            PortfolioItem.invested_amount_clp,
+            PortfolioItem.current_value_clp
+        )
+        .join(Tracker, Tracker.id == PortfolioItem.tracker_id)
+        .where(PortfolioItem.user_id == user_id)
+        .order_by(PortfolioItem.id)
+    )
+
+
+def _build_portfolio(summary: PortfolioSummary, holdings: List[Row]) -> Dict:
+    """
+    Builds the portfolio response from the user's PortfolioSummary (totals)
+    and the joined holdings. Shared by the sync and async services.
+    """
+    total_invested = summary.total_invested_clp
+    total_current_value = summary.total_current_value_clp
+    total_pl = total_current_value - total_invested
+    total_pl_percent = (total_pl / total_invested * 100) if total_invested > 0 else 0.0
+    
+    # Build active trackers list
+    active_trackers = []
+    for row in holdings:
+        pl = row.current_value_clp - row.invested_amount_clp
+        pl_percent = (pl / row.invested_amount_clp * 100) if row.invested_amount_clp > 0 else 0.0
+        
+        active_trackers.append({
+            "tracker_id": row.tracker_id,
+            "tracker_name": row.name,
+            "avatar_url": row.avatar_url,
+            "type": row.type,
+            "risk_level": row.risk_level,
+            "invested_amount_clp": row.invested_amount_clp,
+            "current_value_clp": row.current_value_clp,
+            "profit_loss_clp": pl,
+            "profit_loss_percent": pl_percent
+        })
+    
+    return {
+        "user_id": summary.user_id,
+        "available_balance_clp": summary.available_balance_clp,
+        "total_invested_clp": total_invested,
+        "total_current_value_clp": total_current_value,
+        "total_profit_loss_clp": total_pl,
+        "total_profit_loss_percent": total_pl_percent,
+        "tracker_count": summary.tracker_count,
+        "active_trackers": active_trackers
+    }
 
 
 class PortfolioService:
@@ -20,49 +81,36 @@ class PortfolioService:
         - Current total value
         - Overall P&L
         - List of active trackers
+        
+        Totals come from the user's PortfolioSummary; the tracker list is one
+        joined query however many trackers the user follows.
         """
-        user = session.get(User, user_id)
-        if not user:
+        summary = summary_service.get(user_id, session)
+        if not summary:
             return {"error": "User not found"}
         
-        # Get all portfolio items for user
-        statement = select(PortfolioItem).where(PortfolioItem.user_id == user_id)
-        portfolio_items = session.exec(statement).all()
-        
-        total_invested = sum(item.invested_amount_clp for item in portfolio_items)
-        total_current_value = sum(item.current_value_clp for item in portfolio_items)
-        total_pl = total_current_value - total_invested
-        total_pl_percent = (total_pl / total_invested * 100) if total_invested > 0 else 0.0
-        
-        # Build active trackers list
-        active_trackers = []
-        for item in portfolio_items:
-            tracker = session.get(Tracker, item.tracker_id)
-            pl = item.current_value_clp - item.invested_amount_clp
-            pl_percent = (pl / item.invested_amount_clp * 100) if item.invested_amount_clp > 0 else 0.0
-            
-            active_trackers.append({
-                "tracker_id": tracker.id,
-                "tracker_name": tracker.name,
-                "avatar_url": tracker.avatar_url,
-                "type": tracker.type,
-                "risk_level": tracker.risk_level,
-                "invested_amount_clp": item.invested_amount_clp,
-                "current_value_clp": item.current_value_clp,
-                "profit_loss_clp": pl,
-                "profit_loss_percent": pl_percent
-            })
+        holdings = session.exec(_holdings_statement(user_id)).all()
+        return _build_portfolio(summary, holdings)
+
+
+class AsyncPortfolioService:
+    """
+    Async counterpart of PortfolioService for use with an AsyncSession.
+    """
+    
+    async def get_user_portfolio(self, user_id: int, session: AsyncSession) -> Dict:
+        """
+        Returns the same summary as PortfolioService.get_user_portfolio
+        without blocking the event loop.
+        """
+        summary = await async_summary_service.get(user_id, session)
+        if not summary:
+            return {"error": "User not found"}
         
-        return {
-            "user_id": user_id,
-            "available_balance_clp": user.balance_clp,
-            "total_invested_clp": total_invested,
-            "total_current_value_clp": total_current_value,
-            "total_profit_loss_clp": total_pl,
-            "total_profit_loss_percent": total_pl_percent,
-            "active_trackers": active_trackers
-        }
+        holdings = (await session.exec(_holdings_statement(user_id))).all()
+        return _build_portfolio(summary, holdings)
 
 
-# Singleton instance
+# Singleton instances
 portfolio_service = PortfolioService()
+async_portfolio_service = AsyncPortfolioService()
@@ -0,0 +1,95 @@
+"""
+Position Service
+
+Maintains per-ticker Position rows from broker fills. Each successful fill is
+added to the (portfolio item, ticker) position with a single
+INSERT ... ON CONFLICT DO UPDATE per batch of fills, inside the caller's
+transaction.
+"""
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.config import settings
+from app.models import Position
+
+
+def _position_rows(portfolio_item_id: int, user_id: int, fills: List[Dict]) -> List[Dict]:
+    """Successful fills summed per ticker, as Position column dicts."""
+    rows: Dict[str, Dict] = {}
+    now = datetime.utcnow()
+    for fill in fills:
+        if not fill.get("success") or not fill.get("shares"):
+            continue
+        value_clp = fill["total_value"] * settings.USD_CLP_RATE
+        row = rows.setdefault(fill["ticker"], {
+            "portfolio_item_id": portfolio_item_id,
+            "user_id": user_id,
+            "ticker": fill["ticker"],
+            "shares": 0.0,
+            "cost_basis_clp": 0.0,
+            "market_value_clp": 0.0,
+            "updated_at": now,
+        })
+        sign = -1.0 if fill.get("action") == "sell" else 1.0
+        row["shares"] += sign * fill["shares"]
+        row["cost_basis_clp"] += sign * value_clp
+        row["market_value_clp"] += sign * value_clp
+    return list(rows.values())
+
+
+def _upsert_statement(dialect_name: str):
+    """Adds to an existing position instead of failing on (portfolio_item_id, ticker)."""
+    if dialect_name == "postgresql":
+        statement = postgresql.insert(Position)
+    elif dialect_name == "sqlite":
+        statement = sqlite.insert(Position)
+    else:
+        return insert(Position)
+    return statement.on_conflict_do_update(
+        index_elements=["portfolio_item_id", "ticker"],
+        set_={
+            "shares": Position.shares + statement.excluded.shares,
+            "cost_basis_clp": Position.cost_basis_clp + statement.excluded.cost_basis_clp,
+            "market_value_clp": Position.market_value_clp + statement.excluded.market_value_clp,
+            "updated_at": statement.excluded.updated_at,
+        }
+    )
+
+
+class PositionService:
+    """
+    Applies fills to positions. Callers own the transaction and must commit.
+    """
+
+    def record_fills(self, portfolio_item_id: int, user_id: int, fills: List[Dict], session: Session) -> int:
+        """Adds the fills' shares and cost to the item's positions. Returns the number of tickers touched."""
+        return self.record_changes(_position_rows(portfolio_item_id, user_id, fills), session)
+    
+    def record_changes(self, rows: List[Dict], session: Session) -> int:
+        """
+        Adds Position column dicts (shares, cost_basis_clp and market_value_clp
+        deltas, any number of items) to the positions in one statement.
+        """
+        if rows:
+            session.exec(_upsert_statement(session.get_bind().dialect.name), params=rows)
+        return len(rows)
+
+
+class AsyncPositionService:
+    """
+    Async counterpart of PositionService for use with an AsyncSession.
+    """
+
+    async def record_fills(self, portfolio_item_id: int, user_id: int, fills: List[Dict], session: AsyncSession) -> int:
+        rows = _position_rows(portfolio_item_id, user_id, fills)
+        if rows:
+            await session.exec(_upsert_statement(session.get_bind().dialect.name), params=rows)
+        return len(rows)
+
+
+# Singleton instances
+position_service = PositionService()
+async_position_service = AsyncPositionService()
@@ -0,0 +1,128 @@
+"""
+Price Store
+
+Local, columnar daily price history: one Parquet file per ticker
+(<PRICE_STORE_DIR>/<TICKER>.parquet, columns date and close, sorted by date).
+Files are written offline by `python -m app.jobs.backfill_prices` and read
+lazily with polars scan_parquet, so a date-range query only decodes the row
+groups it needs (predicate pushdown) from memory-mapped files, without any
+network call.
+
+Prices are dividend/split adjusted closes in USD when the source provides
+them (yfinance "Adj Close"), so returns computed from them are total returns.
+"""
+import os
+import re
+import threading
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+import polars as pl
+from app.core.config import settings
+
+PRICE_SCHEMA = {"date": pl.Date, "close": pl.Float64}
+
+_TICKER_PATTERN = re.compile(r"^[A-Z0-9.\-^=]{1,20}$")
+
+
+class PriceStore:
+    """
+    Reads and writes the per-ticker Parquet files under `root`.
+    `version` changes whenever this process writes prices; file_version
+    also sees writes made by other processes (the backfill job).
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or settings.PRICE_STORE_DIR
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def path(self, ticker: str) -> str:
+        ticker = ticker.strip().upper()
+        if not _TICKER_PATTERN.match(ticker):
+            raise ValueError(f"Invalid ticker: {ticker!r}")
+        return os.path.join(self.root, f"{ticker}.parquet")
+
+    def file_version(self, ticker: str) -> int:
+        """Changes whenever the ticker's file is replaced; 0 if it has no prices."""
+        try:
+            return os.stat(self.path(ticker)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def tickers(self) -> List[str]:
+        """Every ticker with stored prices."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[:-len(".parquet")] for name in os.listdir(self.root) if name.endswith(".parquet"))
+
+    def write(self, ticker: str, prices: pl.DataFrame) -> int:
+        """
+        Merges `prices` (date, close) into the ticker's file; new values win
+        on overlapping dates. The file is replaced atomically. Returns the
+        number of stored rows.
+        """
+        path = self.path(ticker)
+        incoming = prices.select(pl.col("date").cast(pl.Date), pl.col("close").cast(pl.Float64)).drop_nulls()
+        with self._lock:
+            if os.path.exists(path):
+                incoming = pl.concat([pl.read_parquet(path), incoming])
+            merged = incoming.unique("date", keep="last").sort("date")
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            merged.write_parquet(tmp_path, statistics=True)
+            os.replace(tmp_path, path)
+            self.version += 1
+        return merged.height
+
+    def scan(self, tickers: Sequence[str], start: Optional[date] = None, end: Optional[date] = None) -> pl.LazyFrame:
+        """
+        Long (ticker, date, close) frame for the tickers that have a file,
+        filtered to [start, end]; the filter is pushed down into the scans.
+        """
+        scans = [
+            pl.scan_parquet(self.path(ticker)).with_columns(pl.lit(ticker.strip().upper()).alias("ticker"))
+            for ticker in tickers
+            if os.path.exists(self.path(ticker))
+        ]
+        if not scans:
+            return pl.LazyFrame(schema={"ticker": pl.String, **PRICE_SCHEMA})
+        frame = pl.concat(scans, how="vertical").select("ticker", "date", "close")
+        if start is not None:
+            frame = frame.filter(pl.col("date") >= start)
+        if end is not None:
+            frame = frame.filter(pl.col("date") <= end)
+        return frame
+
+    def matrix(
+        self,
+        tickers: Sequence[str],
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ) -> pl.DataFrame:
+        """
+        Prices aligned on the union of trading days: a `date` column plus one
+        column per ticker, in the order given. Gaps (holidays on one exchange,
+        late listings) are forward-filled; days before a ticker's first price
+        stay null. Tickers without stored prices are left out.
+        """
+        tickers = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers))
+        long = self.scan(tickers, start, end).collect()
+        if long.is_empty():
+            return pl.DataFrame(schema={"date": pl.Date})
+        wide = long.pivot(on="ticker", index="date", values="close").sort("date")
+        present = [ticker for ticker in tickers if ticker in wide.columns]
+        return wide.select("date", *(pl.col(ticker).forward_fill() for ticker in present))
+
+    def last_prices(self, tickers: Sequence[str], as_of: Optional[date] = None) -> Dict[str, float]:
+        """The latest stored close of each ticker on or before `as_of`."""
+        latest = (
+            self.scan(tickers, end=as_of)
+            .group_by("ticker")
+            .agg(pl.col("close").sort_by("date").last())
+            .collect()
+        )
+        return dict(latest.iter_rows())
+
+
+# Singleton instance
+price_store = PriceStore()
@@ -0,0 +1,180 @@
+"""
+Quote Cache
+
+In-process cache for market quotes so that popular tickers are fetched from
+the market-data backend at most once per TTL, no matter how many orders need
+them. Concurrent misses for the same ticker share a single in-flight fetch.
+If the caller running that fetch is cancelled, the callers waiting on it
+retry on their own instead of waiting forever.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+
+def _settle(future: asyncio.Future, exc: BaseException) -> None:
+    """
+    Fails a shared fetch with `exc`, or cancels it when the fetching caller
+    itself was cancelled (waiters then retry).
+    """
+    if future.done():
+        return
+    if isinstance(exc, Exception):
+        future.set_exception(exc)
+        # Mark the exception as retrieved when nobody else was waiting
+        future.exception()
+    else:
+        future.cancel()
+
+
+class QuoteCache:
+    """
+    TTL cache with a bounded size and LRU eviction, plus single-flight
+    de-duplication of concurrent fetches.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        max_size: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.QUOTE_CACHE_TTL_SECONDS
+        self.max_size = max_size or settings.QUOTE_CACHE_MAX_SIZE
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # ticker -> (price, expires_at)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        # Counters exposed through /metrics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _lookup(self, ticker: str) -> Optional[float]:
+        entry = self._entries.get(ticker)
+        if entry is None:
+            return None
+        price, expires_at = entry
+        if expires_at <= self._clock():
+            del self._entries[ticker]
+            return None
+        self._entries.move_to_end(ticker)
+        return price
+
+    def _store(self, ticker: str, price: float) -> None:
+        self._entries[ticker] = (price, self._clock() + self.ttl_seconds)
+        self._entries.move_to_end(ticker)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, ticker: str, fetch: Callable[[str], Awaitable[float]]) -> float:
+        """
+        Returns the cached price for `ticker`, calling `fetch` on a miss.
+        """
+        price = self._lookup(ticker)
+        if price is not None:
+            self.hits += 1
+            return price
+
+        inflight = self._inflight.get(ticker)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The fetching caller was cancelled, not us: fetch it ourselves
+                return await self.get(ticker, fetch)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[ticker] = future
+        try:
+            price = await fetch(ticker)
+        except BaseException as exc:
+            _settle(future, exc)
+            raise
+        else:
+            self._store(ticker, price)
+            future.set_result(price)
+            return price
+        finally:
+            self._inflight.pop(ticker, None)
+
+    async def get_many(
+        self,
+        tickers: List[str],
+        fetch_many: Callable[[List[str]], Awaitable[Dict[str, float]]]
+    ) -> Dict[str, float]:
+        """
+        Returns prices for several tickers, fetching all misses in one call to
+        `fetch_many`. Tickers already being fetched by another caller are
+        awaited instead of fetched again.
+        """
+        prices: Dict[str, float] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        missing: List[str] = []
+        for ticker in dict.fromkeys(tickers):
+            price = self._lookup(ticker)
+            if price is not None:
+                self.hits += 1
+                prices[ticker] = price
+            elif ticker in self._inflight:
+                self.coalesced += 1
+                waiting[ticker] = self._inflight[ticker]
+            else:
+                self.misses += 1
+                missing.append(ticker)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {ticker: loop.create_future() for ticker in missing}
+            self._inflight.update(futures)
+            try:
+                fetched = await fetch_many(missing)
+            except BaseException as exc:
+                for future in futures.values():
+                    _settle(future, exc)
+                raise
+            else:
+                for ticker, future in futures.items():
+                    if ticker in fetched:
+                        self._store(ticker, fetched[ticker])
+                        future.set_result(fetched[ticker])
+                    else:
+                        future.set_exception(KeyError(ticker))
+                        future.exception()
+                prices.update(fetched)
+            finally:
+                for ticker in missing:
+                    self._inflight.pop(ticker, None)
+
+        retry: List[str] = []
+        for ticker, future in waiting.items():
+            try:
+                prices[ticker] = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                retry.append(ticker)
+        if retry:
+            # Their fetching caller was cancelled
+            prices.update(await self.get_many(retry, fetch_many))
+        return prices
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
@@ -0,0 +1,307 @@
+"""
+Rebalance Service
+
+When a tracker's holdings change, every PortfolioItem following it has to
+move from the old allocation to the new one. Followers are loaded in chunks
+(keyset over PortfolioItem.id) and each chunk is a (followers x tickers)
+numpy matrix: target position values minus current ones. Summing the matrix
+over followers gives one netted order per ticker for the whole tracker, which
+is what reaches the broker, instead of one order per follower and ticker.
+
+A follower's current positions are its Position rows (market value per
+ticker). Followers without positions (invested before positions were
+recorded) are assumed to hold the previous allocation at their current value.
+
+Once the broker has filled, the followers are walked again and each one's
+share of the fills is written back in a single transaction, split the way
+order_aggregator.allocate_fill splits a netted fill: per ticker, the side
+that was crossed internally fills in full and the net side shares what the
+broker filled pro rata. Untracked value is recorded as positions at the
+previous weights, the trades are added to the Position rows and each follower
+gets a 'buy' and/or 'sell' Transaction. Trades swap positions at the value
+they were planned at, so PortfolioItem.current_value_clp doesn't change.
+Afterwards the followers hold the target allocation, so planning the same
+change again finds nothing to trade and a repeated run is a no-op.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import insert
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models import PortfolioItem, Position, Transaction
+from app.services.broker_service import broker_service
+from app.services.holding_history_service import holding_history_service
+from app.services.position_service import position_service
+
+
+def _followers_statement(tracker_id: int, after_id: int, limit: int):
+    """One chunk of a tracker's followers, in id order after `after_id`."""
+    return (
+        select(PortfolioItem.id, PortfolioItem.user_id, PortfolioItem.current_value_clp)
+        .where(PortfolioItem.tracker_id == tracker_id, PortfolioItem.id > after_id)
+        .order_by(PortfolioItem.id)
+        .limit(limit)
+    )
+
+
+def _positions_statement(tracker_id: int, first_id: int, last_id: int):
+    """Positions of the tracker's followers with ids in [first_id, last_id]."""
+    return (
+        select(Position.portfolio_item_id, Position.ticker, Position.market_value_clp)
+        .join(PortfolioItem, PortfolioItem.id == Position.portfolio_item_id)
+        .where(PortfolioItem.tracker_id == tracker_id, Position.portfolio_item_id.between(first_id, last_id))
+    )
+
+
+def _position_tickers_statement(tracker_id: int):
+    return (
+        select(Position.ticker)
+        .join(PortfolioItem, PortfolioItem.id == Position.portfolio_item_id)
+        .where(PortfolioItem.tracker_id == tracker_id)
+        .distinct()
+    )
+
+
+def weight_vector(allocations: Dict[str, float], tickers: List[str]) -> np.ndarray:
+    """Allocation percentages as weights summing to 1, in `tickers` order (0 for missing tickers)."""
+    weights = np.array([max(allocations.get(ticker, 0.0), 0.0) for ticker in tickers], dtype=float)
+    total = weights.sum()
+    return weights / total if total > 0 else weights
+
+
+def rebalance_matrix(values: np.ndarray, current: np.ndarray, target_weights: np.ndarray) -> np.ndarray:
+    """
+    CLP to trade per follower (rows) and ticker (columns): each follower's
+    value at the target weights minus its current positions. Positive is a buy.
+    """
+    return np.outer(values, target_weights) - current
+
+
+def fill_ratios(net_clp: np.ndarray, gross_clp: np.ndarray, filled_clp: np.ndarray) -> np.ndarray:
+    """
+    Fraction of each ticker's net-side trades that executed. The smaller side
+    (buys or sells) was crossed internally; the larger side gets the crossed
+    volume plus what the broker filled, as in order_aggregator.allocate_fill.
+    """
+    buys = (gross_clp + net_clp) / 2
+    sells = (gross_clp - net_clp) / 2
+    net_side = np.maximum(buys, sells)
+    crossed = np.minimum(buys, sells)
+    ratios = np.ones_like(net_clp)
+    short = net_side > crossed
+    ratios[short] = np.minimum((crossed[short] + filled_clp[short]) / net_side[short], 1.0)
+    # Rounding in the netted sums, not a short fill
+    ratios[np.isclose(ratios, 1.0)] = 1.0
+    return ratios
+
+
+def follower_trades(deltas: np.ndarray, net_clp: np.ndarray, ratios: np.ndarray) -> np.ndarray:
+    """The executed part of each follower's planned trades: net-side trades scaled by the fill ratio."""
+    return np.where(np.sign(deltas) == np.sign(net_clp), deltas * ratios, deltas)
+
+
+@dataclass
+class RebalancePlan:
+    tracker_id: int
+    tickers: List[str]
+    previous_weights: np.ndarray
+    target_weights: np.ndarray
+    net_clp: np.ndarray  # Signed CLP per ticker after netting all followers
+    gross_clp: np.ndarray  # Sum of |per-follower trade| per ticker, before netting
+    followers: int = 0
+
+    def orders(self, prices: Dict[str, float], min_order_clp: Optional[float] = None) -> List[Dict]:
+        """Netted broker orders, skipping tickers whose net trade is below `min_order_clp`."""
+        threshold = settings.REBALANCE_MIN_ORDER_CLP if min_order_clp is None else min_order_clp
+        orders = []
+        for ticker, amount_clp in zip(self.tickers, self.net_clp):
+            if amount_clp == 0 or abs(amount_clp) < threshold:
+                continue
+            orders.append({
+                "ticker": ticker,
+                "action": "buy" if amount_clp > 0 else "sell",
+                "amount_clp": float(abs(amount_clp)),
+                "shares": float(abs(amount_clp)) / (prices[ticker] * settings.USD_CLP_RATE),
+            })
+        return orders
+
+    def filled_clp(self, orders: List[Dict], fills: List[Dict]) -> np.ndarray:
+        """CLP the broker filled per ticker, from the sent orders and their fills (in the same order)."""
+        columns = {ticker: index for index, ticker in enumerate(self.tickers)}
+        filled = np.zeros(len(self.tickers))
+        for order, fill in zip(orders, fills):
+            if fill.get("success") and order["shares"]:
+                filled[columns[order["ticker"]]] = order["amount_clp"] * min(fill["shares"] / order["shares"], 1.0)
+        return filled
+
+
+@dataclass
+class RebalanceResult:
+    tracker_id: int
+    followers: int
+    orders: List[Dict] = field(default_factory=list)
+    fills: List[Dict] = field(default_factory=list)
+    gross_clp: float = 0.0
+    net_clp: float = 0.0
+    recorded: int = 0  # Followers whose trades were written back
+
+
+class RebalanceService:
+    """
+    Computes and executes the rebalancing of a tracker's followers.
+    """
+
+    def plan(
+        self,
+        tracker_id: int,
+        previous: Dict[str, float],
+        target: Dict[str, float],
+        session: Session,
+        chunk_size: Optional[int] = None
+    ) -> RebalancePlan:
+        """
+        Per-ticker trades that move every follower from the `previous` to the
+        `target` allocation ({ticker: allocation_percent}).
+        """
+        held = session.exec(_position_tickers_statement(tracker_id)).all()
+        tickers = sorted(set(previous) | set(target) | set(held))
+        zeros = np.zeros(len(tickers))
+        plan = RebalancePlan(
+            tracker_id, tickers, weight_vector(previous, tickers), weight_vector(target, tickers), zeros, zeros.copy()
+        )
+        for rows, _, deltas in self._chunks(plan, session, chunk_size):
+            plan.net_clp += deltas.sum(axis=0)
+            plan.gross_clp += np.abs(deltas).sum(axis=0)
+            plan.followers += len(rows)
+        return plan
+
+    def _chunks(
+        self,
+        plan: RebalancePlan,
+        session: Session,
+        chunk_size: Optional[int] = None
+    ) -> Iterator[Tuple[List, np.ndarray, np.ndarray]]:
+        """
+        Walks the tracker's followers in chunks, yielding their
+        (id, user_id, current_value_clp) rows, the value of each not held in
+        positions, and the (followers x tickers) trades to the target weights.
+        """
+        chunk_size = chunk_size or settings.REBALANCE_CHUNK_SIZE
+        columns = {ticker: index for index, ticker in enumerate(plan.tickers)}
+        after_id = 0
+        while True:
+            rows = session.exec(_followers_statement(plan.tracker_id, after_id, chunk_size)).all()
+            if not rows:
+                return
+            ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            values = np.fromiter((row[2] for row in rows), dtype=float, count=len(rows))
+            held = self._held_matrix(plan.tracker_id, ids, columns, session)
+            untracked = values - held.sum(axis=1)
+            current = held + np.outer(untracked, plan.previous_weights)
+            yield rows, untracked, rebalance_matrix(values, current, plan.target_weights)
+            after_id = rows[-1][0]
+
+    def _held_matrix(self, tracker_id: int, ids: np.ndarray, columns: Dict[str, int], session: Session) -> np.ndarray:
+        """(followers x tickers) market value of one chunk of followers' Position rows."""
+        held = np.zeros((len(ids), len(columns)))
+        positions = session.exec(_positions_statement(tracker_id, int(ids[0]), int(ids[-1]))).all()
+        if positions:
+            rows = np.searchsorted(ids, np.fromiter((p[0] for p in positions), dtype=np.int64, count=len(positions)))
+            cols = np.fromiter((columns[p[1]] for p in positions), dtype=np.int64, count=len(positions))
+            np.add.at(held, (rows, cols), np.fromiter((p[2] for p in positions), dtype=float, count=len(positions)))
+        return held
+
+    def plan_latest_change(self, tracker_id: int, session: Session, chunk_size: Optional[int] = None) -> Optional[RebalancePlan]:
+        """
+        Plan for the tracker's latest filing against the one before, or None
+        if the tracker has fewer than two holdings snapshots.
+        """
+        periods = holding_history_service.get_periods(tracker_id, session)
+        if len(periods) < 2:
+            return None
+        latest, previous = (
+            holding_history_service.get_allocations(tracker_id, period, session) for period in periods[:2]
+        )
+        return self.plan(tracker_id, previous, latest, session, chunk_size)
+
+    async def execute(
+        self,
+        plan: RebalancePlan,
+        session: Session,
+        min_order_clp: Optional[float] = None,
+        chunk_size: Optional[int] = None
+    ) -> RebalanceResult:
+        """
+        Sends the plan's netted orders to the broker (one per ticker), then
+        records every follower's share of the fills and commits.
+        """
+        threshold = settings.REBALANCE_MIN_ORDER_CLP if min_order_clp is None else min_order_clp
+        result = RebalanceResult(
+            plan.tracker_id,
+            plan.followers,
+            gross_clp=float(plan.gross_clp.sum()),
+            net_clp=float(np.abs(plan.net_clp).sum())
+        )
+        if result.gross_clp < threshold:
+            # Followers already hold the target allocation
+            return result
+        prices = await broker_service.get_current_prices(plan.tickers)
+        result.orders = plan.orders(prices, threshold)
+        if result.orders:
+            result.fills = await broker_service.submit_orders(result.orders)
+        ratios = fill_ratios(plan.net_clp, plan.gross_clp, plan.filled_clp(result.orders, result.fills))
+        result.recorded = self._record_trades(plan, ratios, prices, session, chunk_size)
+        session.commit()
+        return result
+
+    def _record_trades(
+        self,
+        plan: RebalancePlan,
+        ratios: np.ndarray,
+        prices: Dict[str, float],
+        session: Session,
+        chunk_size: Optional[int] = None
+    ) -> int:
+        """
+        Adds each follower's executed trades to its positions and records its
+        transactions, in the caller's transaction. Returns the number of
+        followers that traded.
+        """
+        price_clp = np.array([prices[ticker] for ticker in plan.tickers]) * settings.USD_CLP_RATE
+        now = datetime.utcnow()
+        recorded = 0
+        for rows, untracked, deltas in self._chunks(plan, session, chunk_size):
+            # Rounded to cents so float noise from netting doesn't become rows
+            trades = np.round(follower_trades(deltas, plan.net_clp, ratios), 2)
+            changes = np.round(np.outer(untracked, plan.previous_weights), 2) + trades
+            followers, columns = np.nonzero(changes)
+            position_service.record_changes([
+                {
+                    "portfolio_item_id": rows[i][0],
+                    "user_id": rows[i][1],
+                    "ticker": plan.tickers[t],
+                    "shares": float(changes[i, t] / price_clp[t]),
+                    "cost_basis_clp": float(changes[i, t]),
+                    "market_value_clp": float(changes[i, t]),
+                    "updated_at": now,
+                }
+                for i, t in zip(followers.tolist(), columns.tolist())
+            ], session)
+            bought = trades.clip(min=0).sum(axis=1)
+            sold = (-trades).clip(min=0).sum(axis=1)
+            transactions = [
+                {"user_id": row[1], "tracker_id": plan.tracker_id, "type": kind, "amount_clp": float(amount), "timestamp": now}
+                for row, buy, sell in zip(rows, bought, sold)
+                for kind, amount in (("buy", buy), ("sell", sell))
+                if amount > 0
+            ]
+            if transactions:
+                session.exec(insert(Transaction), params=transactions)
+            recorded += int(np.count_nonzero(bought + sold))
+        return recorded
+
+
+# Singleton instance
+rebalance_service = RebalanceService()
@@ -0,0 +1,113 @@
+"""
+Returns Store
+
+The backtester's output: one Parquet file (RETURNS_STORE_PATH) with the
+daily growth of 1 CLP invested in each tracker as a follower, columns
+tracker_id, date and value, sorted by tracker then date. It is rewritten as a
+whole by every backtest run (`python -m app.jobs.backtest`) and read lazily,
+filtering on tracker_id inside the scan.
+
+Cumulative returns over any window are ratios of two values, so ytd_return
+and the chart series are both derived from the same file.
+"""
+import os
+import threading
+from datetime import date
+from typing import Optional, Sequence
+import polars as pl
+from app.core.config import settings
+
+RETURNS_SCHEMA = {"tracker_id": pl.Int64, "date": pl.Date, "value": pl.Float64}
+
+
+def year_start_base(last: date) -> date:
+    """The base date of a year-to-date return: the last day of the previous year."""
+    return date(last.year - 1, 12, 31)
+
+
+def rebase(frame: pl.DataFrame, since: Optional[date] = None) -> pl.DataFrame:
+    """
+    Cumulative returns in percent of every non-date column of a (date, ...)
+    frame of values or prices, from its last day on or before `since` to its
+    end. Each column is rebased on its first value in that window (0.0 there),
+    so a series that starts later starts at 0.0 on its first day. `since`
+    defaults to the year-to-date base of the last day.
+    """
+    if frame.is_empty():
+        return frame
+    since = since or year_start_base(frame["date"][-1])
+    on_or_before = frame.filter(pl.col("date") <= since)
+    base_date = on_or_before["date"][-1] if not on_or_before.is_empty() else frame["date"][0]
+    return frame.filter(pl.col("date") >= base_date).select(
+        "date",
+        *(((pl.col(name) / pl.col(name).drop_nulls().first() - 1) * 100).round(4) for name in frame.columns if name != "date")
+    )
+
+
+def cumulative_returns(series: pl.DataFrame, since: Optional[date] = None) -> pl.DataFrame:
+    """
+    Cumulative return in percent (date, return_percent) of a (date, value)
+    series (see rebase). With the default `since`, the last point equals the
+    tracker's ytd_return.
+    """
+    if series.is_empty():
+        return pl.DataFrame(schema={"date": pl.Date, "return_percent": pl.Float64})
+    return rebase(series, since).rename({"value": "return_percent"})
+
+
+class ReturnsStore:
+    """
+    Reads and replaces the backtested series.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.RETURNS_STORE_PATH
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        """
+        Changes whenever the file is replaced, by this or any other process
+        (the nightly job runs on its own), so callers can key caches on it.
+        """
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def write(self, frame: pl.DataFrame) -> int:
+        """Replaces every stored series with `frame` (tracker_id, date, value). Returns the row count."""
+        frame = frame.select(
+            pl.col(name).cast(dtype) for name, dtype in RETURNS_SCHEMA.items()
+        ).sort("tracker_id", "date")
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            frame.write_parquet(tmp_path, statistics=True)
+            os.replace(tmp_path, self.path)
+        return frame.height
+
+    def series(self, tracker_id: int, start: Optional[date] = None, end: Optional[date] = None) -> pl.DataFrame:
+        """The tracker's (date, value) rows within [start, end]; empty if it was never backtested."""
+        if not os.path.exists(self.path):
+            return pl.DataFrame(schema={"date": pl.Date, "value": pl.Float64})
+        frame = pl.scan_parquet(self.path).filter(pl.col("tracker_id") == tracker_id)
+        if start is not None:
+            frame = frame.filter(pl.col("date") >= start)
+        if end is not None:
+            frame = frame.filter(pl.col("date") <= end)
+        return frame.select("date", "value").collect()
+
+    def frame(self, tracker_ids: Sequence[int]) -> pl.DataFrame:
+        """The (tracker_id, date, value) rows of several trackers, read in one scan."""
+        if not os.path.exists(self.path):
+            return pl.DataFrame(schema=RETURNS_SCHEMA)
+        return pl.scan_parquet(self.path).filter(pl.col("tracker_id").is_in(list(tracker_ids))).collect()
+
+    def cumulative(self, tracker_id: int, since: Optional[date] = None) -> pl.DataFrame:
+        """The tracker's cumulative return since `since` (see cumulative_returns)."""
+        return cumulative_returns(self.series(tracker_id), since)
+
+
+# Singleton instance
+returns_store = ReturnsStore()
@@ -0,0 +1,203 @@
+"""
+Portfolio Summary Service
+
+Maintains the PortfolioSummary read model. Every write path that changes a
+user's balance, portfolio items or their valuation applies its delta here,
+inside the caller's transaction, so totals never need recomputing on read.
+
+A summary row is created lazily from the user's current data on their first
+write (or by the migration / rebuild job), so users that predate the table
+never start from wrong totals.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import delete, func, insert, literal, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.types import DateTime
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models import User, PortfolioItem, PortfolioSummary
+
+# Totals are floats; differences below this are rounding, not drift
+DRIFT_TOLERANCE_CLP = 0.01
+
+_SUMMARY_COLUMNS = [
+    "user_id",
+    "available_balance_clp",
+    "total_invested_clp",
+    "total_current_value_clp",
+    "tracker_count",
+    "updated_at",
+]
+
+
+def _aggregate_statement(user_id: Optional[int] = None):
+    """
+    Summary rows computed from scratch from User and PortfolioItem, for one
+    user or (user_id=None) for everyone. Columns follow _SUMMARY_COLUMNS.
+    """
+    statement = (
+        select(
+            User.id.label("user_id"),
+            User.balance_clp.label("available_balance_clp"),
+            func.coalesce(func.sum(PortfolioItem.invested_amount_clp), 0.0).label("total_invested_clp"),
+            func.coalesce(func.sum(PortfolioItem.current_value_clp), 0.0).label("total_current_value_clp"),
+            func.count(PortfolioItem.id).label("tracker_count"),
+            literal(datetime.utcnow(), DateTime).label("updated_at")
+        )
+        .select_from(User)
+        .outerjoin(PortfolioItem, PortfolioItem.user_id == User.id)
+        .group_by(User.id, User.balance_clp)
+    )
+    if user_id is not None:
+        statement = statement.where(User.id == user_id)
+    return statement
+
+
+def _delta_statement(
+    user_id: int,
+    balance_clp: Optional[float],
+    invested_clp: float,
+    current_value_clp: float,
+    trackers: int
+):
+    """Applies deltas to an existing summary row (the balance is absolute)."""
+    values = {
+        "total_invested_clp": PortfolioSummary.total_invested_clp + invested_clp,
+        "total_current_value_clp": PortfolioSummary.total_current_value_clp + current_value_clp,
+        "tracker_count": PortfolioSummary.tracker_count + trackers,
+        "updated_at": datetime.utcnow(),
+    }
+    if balance_clp is not None:
+        values["available_balance_clp"] = balance_clp
+    return update(PortfolioSummary).where(PortfolioSummary.user_id == user_id).values(**values)
+
+
+def _create_statement(user_id: int, dialect_name: str):
+    """
+    INSERT ... SELECT of a freshly computed row, ignoring a row that a
+    concurrent transaction created first.
+    """
+    if dialect_name == "postgresql":
+        statement = postgresql.insert(PortfolioSummary)
+    elif dialect_name == "sqlite":
+        statement = sqlite.insert(PortfolioSummary)
+    else:
+        return insert(PortfolioSummary).from_select(_SUMMARY_COLUMNS, _aggregate_statement(user_id))
+    return (
+        statement
+        .from_select(_SUMMARY_COLUMNS, _aggregate_statement(user_id))
+        .on_conflict_do_nothing(index_elements=["user_id"])
+    )
+
+
+def _drift_statement():
+    """Users whose stored summary is missing or disagrees with the recomputed one."""
+    expected = _aggregate_statement().subquery()
+    stored = PortfolioSummary
+    return (
+        select(
+            expected.c.user_id,
+            expected.c.available_balance_clp,
+            expected.c.total_invested_clp,
+            expected.c.total_current_value_clp,
+            expected.c.tracker_count,
+            stored.available_balance_clp.label("stored_available_balance_clp"),
+            stored.total_invested_clp.label("stored_total_invested_clp"),
+            stored.total_current_value_clp.label("stored_total_current_value_clp"),
+            stored.tracker_count.label("stored_tracker_count")
+        )
+        .select_from(expected)
+        .outerjoin(stored, stored.user_id == expected.c.user_id)
+        .where(or_(
+            stored.user_id.is_(None),
+            func.abs(stored.available_balance_clp - expected.c.available_balance_clp) > DRIFT_TOLERANCE_CLP,
+            func.abs(stored.total_invested_clp - expected.c.total_invested_clp) > DRIFT_TOLERANCE_CLP,
+            func.abs(stored.total_current_value_clp - expected.c.total_current_value_clp) > DRIFT_TOLERANCE_CLP,
+            stored.tracker_count != expected.c.tracker_count
+        ))
+        .order_by(expected.c.user_id)
+    )
+
+
+class SummaryService:
+    """
+    Applies changes to PortfolioSummary. Callers own the transaction and must
+    commit, which keeps the summary consistent with the change itself.
+    """
+
+    def apply(
+        self,
+        user_id: int,
+        session: Session,
+        balance_clp: Optional[float] = None,
+        invested_clp: float = 0.0,
+        current_value_clp: float = 0.0,
+        trackers: int = 0
+    ) -> None:
+        """
+        Records a change for the user: the new balance and/or deltas of the
+        invested amount, current value (e.g. from a valuation job) and number
+        of trackers followed. Must run after the change itself is flushed.
+        """
+        delta = _delta_statement(user_id, balance_clp, invested_clp, current_value_clp, trackers)
+        if session.exec(delta).rowcount:
+            return
+        # First write for this user: the computed row already includes the change
+        if session.exec(_create_statement(user_id, session.get_bind().dialect.name)).rowcount:
+            return
+        session.exec(delta)
+
+    def get(self, user_id: int, session: Session) -> Optional[PortfolioSummary]:
+        """
+        The user's summary: the stored row (a primary-key lookup) or, for a
+        user who has none yet, one computed on the fly. None if the user
+        doesn't exist.
+        """
+        return session.get(PortfolioSummary, user_id) or session.exec(_aggregate_statement(user_id)).first()
+
+    def find_drift(self, session: Session) -> List[Dict]:
+        """
+        Recomputes every summary in one query and returns the users whose
+        stored row is missing or differs, with expected and stored values.
+        """
+        return [dict(row._mapping) for row in session.exec(_drift_statement()).all()]
+
+    def rebuild(self, session: Session) -> int:
+        """Replaces every summary with a recomputed one in bulk. Returns the row count."""
+        session.exec(delete(PortfolioSummary))
+        result = session.exec(insert(PortfolioSummary).from_select(_SUMMARY_COLUMNS, _aggregate_statement()))
+        return result.rowcount
+
+
+class AsyncSummaryService:
+    """
+    Async counterpart of SummaryService for use with an AsyncSession.
+    """
+
+    async def apply(
+        self,
+        user_id: int,
+        session: AsyncSession,
+        balance_clp: Optional[float] = None,
+        invested_clp: float = 0.0,
+        current_value_clp: float = 0.0,
+        trackers: int = 0
+    ) -> None:
+        delta = _delta_statement(user_id, balance_clp, invested_clp, current_value_clp, trackers)
+        if (await session.exec(delta)).rowcount:
+            return
+        if (await session.exec(_create_statement(user_id, session.get_bind().dialect.name))).rowcount:
+            return
+        await session.exec(delta)
+
+    async def get(self, user_id: int, session: AsyncSession) -> Optional[PortfolioSummary]:
+        return (
+            await session.get(PortfolioSummary, user_id)
+            or (await session.exec(_aggregate_statement(user_id))).first()
+        )
+
+
+# Singleton instances
+summary_service = SummaryService()
+async_summary_service = AsyncSummaryService()
@@ -3,9 +3,81 @@ Tracker Service
 
 Handles business logic for Tracker-related operations.
 """
-from typing import List, Optional
+import base64
+import binascii
+import json
+import os
+from datetime import date
+from itertools import chain
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+from sqlalchemy import event, tuple_
+from sqlalchemy.orm import Session as OrmSession, selectinload
 from sqlmodel import Session, select
-from app.models import Tracker, TrackerHolding
+from app.core.config import settings
+from app.models import HoldingChange, HoldingSnapshot, Tracker, TrackerHolding
+from app.services.catalog_cache import CachedJSON, CatalogCache
+from app.services.holding_history_service import holding_history_service
+
+CATALOG_MODELS = (Tracker, TrackerHolding, HoldingSnapshot, HoldingChange)
+
+
+def _to_json(payload) -> bytes:
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def _dump_tracker(tracker: Tracker, include_holdings: bool = False) -> dict:
+    data = tracker.model_dump(mode="json")
+    if include_holdings:
+        data["holdings"] = [holding.model_dump(mode="json") for holding in tracker.holdings]
+    return data
+
+
+def _resolve_order(sort: str, order: Optional[str]) -> str:
+    """Ascending for id, descending (best first) for the metrics, unless given."""
+    return order or ("asc" if sort == "id" else "desc")
+
+
+def encode_cursor(sort: str, order: str, tracker: Tracker) -> str:
+    """Opaque keyset cursor: the sort key and id of the last tracker on a page."""
+    position = [sort, order, getattr(tracker, sort), tracker.id]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> Tuple[Any, int]:
+    """Returns (sort value, id) from a cursor; ValueError if it's malformed or for another sort."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, cursor_order, value, tracker_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if (cursor_sort, cursor_order) != (sort, order) or not isinstance(tracker_id, int):
+        raise ValueError("Cursor doesn't match the requested sort order")
+    return value, tracker_id
+
+
+def _marketplace_statement(
+    tracker_type: Optional[str],
+    risk_level: Optional[str],
+    sort: str,
+    order: str,
+    after: Optional[Tuple[Any, int]],
+    limit: int
+):
+    """
+    Filtered, sorted page of trackers after the `after` position. Matches
+    the ix_tracker_<filters>_<sort>_id indexes declared on Tracker.
+    """
+    keys = [Tracker.id] if sort == "id" else [getattr(Tracker, sort), Tracker.id]
+    statement = select(Tracker)
+    if tracker_type is not None:
+        statement = statement.where(Tracker.type == tracker_type)
+    if risk_level is not None:
+        statement = statement.where(Tracker.risk_level == risk_level)
+    if after is not None:
+        position = tuple_(*keys) if len(keys) > 1 else keys[0]
+        bound = tuple_(*after) if len(keys) > 1 else after[1]
+        statement = statement.where(position < bound if order == "desc" else position > bound)
+    return statement.order_by(*(key.desc() if order == "desc" else key.asc() for key in keys)).limit(limit)
 
 
 class TrackerService:
@@ -13,6 +85,12 @@ class TrackerService:
     Service for managing Tracker entities and their holdings.
     """
     
+    def __init__(self, returns_path: Optional[str] = None):
+        self.catalog_cache = CatalogCache()
+        # Watched for backtest runs (see returns_store; not imported, it loads polars)
+        self.returns_path = returns_path or settings.RETURNS_STORE_PATH
+        self._returns_version: Optional[int] = None
+    
     def get_all_trackers(self, session: Session) -> List[Tracker]:
         """
         Fetch all available trackers (Marketplace view).
@@ -21,6 +99,39 @@ class TrackerService:
         trackers = session.exec(statement).all()
         return list(trackers)
     
+    def list_trackers(
+        self,
+        session: Session,
+        tracker_type: Optional[str] = None,
+        risk_level: Optional[str] = None,
+        sort: str = "id",
+        order: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        include_holdings: bool = False
+    ) -> Tuple[List[Tracker], Optional[str]]:
+        """
+        One page of the marketplace, filtered and sorted, using keyset
+        pagination. `order` defaults to ascending for id and descending for
+        the metrics. Returns the trackers and the cursor of the next page
+        (None on the last page). Raises ValueError for a bad cursor.
+        
+        With include_holdings, the holdings of the whole page are loaded in
+        one extra SELECT ... WHERE tracker_id IN (...) query.
+        """
+        order = _resolve_order(sort, order)
+        after = decode_cursor(cursor, sort, order) if cursor else None
+        statement = _marketplace_statement(tracker_type, risk_level, sort, order, after, limit + 1)
+        if include_holdings:
+            statement = statement.options(selectinload(Tracker.holdings))
+        trackers = list(session.exec(statement).all())
+        
+        next_cursor = None
+        if len(trackers) > limit:
+            trackers = trackers[:limit]
+            next_cursor = encode_cursor(sort, order, trackers[-1])
+        return trackers, next_cursor
+    
     def get_tracker_by_id(self, tracker_id: int, session: Session) -> Optional[Tracker]:
         """
         Fetch a specific tracker with detailed information.
@@ -35,7 +146,146 @@ class TrackerService:
         statement = select(TrackerHolding).where(TrackerHolding.tracker_id == tracker_id)
         holdings = session.exec(statement).all()
         return list(holdings)
+    
+    # Cached, pre-serialized catalog reads used by the API
+    
+    def list_trackers_json(
+        self,
+        session: Session,
+        tracker_type: Optional[str] = None,
+        risk_level: Optional[str] = None,
+        sort: str = "id",
+        order: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        include_holdings: bool = False
+    ) -> CachedJSON:
+        """
+        A marketplace page as JSON bytes with an ETag and the next cursor;
+        only hits the database when the catalog changed or the entry expired.
+        With include_holdings each tracker embeds its "holdings" list.
+        """
+        order = _resolve_order(sort, order)
+        
+        def load():
+            trackers, next_cursor = self.list_trackers(
+                session, tracker_type, risk_level, sort, order, limit, cursor, include_holdings
+            )
+            return [_dump_tracker(tracker, include_holdings) for tracker in trackers], next_cursor
+        key = ("trackers", tracker_type, risk_level, sort, order, limit, cursor, include_holdings)
+        return self._cached(key, load)
+    
+    def get_tracker_json(self, tracker_id: int, session: Session) -> Optional[CachedJSON]:
+        """Cached tracker detail, or None if the tracker doesn't exist."""
+        def load():
+            tracker = self.get_tracker_by_id(tracker_id, session)
+            return (_dump_tracker(tracker), None) if tracker else None
+        return self._cached(("tracker", tracker_id), load)
+    
+    def get_tracker_holdings_json(self, tracker_id: int, session: Session) -> Optional[CachedJSON]:
+        """Cached tracker holdings, or None if the tracker doesn't exist."""
+        def load():
+            if self.get_tracker_by_id(tracker_id, session) is None:
+                return None
+            return [holding.model_dump(mode="json") for holding in self.get_tracker_holdings(tracker_id, session)], None
+        return self._cached(("holdings", tracker_id), load)
+    
+    def get_holding_periods_json(self, tracker_id: int, session: Session) -> Optional[CachedJSON]:
+        """Cached snapshot periods (newest first), or None if the tracker doesn't exist."""
+        def load():
+            if self.get_tracker_by_id(tracker_id, session) is None:
+                return None
+            return [period.isoformat() for period in holding_history_service.get_periods(tracker_id, session)], None
+        return self._cached(("holding_periods", tracker_id), load)
+    
+    def get_holdings_diff_json(
+        self,
+        tracker_id: int,
+        session: Session,
+        from_period: Optional[date] = None,
+        to_period: Optional[date] = None
+    ) -> Optional[CachedJSON]:
+        """
+        Cached holdings diff between two periods (default: the latest filing
+        against the one before), or None if the tracker doesn't exist.
+        Raises ValueError for a period without a snapshot.
+        """
+        def load():
+            if self.get_tracker_by_id(tracker_id, session) is None:
+                return None
+            return holding_history_service.get_diff(tracker_id, session, from_period, to_period), None
+        return self._cached(("holdings_diff", tracker_id, from_period, to_period), load)
+    
+    def invalidate_catalog(self) -> None:
+        """
+        Drops every cached catalog response. Commits through an ORM session
+        do this automatically; call it after writing trackers or holdings
+        any other way.
+        """
+        self.catalog_cache.bump()
+    
+    def _check_backtest(self) -> None:
+        """
+        Drops the cached catalog once the backtest job, which runs in its own
+        process, has replaced the returns store: it commits the new
+        ytd_return values just before.
+        """
+        try:
+            version = os.stat(self.returns_path).st_mtime_ns
+        except FileNotFoundError:
+            version = 0
+        if version != self._returns_version:
+            if self._returns_version is not None:
+                self.catalog_cache.bump()
+            self._returns_version = version
+    
+    def _cached(
+        self,
+        key: Hashable,
+        load: Callable[[], Optional[Tuple[Any, Optional[str]]]]
+    ) -> Optional[CachedJSON]:
+        """Returns the cached entry for `key`, or stores what `load` returns: (payload, next_cursor) or None."""
+        self._check_backtest()
+        entry = self.catalog_cache.get(key)
+        if entry is not None:
+            return entry
+        version = self.catalog_cache.version
+        loaded = load()
+        if loaded is None:
+            return None
+        payload, next_cursor = loaded
+        return self.catalog_cache.put(key, _to_json(payload), version, next_cursor)
 
 
 # Singleton instance
 tracker_service = TrackerService()
+
+
+# Catalog invalidation: any ORM session (sync, or the one behind an
+# AsyncSession) that writes trackers, holdings or their snapshots bumps the catalog version
+# once its transaction commits.
+
+@event.listens_for(OrmSession, "after_flush")
+def _flag_catalog_flush(session, flush_context):
+    if any(isinstance(obj, CATALOG_MODELS) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info["catalog_changed"] = True
+
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _flag_catalog_statement(orm_execute_state):
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, CATALOG_MODELS):
+        orm_execute_state.session.info["catalog_changed"] = True
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _bump_catalog_version(session):
+    if session.info.pop("catalog_changed", False):
+        tracker_service.invalidate_catalog()
+
+
+@event.listens_for(OrmSession, "after_soft_rollback")
+def _reset_catalog_flag(session, previous_transaction):
+    session.info.pop("catalog_changed", None)
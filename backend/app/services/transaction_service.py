@@ -3,11 +3,40 @@ Transaction Service
 
 Handles transaction history and records.
 """
-from typing import List, Dict
+from typing import List, Dict, Optional
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.models import Transaction, Tracker
 
 
+def _user_transactions_statement(user_id: int, limit: Optional[int] = None):
+    """Query transactions with tracker info, newest first."""
+    statement = select(Transaction, Tracker).join(
+        Tracker, Transaction.tracker_id == Tracker.id
+    ).where(
+        Transaction.user_id == user_id
+    ).order_by(Transaction.timestamp.desc())
+    
+    if limit:
+        statement = statement.limit(limit)
+    return statement
+
+
+def _serialize_transactions(results) -> List[Dict]:
+    """Turns (Transaction, Tracker) rows into response dictionaries."""
+    transactions = []
+    for transaction, tracker in results:
+        transactions.append({
+            "id": transaction.id,
+            "type": transaction.type,
+            "tracker_id": transaction.tracker_id,
+            "tracker_name": tracker.name,
+            "amount_clp": transaction.amount_clp,
+            "timestamp": transaction.timestamp.isoformat()
+        })
+    return transactions
+
+
 class TransactionService:
     """
     Service for managing transaction history.
@@ -30,31 +59,28 @@ class TransactionService:
         Returns:
             List of transaction dictionaries with tracker names
         """
-        # Query transactions with tracker info
-        statement = select(Transaction, Tracker).join(
-            Tracker, Transaction.tracker_id == Tracker.id
-        ).where(
-            Transaction.user_id == user_id
-        ).order_by(Transaction.timestamp.desc())
-        
-        if limit:
-            statement = statement.limit(limit)
-        
-        results = session.exec(statement).all()
-        
-        transactions = []
-        for transaction, tracker in results:
-            transactions.append({
-                "id": transaction.id,
-                "type": transaction.type,
-                "tracker_id": transaction.tracker_id,
-                "tracker_name": tracker.name,
-                "amount_clp": transaction.amount_clp,
-                "timestamp": transaction.timestamp.isoformat()
-            })
-        
-        return transactions
+        results = session.exec(_user_transactions_statement(user_id, limit)).all()
+        return _serialize_transactions(results)
+
+
+class AsyncTransactionService:
+    """
+    Async counterpart of TransactionService for use with an AsyncSession.
+    """
+    
+    async def get_user_transactions(
+        self,
+        user_id: int,
+        session: AsyncSession,
+        limit: int = None
+    ) -> List[Dict]:
+        """
+        Get transaction history for a user without blocking the event loop.
+        """
+        results = (await session.exec(_user_transactions_statement(user_id, limit))).all()
+        return _serialize_transactions(results)
 
 
-# Singleton instance
+# Singleton instances
 transaction_service = TransactionService()
+async_transaction_service = AsyncTransactionService()
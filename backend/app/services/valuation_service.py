@@ -0,0 +1,157 @@
+"""
+Valuation Service
+
+Marks positions to market from a PriceSnapshot and rolls the results up
+into PortfolioItem.current_value_clp and PortfolioSummary.
+
+Everything is set-based: each step is an UPDATE ... FROM over a primary-key
+range, so no rows are loaded into Python and each chunk is a short
+transaction. A full run is two passes:
+
+1. Per range of portfolio items, in one transaction:
+   PortfolioItem.current_value_clp += the change in its positions' value, then
+   Position.market_value_clp = shares x close x USD_CLP_RATE, for positions
+   whose ticker has a price on the given day (others keep their last value);
+2. PortfolioSummary.total_current_value_clp = the sum of the user's items.
+
+Items are moved by the change in their positions rather than set to their
+sum, because an item invested before positions were tracked holds value that
+no Position row represents. Both updates of a range commit together, so
+re-running a day after a crash never applies a change twice.
+"""
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models import PortfolioItem, PortfolioSummary, Position, PriceSnapshot
+
+
+def _id_ranges(session: Session, column, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """Half-open [first, last) ranges of `column` covering every row, chunk_size ids wide."""
+    low, high = session.exec(select(func.min(column), func.max(column))).one()
+    if low is None:
+        return
+    for first in range(low, high + 1, chunk_size):
+        yield first, first + chunk_size
+
+
+def _reprice_statement(as_of: date, first_id: int, last_id: int):
+    return (
+        update(Position)
+        .where(
+            Position.ticker == PriceSnapshot.ticker,
+            PriceSnapshot.as_of == as_of,
+            Position.portfolio_item_id >= first_id,
+            Position.portfolio_item_id < last_id
+        )
+        .values(
+            market_value_clp=Position.shares * PriceSnapshot.close_usd * settings.USD_CLP_RATE,
+            updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _rollup_items_statement(as_of: date, first_id: int, last_id: int):
+    """Adds to each item the change _reprice_statement is about to make to its positions."""
+    changes = (
+        select(
+            Position.portfolio_item_id,
+            func.sum(
+                Position.shares * PriceSnapshot.close_usd * settings.USD_CLP_RATE - Position.market_value_clp
+            ).label("change_clp")
+        )
+        .where(
+            Position.ticker == PriceSnapshot.ticker,
+            PriceSnapshot.as_of == as_of,
+            Position.portfolio_item_id >= first_id,
+            Position.portfolio_item_id < last_id
+        )
+        .group_by(Position.portfolio_item_id)
+        .subquery()
+    )
+    return (
+        update(PortfolioItem)
+        .where(PortfolioItem.id == changes.c.portfolio_item_id)
+        .values(current_value_clp=PortfolioItem.current_value_clp + changes.c.change_clp)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _rollup_summaries_statement(first_id: int, last_id: int):
+    totals = (
+        select(PortfolioItem.user_id, func.sum(PortfolioItem.current_value_clp).label("value_clp"))
+        .where(PortfolioItem.user_id >= first_id, PortfolioItem.user_id < last_id)
+        .group_by(PortfolioItem.user_id)
+        .subquery()
+    )
+    return (
+        update(PortfolioSummary)
+        .where(PortfolioSummary.user_id == totals.c.user_id)
+        .values(total_current_value_clp=totals.c.value_clp, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _price_upsert_statement(dialect_name: str):
+    if dialect_name == "postgresql":
+        statement = postgresql.insert(PriceSnapshot)
+    elif dialect_name == "sqlite":
+        statement = sqlite.insert(PriceSnapshot)
+    else:
+        return insert(PriceSnapshot)
+    return statement.on_conflict_do_update(
+        index_elements=["as_of", "ticker"], set_={"close_usd": statement.excluded.close_usd}
+    )
+
+
+@dataclass
+class ValuationReport:
+    as_of: date
+    positions: int = 0
+    portfolio_items: int = 0
+    summaries: int = 0
+    elapsed_seconds: float = 0.0
+
+
+class ValuationService:
+    """
+    Bulk mark-to-market of every position. revalue commits after each chunk,
+    so it runs in its own session (see app.jobs.revalue).
+    """
+
+    def store_prices(self, as_of: date, prices: Dict[str, float], session: Session) -> int:
+        """Saves (or replaces) the closing prices for `as_of`. The caller commits."""
+        rows = [{"as_of": as_of, "ticker": ticker, "close_usd": price} for ticker, price in prices.items()]
+        if rows:
+            session.exec(_price_upsert_statement(session.get_bind().dialect.name), params=rows)
+        return len(rows)
+
+    def position_tickers(self, session: Session) -> List[str]:
+        """Every ticker with an open position, i.e. what needs a price."""
+        return list(session.exec(select(Position.ticker).distinct().order_by(Position.ticker)).all())
+
+    def revalue(self, as_of: date, session: Session, chunk_size: Optional[int] = None) -> ValuationReport:
+        """Reprices every position from the `as_of` prices and rolls the totals up."""
+        chunk_size = chunk_size or settings.VALUATION_CHUNK_SIZE
+        report = ValuationReport(as_of)
+        started = time.perf_counter()
+
+        for first, last in _id_ranges(session, Position.portfolio_item_id, chunk_size):
+            report.portfolio_items += session.exec(_rollup_items_statement(as_of, first, last)).rowcount
+            report.positions += session.exec(_reprice_statement(as_of, first, last)).rowcount
+            session.commit()
+        for first, last in _id_ranges(session, PortfolioItem.user_id, chunk_size):
+            report.summaries += session.exec(_rollup_summaries_statement(first, last)).rowcount
+            session.commit()
+
+        report.elapsed_seconds = time.perf_counter() - started
+        return report
+
+
+# Singleton instance
+valuation_service = ValuationService()
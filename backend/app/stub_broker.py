@@ -0,0 +1,58 @@
+"""
+Stand-in Broker Server
+
+A tiny HTTP broker used for DEVELOPMENT and TESTS when BROKER_MODE=http.
+It exposes the same quote/order shapes as MockBrokerService over HTTP so the
+pooled HttpBrokerService client can be exercised without a real broker.
+
+How to run:
+    uvicorn app.stub_broker:app --port 8001
+
+Then start the API with BROKER_MODE=http and BROKER_URL=http://localhost:8001.
+"""
+import asyncio
+from typing import List
+from fastapi import FastAPI
+from pydantic import BaseModel
+from app.services.broker_service import MockBrokerService
+
+
+class OrderRequest(BaseModel):
+    ticker: str
+    shares: float
+    action: str = "buy"
+
+
+class BatchOrderRequest(BaseModel):
+    orders: List[OrderRequest]
+
+
+def create_app(latency_seconds: float = 0.5) -> FastAPI:
+    """
+    Builds the stand-in broker. `latency_seconds` is paid once per request,
+    which is what makes batching orders worthwhile.
+    """
+    broker = MockBrokerService()
+    stub = FastAPI(title="Hedgie Stub Broker")
+
+    @stub.get("/quotes")
+    async def get_quotes(tickers: str):
+        return {"prices": await broker.get_current_prices(tickers.split(","))}
+
+    @stub.get("/quotes/{ticker}")
+    async def get_quote(ticker: str):
+        return {"ticker": ticker, "price": await broker.get_current_price(ticker)}
+
+    @stub.post("/orders/batch")
+    async def place_orders(request: BatchOrderRequest):
+        await asyncio.sleep(latency_seconds)
+        fills = [
+            await broker._fill(order.ticker, order.shares, order.action)
+            for order in request.orders
+        ]
+        return {"fills": fills}
+
+    return stub
+
+
+app = create_app()
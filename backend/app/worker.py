@@ -0,0 +1,41 @@
+"""
+Standalone Order Worker
+
+Runs the order worker pool outside the API process, so order execution can be
+scaled independently of the HTTP servers. Start the API with ORDER_WORKERS=0
+and run as many of these as needed; on Postgres they claim disjoint batches.
+
+How to run:
+    ORDER_WORKERS=4 python -m app.worker
+
+Stops cleanly on SIGINT/SIGTERM after finishing the batches in flight.
+"""
+import asyncio
+import signal
+from app.core.config import settings
+from app.services import broker_service
+from app.services.order_worker import OrderWorkerPool
+
+
+async def run() -> None:
+    pool = OrderWorkerPool(workers=max(settings.ORDER_WORKERS, 1))
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    pool.start()
+    print(f"Order worker running with {pool.workers} workers (batch size {pool.batch_size})")
+    await stop.wait()
+    
+    await pool.stop()
+    await broker_service.aclose()
+    print("Order worker stopped")
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
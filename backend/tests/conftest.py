@@ -2,45 +2,131 @@
 Pytest configuration and shared fixtures.
 """
 import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import Session, SQLModel, create_engine
-from sqlmodel.pool import StaticPool
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi.testclient import TestClient
 
 from app.main import app
-from app.core.db import get_session
+from app.core.db import get_session, get_async_session
 from app.models import User, Tracker, TrackerHolding, PortfolioItem, Transaction
+from app.services import tracker_service
+from app.services.price_store import price_store
+from app.services.returns_store import returns_store
+from app.services.chart_service import chart_service
+from app.services.order_worker import OrderWorkerPool
 
 
-@pytest.fixture(name="session")
-def session_fixture():
+@pytest.fixture
+def anyio_backend():
     """
-    Create an in-memory SQLite database for testing.
-    Each test gets a fresh database session.
+    Run async tests on asyncio only, matching uvicorn and the broker simulation.
+    """
+    return "asyncio"
+
+
+@pytest.fixture(name="db_path")
+def db_path_fixture(tmp_path):
+    """
+    Path of a fresh SQLite database for each test.
+    A file (rather than :memory:) lets the sync and async engines share it.
     """
+    return tmp_path / "test.db"
+
+
+@pytest.fixture(name="engine")
+def engine_fixture(db_path):
     engine = create_engine(
-        "sqlite:///:memory:",
+        f"sqlite:///{db_path}",
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
     )
     SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(name="async_engine")
+def async_engine_fixture(engine, db_path):
+    """
+    Async engine on the same database as `engine`.
+    NullPool: connections must not outlive the event loop that opened them.
+    """
+    return create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+
+
+@pytest.fixture(name="session")
+def session_fixture(engine):
+    """
+    Each test gets a fresh database session.
+    """
     with Session(engine) as session:
         yield session
 
 
+@pytest.fixture(name="async_session")
+async def async_session_fixture(async_engine):
+    """
+    AsyncSession on the test database, for async service tests.
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 @pytest.fixture(name="client")
-def client_fixture(session: Session):
+def client_fixture(session: Session, async_engine):
     """
     Create a FastAPI test client with the test database session.
     """
     def get_session_override():
         return session
 
+    async def get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_async_session] = get_async_session_override
+    # Cached catalog responses belong to the previous test's database
+    tracker_service.invalidate_catalog()
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(name="order_workers")
+def order_workers_fixture(async_engine):
+    """
+    Order worker pool on the test database. Tests drain the queue explicitly
+    (the TestClient doesn't run the app lifespan, so no workers are started).
+    """
+    return OrderWorkerPool(
+        workers=1,
+        poll_interval=0.01,
+        session_factory=lambda: AsyncSession(async_engine, expire_on_commit=False)
+    )
+
+
+@pytest.fixture(name="prices")
+def prices_fixture(tmp_path, monkeypatch):
+    """
+    The price store singleton, pointed at an empty directory for the test.
+    """
+    monkeypatch.setattr(price_store, "root", str(tmp_path / "prices"))
+    return price_store
+
+
+@pytest.fixture(name="returns")
+def returns_fixture(tmp_path, monkeypatch):
+    """
+    The returns store singleton, writing to a file under the test's directory,
+    with no chart cached from another test.
+    """
+    monkeypatch.setattr(returns_store, "path", str(tmp_path / "tracker_returns.parquet"))
+    chart_service.cache.bump()
+    return returns_store
+
+
 @pytest.fixture
 def mock_user(session: Session):
     """
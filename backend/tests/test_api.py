@@ -1,10 +1,25 @@
 """
 Tests for API endpoints.
 """
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import uuid
+from datetime import date, timedelta
+import numpy as np
+import polars as pl
 import pytest
+from sqlalchemy import event
 from fastapi.testclient import TestClient
-from sqlmodel import Session
-from app.models import User, Tracker, PortfolioItem
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models import User, Tracker, PortfolioItem, Transaction, InvestmentOrder
+from app.services import broker_service, holding_history_service
+from app.services.order_worker import OrderWorkerPool
+from app.services.price_store import PriceStore
+from app.services.chart_service import chart_service
 
 
 class TestAuthEndpoints:
@@ -101,6 +116,103 @@ class TestTrackerEndpoints:
         assert response.status_code == 200
         data = response.json()
         assert len(data) == 0
+    
+    def test_get_trackers_filtered_and_paginated(self, client: TestClient, session: Session, mock_tracker_pelosi: Tracker, mock_tracker_buffett: Tracker):
+        """Test filtering, sorting and following the X-Next-Cursor header."""
+        first = client.get("/api/v1/trackers", params={"sort": "followers_count", "limit": 1})
+        assert first.status_code == 200
+        assert [t["name"] for t in first.json()] == ["Warren Buffett"]
+        
+        second = client.get("/api/v1/trackers", params={"sort": "followers_count", "limit": 1, "cursor": first.headers["X-Next-Cursor"]})
+        assert [t["name"] for t in second.json()] == ["Nancy Pelosi"]
+        assert "X-Next-Cursor" not in second.headers
+        
+        funds = client.get("/api/v1/trackers", params={"type": "fund"})
+        assert [t["name"] for t in funds.json()] == ["Warren Buffett"]
+    
+    def test_get_trackers_include_holdings(self, client: TestClient, mock_tracker_with_holdings: Tracker, mock_tracker_buffett: Tracker):
+        """Test that include=holdings nests each tracker's holdings."""
+        response = client.get("/api/v1/trackers", params={"include": "holdings"})
+        
+        assert response.status_code == 200
+        by_name = {t["name"]: t for t in response.json()}
+        assert sorted(h["ticker"] for h in by_name["Nancy Pelosi"]["holdings"]) == ["AAPL", "MSFT", "NVDA"]
+        assert by_name["Warren Buffett"]["holdings"] == []
+        assert "holdings" not in client.get("/api/v1/trackers").json()[0]
+    
+    def test_get_trackers_invalid_params(self, client: TestClient):
+        """Test that unknown sort keys and malformed cursors are rejected."""
+        assert client.get("/api/v1/trackers", params={"sort": "name"}).status_code == 422
+        assert client.get("/api/v1/trackers", params={"cursor": "garbage"}).status_code == 400
+    
+    def test_catalog_not_modified(self, client: TestClient, engine, mock_tracker_with_holdings: Tracker):
+        """Test that a matching If-None-Match gets a 304 without touching the database."""
+        paths = ["/api/v1/trackers", f"/api/v1/trackers/{mock_tracker_with_holdings.id}", f"/api/v1/trackers/{mock_tracker_with_holdings.id}/holdings"]
+        etags = {path: client.get(path).headers["ETag"] for path in paths}
+        
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            responses = [client.get(path, headers={"If-None-Match": etags[path]}) for path in paths]
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        
+        assert [response.status_code for response in responses] == [304, 304, 304]
+        assert [response.headers["ETag"] for response in responses] == [etags[path] for path in paths]
+        assert statements == []
+    
+    def test_catalog_write_changes_etag(self, client: TestClient, session: Session, mock_tracker_pelosi: Tracker):
+        """Test that committing a tracker change invalidates the cached response."""
+        first = client.get(f"/api/v1/trackers/{mock_tracker_pelosi.id}")
+        
+        mock_tracker_pelosi.ytd_return = 40.0
+        session.add(mock_tracker_pelosi)
+        session.commit()
+        response = client.get(f"/api/v1/trackers/{mock_tracker_pelosi.id}", headers={"If-None-Match": first.headers["ETag"]})
+        
+        assert response.status_code == 200
+        assert response.json()["ytd_return"] == 40.0
+        assert response.headers["ETag"] != first.headers["ETag"]
+    
+    def test_get_tracker_holdings_diff(self, client: TestClient, session: Session, mock_tracker_buffett: Tracker):
+        """Test the latest-filing diff and an explicit period range."""
+        holdings = [
+            [{"ticker": "AAPL", "company_name": "Apple", "allocation_percent": 60.0},
+             {"ticker": "KO", "company_name": "Coca-Cola", "allocation_percent": 40.0}],
+            [{"ticker": "AAPL", "company_name": "Apple", "allocation_percent": 70.0},
+             {"ticker": "OXY", "company_name": "Occidental", "allocation_percent": 30.0}],
+        ]
+        holding_history_service.record_snapshot(mock_tracker_buffett.id, date(2025, 3, 31), holdings[0], session)
+        holding_history_service.record_snapshot(mock_tracker_buffett.id, date(2025, 6, 30), holdings[1], session)
+        session.commit()
+        
+        periods = client.get(f"/api/v1/trackers/{mock_tracker_buffett.id}/holdings/periods")
+        assert periods.json() == ["2025-06-30", "2025-03-31"]
+        
+        response = client.get(f"/api/v1/trackers/{mock_tracker_buffett.id}/holdings/diff")
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["from_period"], data["to_period"]) == ("2025-03-31", "2025-06-30")
+        assert [(c["ticker"], c["change"]) for c in data["changes"]] == [("OXY", "added"), ("KO", "removed"), ("AAPL", "reweighted")]
+        
+        etag = response.headers["etag"]
+        assert client.get(
+            f"/api/v1/trackers/{mock_tracker_buffett.id}/holdings/diff", headers={"If-None-Match": etag}
+        ).status_code == 304
+        
+        reverse = client.get(
+            f"/api/v1/trackers/{mock_tracker_buffett.id}/holdings/diff",
+            params={"from": "2025-06-30", "to": "2025-03-31"}
+        ).json()
+        assert [(c["ticker"], c["change"]) for c in reverse["changes"]] == [("KO", "added"), ("OXY", "removed"), ("AAPL", "reweighted")]
+    
+    def test_get_tracker_holdings_diff_errors(self, client: TestClient, mock_tracker_buffett: Tracker):
+        """Test unknown trackers and periods."""
+        assert client.get("/api/v1/trackers/999/holdings/diff").status_code == 404
+        response = client.get(f"/api/v1/trackers/{mock_tracker_buffett.id}/holdings/diff", params={"to": "2024-12-31"})
+        assert response.status_code == 400
 
 
 class TestInvestmentEndpoints:
@@ -117,15 +229,68 @@ class TestInvestmentEndpoints:
             }
         )
         
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = response.json()
         assert data["success"] is True
+        assert data["status"] == "queued"
         assert data["remaining_balance"] == 950_000
         
         # Verify user balance was updated
         session.refresh(mock_user)
         assert mock_user.balance_clp == 950_000
     
+    def test_invest_is_executed_by_workers(self, client: TestClient, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker, order_workers: OrderWorkerPool):
+        """Test that a queued investment is filled once the workers drain the queue."""
+        response = client.post(
+            "/api/v1/invest",
+            json={
+                "user_id": mock_user.id,
+                "tracker_id": mock_tracker_with_holdings.id,
+                "amount_clp": 50_000
+            }
+        )
+        order_id = response.json()["order_id"]
+        assert client.get(f"/api/v1/invest/orders/{order_id}").json()["status"] == "queued"
+        assert session.exec(select(Transaction)).first() is None
+        
+        assert asyncio.run(order_workers.drain()) == 1
+        
+        order = client.get(f"/api/v1/invest/orders/{order_id}").json()
+        assert order["status"] == "filled"
+        assert len(order["result"]["fills"]) == 3
+        assert session.exec(select(PortfolioItem)).one().invested_amount_clp == 50_000
+        assert session.exec(select(Transaction)).one().amount_clp == 50_000
+    
+    def test_failed_order_is_refunded(self, client: TestClient, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker, order_workers: OrderWorkerPool, monkeypatch):
+        """Test that an order the broker can't fill is marked failed and refunded."""
+        async def broker_down(orders):
+            raise RuntimeError("broker unavailable")
+        monkeypatch.setattr(broker_service, "execute_trades", broker_down)
+        
+        response = client.post(
+            "/api/v1/invest",
+            json={
+                "user_id": mock_user.id,
+                "tracker_id": mock_tracker_with_holdings.id,
+                "amount_clp": 50_000
+            }
+        )
+        order_id = response.json()["order_id"]
+        
+        asyncio.run(order_workers.drain())
+        
+        order = client.get(f"/api/v1/invest/orders/{order_id}").json()
+        assert order["status"] == "failed"
+        assert order["error"]
+        session.refresh(mock_user)
+        assert mock_user.balance_clp == 1_000_000
+    
+    def test_order_status_not_found(self, client: TestClient):
+        """Test polling a non-existent order."""
+        response = client.get("/api/v1/invest/orders/999")
+        
+        assert response.status_code == 404
+    
     def test_invest_insufficient_funds(self, client: TestClient, session: Session, mock_user_low_balance: User, mock_tracker_pelosi: Tracker):
         """Test investment with insufficient funds."""
         response = client.post(
@@ -238,10 +403,358 @@ class TestPortfolioEndpoints:
         assert len(data["active_trackers"]) == 2
 
 
+class TestUserEndpoints:
+    """Tests for deposit/withdraw endpoints."""
+    
+    def test_deposit(self, client: TestClient, mock_user: User):
+        """Test depositing funds."""
+        response = client.post(f"/api/v1/user/{mock_user.id}/deposit", json={"amount_clp": 5_000})
+        
+        assert response.status_code == 200
+        assert response.json()["balance_clp"] == 1_005_000
+    
+    def test_withdraw(self, client: TestClient, mock_user: User):
+        """Test withdrawing funds."""
+        response = client.post(f"/api/v1/user/{mock_user.id}/withdraw", json={"amount_clp": 200_000})
+        
+        assert response.status_code == 200
+        assert response.json()["balance_clp"] == 800_000
+        assert response.json()["name"] == "Test User"
+    
+    def test_withdraw_insufficient_balance(self, client: TestClient, mock_user_low_balance: User):
+        """Test that overdrafts are rejected and the balance is unchanged."""
+        response = client.post(f"/api/v1/user/{mock_user_low_balance.id}/withdraw", json={"amount_clp": 50_000})
+        
+        assert response.status_code == 400
+        assert "Insufficient balance" in response.json()["detail"]
+        assert client.get(f"/api/v1/user/{mock_user_low_balance.id}/balance").json()["balance_clp"] == 20_000
+    
+    def test_withdraw_user_not_found(self, client: TestClient):
+        """Test withdrawing from a non-existent user."""
+        response = client.post("/api/v1/user/999/withdraw", json={"amount_clp": 1_000})
+        
+        assert response.status_code == 404
+
+
+class TestIdempotency:
+    """Tests for Idempotency-Key handling on money-moving endpoints."""
+    
+    def test_invest_retry_replays_response(self, client: TestClient, session: Session, mock_user: User, mock_tracker_pelosi: Tracker):
+        """Test that a retried investment is not executed twice."""
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        body = {"user_id": mock_user.id, "tracker_id": mock_tracker_pelosi.id, "amount_clp": 100_000}
+        
+        first = client.post("/api/v1/invest", json=body, headers=headers)
+        retry = client.post("/api/v1/invest", json=body, headers=headers)
+        
+        assert first.status_code == 202
+        assert retry.status_code == 202
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        session.refresh(mock_user)
+        assert mock_user.balance_clp == 900_000
+        assert len(session.exec(select(InvestmentOrder)).all()) == 1
+    
+    def test_key_reuse_with_different_body(self, client: TestClient, mock_user: User, mock_tracker_pelosi: Tracker):
+        """Test that reusing a key for a different request is rejected."""
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        body = {"user_id": mock_user.id, "tracker_id": mock_tracker_pelosi.id, "amount_clp": 100_000}
+        
+        client.post("/api/v1/invest", json=body, headers=headers)
+        response = client.post("/api/v1/invest", json={**body, "amount_clp": 200_000}, headers=headers)
+        
+        assert response.status_code == 422
+    
+    def test_failed_request_is_replayed(self, client: TestClient, mock_user_low_balance: User, mock_tracker_pelosi: Tracker):
+        """Test that deterministic 4xx responses are stored too."""
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        body = {"user_id": mock_user_low_balance.id, "tracker_id": mock_tracker_pelosi.id, "amount_clp": 50_000}
+        
+        first = client.post("/api/v1/invest", json=body, headers=headers)
+        retry = client.post("/api/v1/invest", json=body, headers=headers)
+        
+        assert first.status_code == 400
+        assert retry.status_code == 400
+        assert retry.json() == first.json()
+    
+    def test_deposit_and_withdraw_retries(self, client: TestClient, session: Session, mock_user: User):
+        """Test that retried deposits and withdrawals apply once."""
+        deposit_key = {"Idempotency-Key": str(uuid.uuid4())}
+        withdraw_key = {"Idempotency-Key": str(uuid.uuid4())}
+        
+        for _ in range(3):
+            client.post(f"/api/v1/user/{mock_user.id}/deposit", json={"amount_clp": 10_000}, headers=deposit_key)
+            client.post(f"/api/v1/user/{mock_user.id}/withdraw", json={"amount_clp": 4_000}, headers=withdraw_key)
+        
+        session.refresh(mock_user)
+        assert mock_user.balance_clp == 1_006_000
+
+
+class TestMetricsEndpoint:
+    """Tests for the metrics endpoint."""
+    
+    def test_metrics_exposes_quote_cache_counters(self, client: TestClient):
+        """Test that quote cache counters are scrapeable."""
+        response = client.get("/api/v1/metrics")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "hedgie_quote_cache_hits_total" in response.text
+        assert "hedgie_quote_cache_misses_total" in response.text
+
+
+class TestPriceEndpoints:
+    """Tests for the price history endpoint."""
+    
+    def test_price_matrix(self, client: TestClient, prices: PriceStore):
+        """Test that prices come back column-wise on a shared date axis."""
+        prices.write("AAPL", pl.DataFrame({"date": [date(2025, 1, 2), date(2025, 1, 3)], "close": [1.0, 2.0]}))
+        prices.write("MSFT", pl.DataFrame({"date": [date(2025, 1, 3)], "close": [5.0]}))
+        
+        response = client.get("/api/v1/prices", params={"tickers": "msft,AAPL,NOPE", "end": "2025-01-03"})
+        
+        assert response.status_code == 200
+        assert response.json() == {
+            "tickers": ["MSFT", "AAPL"],
+            "dates": ["2025-01-02", "2025-01-03"],
+            "prices": {"MSFT": [None, 5.0], "AAPL": [1.0, 2.0]},
+        }
+    
+    def test_price_matrix_errors(self, client: TestClient, prices: PriceStore):
+        """Test that unknown and malformed tickers are rejected."""
+        assert client.get("/api/v1/prices", params={"tickers": "NOPE"}).status_code == 404
+        assert client.get("/api/v1/prices", params={"tickers": " , "}).status_code == 400
+        assert client.get("/api/v1/prices", params={"tickers": "../x"}).status_code == 400
+
+
+class TestChartEndpoints:
+    """Tests for the tracker performance chart."""
+    
+    def _write_series(self, returns, tracker_id: int, values):
+        days = [date(2024, 12, 30) + timedelta(days=i) for i in range(len(values))]
+        returns.write(pl.DataFrame({"tracker_id": [tracker_id] * len(values), "date": days, "value": values}))
+    
+    def test_chart_is_derived_from_backtest(self, client: TestClient, returns, mock_tracker_pelosi: Tracker):
+        """Test that the chart plots the backtested series over the requested range."""
+        self._write_series(returns, mock_tracker_pelosi.id, [1.0, 1.1, 1.21])
+        
+        response = client.get(f"/api/v1/chart/trackers/{mock_tracker_pelosi.id}")
+        
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["tracker_id"], body["range"]) == (mock_tracker_pelosi.id, "ytd")
+        assert body["spec"]["data"] == {"name": "series"}
+        assert body["spec"]["mark"]["type"] == "area"
+        assert body["spec"]["datasets"]["series"] == [{"x": "2024-12-31", "y": 0.0}, {"x": "2025-01-01", "y": 10.0}]
+        
+        full = client.get(f"/api/v1/chart/trackers/{mock_tracker_pelosi.id}", params={"range": "max"}).json()
+        assert [point["y"] for point in full["spec"]["datasets"]["series"]] == [0.0, 10.0, 21.0]
+    
+    def test_chart_cache_follows_backtest_runs(self, client: TestClient, returns, mock_tracker_pelosi: Tracker):
+        """Test that charts are cached until the returns store is rewritten, with ETag revalidation."""
+        url = f"/api/v1/chart/trackers/{mock_tracker_pelosi.id}"
+        self._write_series(returns, mock_tracker_pelosi.id, [1.0, 1.1, 1.21])
+        misses = chart_service.cache.misses
+        
+        first = client.get(url)
+        assert client.get(url, headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+        assert chart_service.cache.misses == misses + 1
+        
+        os.utime(returns.path, ns=(0, 0))  # A later run replaces the file
+        self._write_series(returns, mock_tracker_pelosi.id, [1.0, 1.0, 2.0])
+        
+        second = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+        assert second.status_code == 200
+        assert second.json()["spec"]["datasets"]["series"][-1] == {"x": "2025-01-01", "y": 100.0}
+    
+    def test_chart_is_downsampled(self, client: TestClient, returns, mock_tracker_pelosi: Tracker):
+        """Test that long histories are cut to max_points, keeping both ends."""
+        self._write_series(returns, mock_tracker_pelosi.id, list(np.linspace(1.0, 2.0, 3650)))
+        url = f"/api/v1/chart/trackers/{mock_tracker_pelosi.id}"
+        
+        default = client.get(url, params={"range": "max"}).json()["spec"]["datasets"]["series"]
+        coarse = client.get(url, params={"range": "max", "max_points": 50}).json()["spec"]["datasets"]["series"]
+        
+        assert len(default) == settings.CHART_MAX_POINTS
+        assert len(coarse) == 50
+        assert coarse[0] == {"x": "2024-12-30", "y": 0.0} and coarse[-1]["y"] == 100.0
+        assert client.get(url, params={"max_points": 1}).status_code == 422
+    
+    def test_comparison_chart(
+        self, client: TestClient, returns, prices: PriceStore, mock_tracker_pelosi: Tracker, mock_tracker_buffett: Tracker
+    ):
+        """Test that trackers and the benchmark are rebased on one date index in a layered spec."""
+        days = [date(2024, 12, 30) + timedelta(days=i) for i in range(3)]
+        returns.write(pl.DataFrame({
+            "tracker_id": [mock_tracker_pelosi.id] * 3 + [mock_tracker_buffett.id] * 3,
+            "date": days * 2,
+            "value": [1.0, 1.1, 1.21, 2.0, 2.0, 3.0],
+        }))
+        # No close on 2025-01-01: the benchmark is carried forward
+        prices.write("SPY", pl.DataFrame({"date": [days[0], days[1]], "close": [500.0, 400.0]}))
+        
+        response = client.get("/api/v1/chart/compare", params={
+            "trackers": f"{mock_tracker_pelosi.id},{mock_tracker_buffett.id}", "benchmark": "spy", "range": "max"
+        })
+        
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["tracker_ids"], body["benchmark"]) == ([mock_tracker_pelosi.id, mock_tracker_buffett.id], "SPY")
+        assert len(body["spec"]["layer"]) == 2
+        points = body["spec"]["datasets"]["series"]
+        by_series = {}
+        for point in points:
+            by_series.setdefault(point["series"], []).append((point["x"], point["y"], point["benchmark"]))
+        assert by_series["Nancy Pelosi"] == [("2024-12-30", 0.0, False), ("2024-12-31", 10.0, False), ("2025-01-01", 21.0, False)]
+        assert [y for _, y, _ in by_series["Warren Buffett"]] == [0.0, 0.0, 50.0]
+        assert by_series["SPY"] == [("2024-12-30", 0.0, True), ("2024-12-31", -20.0, True), ("2025-01-01", -20.0, True)]
+        
+        without = client.get("/api/v1/chart/compare", params={"trackers": str(mock_tracker_pelosi.id), "benchmark": ""})
+        assert {point["series"] for point in without.json()["spec"]["datasets"]["series"]} == {"Nancy Pelosi"}
+    
+    def test_comparison_chart_errors(
+        self, client: TestClient, returns, prices: PriceStore, mock_tracker_pelosi: Tracker, mock_tracker_buffett: Tracker
+    ):
+        """Test that unknown trackers, missing backtests and benchmarks without prices are reported."""
+        returns.write(pl.DataFrame({"tracker_id": [mock_tracker_pelosi.id], "date": [date(2025, 1, 2)], "value": [1.0]}))
+        url = "/api/v1/chart/compare"
+        
+        assert client.get(url, params={"trackers": "999"}).status_code == 404
+        response = client.get(url, params={"trackers": f"{mock_tracker_pelosi.id},{mock_tracker_buffett.id}", "benchmark": ""})
+        assert response.status_code == 404 and "Warren Buffett" in response.json()["detail"]
+        assert client.get(url, params={"trackers": str(mock_tracker_pelosi.id), "benchmark": "SPY"}).status_code == 404
+        assert client.get(url, params={"trackers": "1,x"}).status_code == 400
+        assert client.get(url, params={"trackers": str(mock_tracker_pelosi.id), "benchmark": "../x"}).status_code == 400
+    
+    def test_comparison_chart_labels_and_budget(
+        self, client: TestClient, session: Session, returns, prices: PriceStore, mock_tracker_pelosi: Tracker
+    ):
+        """Test that trackers sharing a name are labelled by id and max_points must cover 3 points per series."""
+        namesake = Tracker(name=mock_tracker_pelosi.name, type="politician", risk_level="High")
+        session.add(namesake)
+        session.commit()
+        days = [date(2024, 12, 30) + timedelta(days=i) for i in range(3)]
+        returns.write(pl.DataFrame({
+            "tracker_id": [mock_tracker_pelosi.id] * 3 + [namesake.id] * 3,
+            "date": days * 2,
+            "value": [1.0, 1.1, 1.2, 1.0, 0.9, 0.8],
+        }))
+        prices.write("SPY", pl.DataFrame({"date": days, "close": [500.0, 510.0, 520.0]}))
+        params = {"trackers": f"{mock_tracker_pelosi.id},{namesake.id}", "benchmark": "SPY", "range": "max"}
+        
+        response = client.get("/api/v1/chart/compare", params=params)
+        
+        series = {point["series"] for point in response.json()["spec"]["datasets"]["series"]}
+        assert series == {f"Nancy Pelosi (#{mock_tracker_pelosi.id})", f"Nancy Pelosi (#{namesake.id})", "SPY"}
+        assert client.get("/api/v1/chart/compare", params={**params, "max_points": 9}).status_code == 200
+        response = client.get("/api/v1/chart/compare", params={**params, "max_points": 8})
+        assert response.status_code == 400 and "at least 9" in response.json()["detail"]
+    
+    def test_chart_data_only_formats(self, client: TestClient, returns, mock_tracker_pelosi: Tracker):
+        """Test that Accept selects compact arrays or Arrow IPC, and the spec is served on its own."""
+        self._write_series(returns, mock_tracker_pelosi.id, [1.0, 1.1, 1.21])
+        url = f"/api/v1/chart/trackers/{mock_tracker_pelosi.id}"
+        
+        columns = client.get(url, headers={"Accept": "application/vnd.hedgie.columns+json"})
+        assert columns.headers["content-type"] == "application/vnd.hedgie.columns+json"
+        assert "Accept" in columns.headers["vary"]
+        assert columns.json() == {
+            "tracker_id": mock_tracker_pelosi.id, "range": "ytd", "style": "area", "dataset": "series",
+            "columns": {"x": [20088, 20089], "y": [0.0, 10.0]},  # 2024-12-31, 2025-01-01
+        }
+        
+        arrow = client.get(url, headers={"Accept": "application/vnd.apache.arrow.stream;q=0.9, application/json;q=0.5"})
+        assert arrow.headers["content-type"] == "application/vnd.apache.arrow.stream"
+        frame = pl.read_ipc_stream(arrow.content)
+        assert frame.to_dict(as_series=False) == {"x": [date(2024, 12, 31), date(2025, 1, 1)], "y": [0.0, 10.0]}
+        assert arrow.headers["etag"] != columns.headers["etag"]
+        
+        spec = client.get("/api/v1/chart/specs/area")
+        assert spec.json()["data"] == {"name": "series"} and "datasets" not in spec.json()
+        assert client.get("/api/v1/chart/specs/area", headers={"If-None-Match": spec.headers["etag"]}).status_code == 304
+        assert client.get(url, headers={"Accept": "text/csv"}).status_code == 406
+    
+    def test_chart_errors(self, client: TestClient, returns, mock_tracker_pelosi: Tracker):
+        """Test that untested trackers get an empty chart, unknown ones 404 and unknown ranges are rejected."""
+        response = client.get(f"/api/v1/chart/trackers/{mock_tracker_pelosi.id}")
+        assert response.status_code == 200
+        assert response.json()["backtested"] is False
+        assert response.json()["spec"]["datasets"] == {"series": []}
+        columns = client.get(
+            f"/api/v1/chart/trackers/{mock_tracker_pelosi.id}", headers={"Accept": "application/vnd.hedgie.columns+json"}
+        )
+        assert columns.json()["columns"] == {"x": [], "y": []}
+        assert client.get("/api/v1/chart/trackers/9999").status_code == 404
+        assert client.get(f"/api/v1/chart/trackers/{mock_tracker_pelosi.id}", params={"range": "2w"}).status_code == 422
+
+
+class TestStartup:
+    """Tests for the cold start of an API worker."""
+    
+    # Importing app.main may cost at most this multiple of importing the framework alone
+    STARTUP_BUDGET_RATIO = 1.75
+    
+    def _import_seconds(self, statement: str, database_url: str) -> float:
+        """Median wall time of `statement` in three fresh interpreters."""
+        code = f"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+        env = {**os.environ, "DATABASE_URL": database_url, "SEED_ON_STARTUP": "false"}
+        timings = [
+            float(subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout)
+            for _ in range(3)
+        ]
+        return statistics.median(timings)
+    
+    def test_import_skips_database_and_analytics(self, tmp_path):
+        """Test that importing the app neither touches the database nor loads the analytics stack."""
+        db_path = tmp_path / "cold.db"
+        code = (
+            "import sys, app.main; "
+            "print(','.join(m for m in ('altair', 'polars', 'numpy', 'pyarrow', 'yfinance') if m in sys.modules))"
+        )
+        env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}", "SEED_ON_STARTUP": "false"}
+        result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        
+        assert result.stdout.strip() == ""
+        assert not db_path.exists()
+    
+    def test_seed_on_startup(self, monkeypatch):
+        """Test that SEED_ON_STARTUP seeds the database before serving."""
+        import app.seed
+        from app.main import app as fastapi_app
+        from app.services.order_worker import order_worker_pool
+        
+        seeded = []
+        
+        async def noop():
+            return None
+        
+        monkeypatch.setattr(app.seed, "main", lambda: seeded.append(True))
+        monkeypatch.setattr(order_worker_pool, "start", lambda: None)
+        monkeypatch.setattr(order_worker_pool, "stop", noop)
+        
+        monkeypatch.setattr(settings, "SEED_ON_STARTUP", False)
+        with TestClient(fastapi_app):
+            pass
+        assert seeded == []
+        
+        monkeypatch.setattr(settings, "SEED_ON_STARTUP", True)
+        with TestClient(fastapi_app):
+            assert seeded == [True]
+    
+    @pytest.mark.slow
+    def test_cold_start_benchmark(self, tmp_path):
+        """Benchmark: a new worker imports the app in little more than the framework's own import time."""
+        database_url = f"sqlite:///{tmp_path / 'cold.db'}"
+        framework = self._import_seconds("import fastapi, sqlmodel, fastapi.middleware.cors", database_url)
+        app_import = self._import_seconds("import app.main", database_url)
+        
+        assert app_import < framework * self.STARTUP_BUDGET_RATIO, (app_import, framework)
+
+
 class TestEndToEndFlow:
     """End-to-end tests for complete user flows."""
     
-    def test_complete_investment_flow(self, client: TestClient, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker):
+    def test_complete_investment_flow(self, client: TestClient, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker, order_workers: OrderWorkerPool):
         """Test complete flow: login -> view trackers -> invest -> check portfolio."""
         # 1. Dev login
         login_response = client.post(
@@ -274,12 +787,17 @@ class TestEndToEndFlow:
                 "amount_clp": 100_000
             }
         )
-        assert invest_response.status_code == 200
+        assert invest_response.status_code == 202
         invest_data = invest_response.json()
         assert invest_data["success"] is True
         assert invest_data["remaining_balance"] == 900_000
         
-        # 5. Check portfolio
+        # 5. Workers execute the queued order
+        asyncio.run(order_workers.drain())
+        order_response = client.get(f"/api/v1/invest/orders/{invest_data['order_id']}")
+        assert order_response.json()["status"] == "filled"
+        
+        # 6. Check portfolio
         portfolio_response = client.get(f"/api/v1/portfolio/{mock_user.id}")
         assert portfolio_response.status_code == 200
         portfolio = portfolio_response.json()
@@ -0,0 +1,221 @@
+"""
+Tests for the filing ingestion pipelines.
+"""
+import os
+import time
+import tracemalloc
+from datetime import date
+import numpy as np
+import polars as pl
+import pytest
+from sqlmodel import Session, select
+from app.ingest.ptr import TRADE_SCHEMA, delay_stats, ingest, net_holdings, read_ptr_file
+from app.ingest.thirteen_f import IngestReport, aggregate_holdings, ingest_filing, iter_info_table, load_cusip_map
+from app.models import PoliticianTrade, Tracker, TrackerHolding
+from app.services import holding_history_service, tracker_service
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+INFO_TABLE = os.path.join(FIXTURES, "13f_infotable.xml")
+PTR_HOUSE = os.path.join(FIXTURES, "ptr_house.json")
+PTR_SENATE = os.path.join(FIXTURES, "ptr_senate.csv")
+
+ROW_TEMPLATE = """  <infoTable>
+    <nameOfIssuer>ISSUER {i}</nameOfIssuer>
+    <titleOfClass>COM</titleOfClass>
+    <cusip>{cusip}</cusip>
+    <value>{value}</value>
+    <shrsOrPrnAmt><sshPrnamt>100</sshPrnamt><sshPrnamtType>SH</sshPrnamtType></shrsOrPrnAmt>
+    <investmentDiscretion>SOLE</investmentDiscretion>
+    <votingAuthority><Sole>100</Sole><Shared>0</Shared><None>0</None></votingAuthority>
+  </infoTable>
+"""
+
+
+class TestThirteenFIngestion:
+    """Tests for the 13F information table pipeline."""
+    
+    def test_parse_info_table(self):
+        """Test that rows are read with or without the SEC namespace."""
+        rows = list(iter_info_table(INFO_TABLE))
+        
+        assert len(rows) == 7
+        assert rows[0].cusip == "037833100"
+        assert rows[0].value == 60_000_000
+        assert rows[0].shares == 300_000
+        assert rows[4].put_call == "Call"
+        assert rows[5].share_type == "PRN"
+    
+    def test_aggregate_holdings(self):
+        """Test that split positions are summed and options, bonds and unmapped CUSIPs skipped."""
+        report = IngestReport(tracker_id=1)
+        holdings = aggregate_holdings(iter_info_table(INFO_TABLE), load_cusip_map(), report)
+        
+        assert holdings == [
+            {"ticker": "AAPL", "company_name": "APPLE INC", "allocation_percent": 80.0},
+            {"ticker": "BAC", "company_name": "BANK AMER CORP", "allocation_percent": 15.0},
+            {"ticker": "AXP", "company_name": "AMERICAN EXPRESS CO", "allocation_percent": 5.0},
+        ]
+        assert report.rows == 7
+        assert report.skipped_options == 1
+        assert report.skipped_principal == 1
+        assert report.unmapped == {"G0000X101": 2_500_000}
+    
+    def test_ingest_replaces_tracker_holdings(self, session: Session, mock_tracker_with_holdings: Tracker, mock_tracker_buffett: Tracker):
+        """Test that ingestion swaps the tracker's holdings and leaves other trackers alone."""
+        session.add(TrackerHolding(tracker_id=mock_tracker_buffett.id, ticker="KO", company_name="Coca-Cola", allocation_percent=100.0))
+        session.commit()
+        version = tracker_service.catalog_cache.version
+        
+        report = ingest_filing(INFO_TABLE, mock_tracker_with_holdings, session, period=date(2025, 9, 30))
+        session.commit()
+        
+        holdings = session.exec(
+            select(TrackerHolding).where(TrackerHolding.tracker_id == mock_tracker_with_holdings.id)
+        ).all()
+        assert report.holdings == 3
+        assert sorted((h.ticker, h.allocation_percent) for h in holdings) == [("AAPL", 80.0), ("AXP", 5.0), ("BAC", 15.0)]
+        other = session.exec(select(TrackerHolding).where(TrackerHolding.tracker_id == mock_tracker_buffett.id)).all()
+        assert [h.ticker for h in other] == ["KO"]
+        # The bulk statements still invalidate cached catalog responses
+        assert tracker_service.catalog_cache.version > version
+        
+        # The filing is also the tracker's first snapshot
+        diff = holding_history_service.get_diff(mock_tracker_with_holdings.id, session)
+        assert diff["to_period"] == "2025-09-30"
+        assert [(c["ticker"], c["change"]) for c in diff["changes"]] == [("AAPL", "added"), ("BAC", "added"), ("AXP", "added")]
+    
+    def test_backfilled_filing_keeps_current_holdings(self, session: Session, mock_tracker_with_holdings: Tracker):
+        """Test that a filing older than the latest snapshot is recorded as history only."""
+        tracker_id = mock_tracker_with_holdings.id
+        current = [{"ticker": "KO", "company_name": "Coca-Cola", "allocation_percent": 100.0}]
+        holding_history_service.record_snapshot(tracker_id, date(2025, 9, 30), current, session)
+        session.commit()
+        before = sorted(h.ticker for h in session.exec(select(TrackerHolding).where(TrackerHolding.tracker_id == tracker_id)).all())
+        
+        report = ingest_filing(INFO_TABLE, mock_tracker_with_holdings, session, period=date(2025, 6, 30))
+        session.commit()
+        
+        assert (report.holdings, report.current) == (3, False)
+        holdings = session.exec(select(TrackerHolding).where(TrackerHolding.tracker_id == tracker_id)).all()
+        assert sorted(h.ticker for h in holdings) == before
+        assert holding_history_service.get_periods(tracker_id, session) == [date(2025, 9, 30), date(2025, 6, 30)]
+        assert holding_history_service.get_allocations(tracker_id, date(2025, 6, 30), session) == {"AAPL": 80.0, "BAC": 15.0, "AXP": 5.0}
+        diff = holding_history_service.get_diff(tracker_id, session)
+        assert (diff["from_period"], diff["to_period"]) == ("2025-06-30", "2025-09-30")
+    
+    def test_parsing_memory_is_flat(self, tmp_path):
+        """Test that a large filing is parsed without holding its rows in memory."""
+        path = tmp_path / "large_infotable.xml"
+        with open(path, "w") as f:
+            f.write('<?xml version="1.0"?>\n<informationTable xmlns="http://www.sec.gov/edgar/document/thirteenf/informationtable">\n')
+            for i in range(20_000):
+                f.write(ROW_TEMPLATE.format(i=i, cusip=f"{i:09d}", value=1_000 + i))
+            f.write("</informationTable>\n")
+        
+        tracemalloc.start()
+        try:
+            count = sum(1 for _ in iter_info_table(str(path)))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        
+        assert count == 20_000
+        assert os.path.getsize(path) > 8_000_000
+        assert peak < 1_000_000
+
+
+class TestPtrIngestion:
+    """Tests for the Stock Act PTR pipeline."""
+    
+    def test_normalize_house_and_senate_dumps(self):
+        """Test that both dump layouts are normalized to the same columns."""
+        house = read_ptr_file(PTR_HOUSE)
+        senate = read_ptr_file(PTR_SENATE)
+        
+        assert house.height == 9
+        first = house.row(0, named=True)
+        assert first["politician"] == "Nancy Pelosi"
+        assert first["chamber"] == "house"
+        assert first["transaction_type"] == "purchase"
+        assert first["transaction_date"] == date(2024, 1, 10)
+        assert first["disclosure_date"] == date(2024, 2, 5)
+        assert (first["amount_min_usd"], first["amount_max_usd"]) == (1_000_001, 5_000_000)
+        assert house.row(2, named=True)["ticker"] is None
+        
+        # The row with an unparseable disclosure date is dropped
+        assert senate.height == 2
+        assert senate["chamber"].to_list() == ["senate", "senate"]
+        assert senate["transaction_type"].to_list() == ["purchase", "sale_partial"]
+        assert senate["owner"].to_list() == ["self", "spouse"]
+    
+    def test_delay_stats_and_net_holdings(self):
+        """Test the delay distribution and the net positions derived from the trades."""
+        trades = pl.concat([read_ptr_file(PTR_HOUSE), read_ptr_file(PTR_SENATE)]).unique("trade_key", maintain_order=True)
+        
+        stats = {row["politician"]: row for row in delay_stats(trades).iter_rows(named=True)}
+        pelosi = stats["Nancy Pelosi"]
+        assert pelosi["trades"] == 6
+        assert pelosi["mean_delay"] == pytest.approx(190 / 6)
+        assert pelosi["median_delay"] == 29
+        assert pelosi["p90_delay"] == pytest.approx(43.5)
+        # The 0202 typo is excluded from the delay distribution
+        assert stats["Ro Khanna"]["trades"] == 1
+        
+        holdings = net_holdings(trades).filter(pl.col("politician") == "Nancy Pelosi")
+        # AAPL was sold in full; MSFT is the purchase minus the partial sale
+        assert holdings["ticker"].to_list() == ["NVDA", "MSFT"]
+        assert holdings["net_usd"].to_list() == pytest.approx([3_000_000.5, 200_000.0])
+        assert holdings["allocation_percent"].sum() == pytest.approx(100.0)
+    
+    def test_ingest_updates_politician_trackers(self, session: Session, mock_tracker_with_holdings: Tracker, mock_tracker_buffett: Tracker):
+        """Test that loading is idempotent and matching trackers get the delay and holdings."""
+        fund_delay = mock_tracker_buffett.average_delay
+        report, updated = ingest([PTR_HOUSE, PTR_SENATE], session)
+        session.commit()
+        
+        assert report.trades_read == 11
+        assert report.trades_loaded == 10  # The duplicated MSFT sale is stored once
+        assert report.politicians == 3
+        assert report.trackers_updated == ["Nancy Pelosi"]
+        assert updated["median_delay"].to_list() == [29.0]
+        
+        session.refresh(mock_tracker_with_holdings)
+        assert mock_tracker_with_holdings.average_delay == 32
+        holdings = session.exec(
+            select(TrackerHolding).where(TrackerHolding.tracker_id == mock_tracker_with_holdings.id)
+        ).all()
+        assert sorted(h.ticker for h in holdings) == ["MSFT", "NVDA"]
+        assert holding_history_service.get_periods(mock_tracker_with_holdings.id, session) == [date(2024, 8, 30)]
+        
+        session.refresh(mock_tracker_buffett)
+        assert mock_tracker_buffett.average_delay == fund_delay
+        
+        report, _ = ingest([PTR_HOUSE, PTR_SENATE], session)
+        session.commit()
+        assert report.trades_loaded == 0
+        assert len(session.exec(select(PoliticianTrade)).all()) == 10
+    
+    def test_full_history_pass_is_fast(self):
+        """Test that a multi-year history for every member of Congress is analyzed in seconds."""
+        rng = np.random.default_rng(7)
+        n = 300_000
+        transaction_days = rng.integers(0, 365 * 12, n)
+        trades = pl.DataFrame({
+            "politician": pl.Series([f"Member {i}" for i in rng.integers(0, 535, n)]),
+            "ticker": pl.Series([f"T{i}" for i in rng.integers(0, 3000, n)]),
+            "asset_description": "Common Stock",
+            "transaction_type": rng.choice(["purchase", "purchase", "sale_partial", "sale_full", "exchange"], n),
+            "transaction_date": pl.Series(transaction_days).cast(pl.Date),
+            "disclosure_date": pl.Series(transaction_days + rng.integers(0, 120, n)).cast(pl.Date),
+            "amount_min_usd": 1_001.0,
+            "amount_max_usd": 15_000.0,
+        }, schema=TRADE_SCHEMA)
+        
+        start = time.perf_counter()
+        stats = delay_stats(trades)
+        holdings = net_holdings(trades)
+        elapsed = time.perf_counter() - start
+        
+        assert stats.height == 535
+        assert holdings.height > 0
+        assert elapsed < 5.0
@@ -1,13 +1,44 @@
 """
 Tests for service layer.
 """
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import ClassVar, List
+import numpy as np
+import polars as pl
 import pytest
-from sqlmodel import Session
-from app.services.broker_service import MockBrokerService
-from app.services.tracker_service import TrackerService
-from app.services.investment_service import InvestmentService
-from app.services.portfolio_service import PortfolioService
-from app.models import User, Tracker, PortfolioItem
+from sqlalchemy import event, insert, update
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import httpx
+from fastapi import HTTPException
+from app.core.config import settings
+from app.services.broker_service import MockBrokerService, HttpBrokerService, broker_service
+from app.services.tracker_service import TrackerService, tracker_service, _marketplace_statement
+from app.services.catalog_cache import CatalogCache
+from app.services.holding_history_service import holding_history_service
+from app.services.investment_service import InvestmentService, AsyncInvestmentService
+from app.services.order_aggregator import OrderAggregator, allocate_fill, net_orders
+from app.services.quote_cache import QuoteCache
+from app.services.rebalance_service import rebalance_matrix, rebalance_service
+from app.services.position_service import position_service
+from app.services.valuation_service import valuation_service
+from app.services.price_store import PriceStore
+from app.services.backtest_service import backtest_service, replay
+from app.services.chart_service import downsample_columns, lttb_indices
+from app.services.portfolio_service import PortfolioService, AsyncPortfolioService
+from app.services.balance_service import BalanceService
+from app.services.idempotency_service import IdempotencyService, request_fingerprint
+from app.services.order_worker import OrderWorkerPool
+from app.services.summary_service import summary_service
+from app.services.transaction_service import AsyncTransactionService
+from app.models import User, Tracker, TrackerHolding, HoldingChange, HoldingSnapshot, PortfolioItem, PortfolioSummary, Position, Transaction, InvestmentOrder, IdempotencyKey
+from app.stub_broker import create_app as create_stub_broker
+from app.jobs import backfill_prices
 
 
 class TestMockBrokerService:
@@ -30,6 +61,228 @@ class TestMockBrokerService:
         assert buying_power == 0
 
 
+class TestHttpBrokerService:
+    """Tests for HttpBrokerService against the stand-in broker."""
+    
+    def make_service(self) -> HttpBrokerService:
+        transport = httpx.ASGITransport(app=create_stub_broker(latency_seconds=0))
+        return HttpBrokerService(base_url="http://stub-broker", transport=transport)
+    
+    @pytest.mark.anyio
+    async def test_execute_trades_batch(self):
+        """Test that a batch of orders is filled in one request."""
+        service = self.make_service()
+        fills = await service.execute_trades([
+            {"ticker": "AAPL", "shares": 2},
+            {"ticker": "NVDA", "shares": 1, "action": "sell"},
+        ])
+        await service.aclose()
+        
+        assert [f["ticker"] for f in fills] == ["AAPL", "NVDA"]
+        assert fills[0]["total_value"] == 390.0
+        assert fills[1]["action"] == "sell"
+        assert all(f["status"] == "filled" for f in fills)
+    
+    @pytest.mark.anyio
+    async def test_reuses_pooled_client(self):
+        """Test that quotes and orders share one client instance."""
+        service = self.make_service()
+        client = service.client
+        prices = await service.get_current_prices(["AAPL", "NVDA"])
+        price = await service.get_current_price("MSFT")
+        fill = await service.execute_trade(1, "MSFT", 1)
+        
+        assert service.client is client
+        assert prices == {"AAPL": 195.0, "NVDA": 850.0}
+        assert price == 420.0
+        assert fill["price"] == 420.0
+        
+        await service.aclose()
+        assert client.is_closed
+
+
+class TestQuoteCache:
+    """Tests for the TTL quote cache."""
+    
+    @pytest.mark.anyio
+    async def test_hit_after_miss_until_ttl_expires(self):
+        """Test that quotes are reused until the TTL elapses."""
+        now = [0.0]
+        fetches = []
+        
+        async def fetch(ticker):
+            fetches.append(ticker)
+            return 100.0
+        
+        cache = QuoteCache(ttl_seconds=5, max_size=10, clock=lambda: now[0])
+        await cache.get("AAPL", fetch)
+        await cache.get("AAPL", fetch)
+        now[0] = 6.0
+        await cache.get("AAPL", fetch)
+        
+        assert fetches == ["AAPL", "AAPL"]
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 2
+    
+    @pytest.mark.anyio
+    async def test_lru_eviction(self):
+        """Test that the least recently used quote is evicted at capacity."""
+        async def fetch(ticker):
+            return 1.0
+        
+        cache = QuoteCache(ttl_seconds=60, max_size=2)
+        await cache.get("AAPL", fetch)
+        await cache.get("MSFT", fetch)
+        await cache.get("AAPL", fetch)  # AAPL becomes most recently used
+        await cache.get("NVDA", fetch)
+        
+        assert cache.stats()["evictions"] == 1
+        assert cache._lookup("MSFT") is None
+        assert cache._lookup("AAPL") == 1.0
+    
+    @pytest.mark.anyio
+    async def test_concurrent_misses_share_one_fetch(self):
+        """Test single-flight: concurrent misses trigger one fetch."""
+        fetches = []
+        
+        async def slow_fetch(ticker):
+            fetches.append(ticker)
+            await asyncio.sleep(0.05)
+            return 195.0
+        
+        cache = QuoteCache(ttl_seconds=60, max_size=10)
+        prices = await asyncio.gather(*(cache.get("AAPL", slow_fetch) for _ in range(50)))
+        
+        assert fetches == ["AAPL"]
+        assert set(prices) == {195.0}
+        assert cache.stats()["coalesced"] == 49
+    
+    @pytest.mark.anyio
+    async def test_cancelled_fetch_does_not_strand_waiters(self):
+        """Test that waiters fetch on their own when the caller fetching for them is cancelled."""
+        fetches = []
+        
+        async def slow_fetch(ticker):
+            fetches.append(ticker)
+            await asyncio.sleep(0.05)
+            return 195.0
+        
+        async def slow_fetch_many(tickers):
+            return {ticker: await slow_fetch(ticker) for ticker in tickers}
+        
+        cache = QuoteCache(ttl_seconds=60, max_size=10)
+        leader = asyncio.create_task(cache.get("AAPL", slow_fetch))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.get("AAPL", slow_fetch)), asyncio.create_task(cache.get_many(["AAPL"], slow_fetch_many))]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        
+        assert await asyncio.wait_for(asyncio.gather(*waiters), timeout=1) == [195.0, {"AAPL": 195.0}]
+        assert leader.cancelled()
+        assert fetches == ["AAPL", "AAPL"]
+        assert cache._inflight == {}
+    
+    @pytest.mark.anyio
+    async def test_get_many_fetches_only_misses_in_bulk(self):
+        """Test that bulk lookups fetch all misses in one call."""
+        calls = []
+        
+        async def fetch(ticker):
+            return 1.0
+        
+        async def fetch_many(tickers):
+            calls.append(list(tickers))
+            return {t: 2.0 for t in tickers}
+        
+        cache = QuoteCache(ttl_seconds=60, max_size=10)
+        await cache.get("AAPL", fetch)
+        prices = await cache.get_many(["AAPL", "MSFT", "NVDA", "MSFT"], fetch_many)
+        
+        assert calls == [["MSFT", "NVDA"]]
+        assert prices == {"AAPL": 1.0, "MSFT": 2.0, "NVDA": 2.0}
+    
+    @pytest.mark.anyio
+    async def test_broker_bulk_prices(self):
+        """Test MockBrokerService.get_current_prices."""
+        service = MockBrokerService()
+        prices = await service.get_current_prices(["NVDA", "BAC"])
+        
+        assert prices == {"NVDA": 850.0, "BAC": 35.0}
+
+
+class TestOrderAggregator:
+    """Tests for cross-user order netting."""
+    
+    def test_net_orders(self):
+        """Test that buys and sells are netted per ticker."""
+        net = net_orders([
+            {"ticker": "NVDA", "shares": 3, "action": "buy"},
+            {"ticker": "NVDA", "shares": 1, "action": "sell"},
+            {"ticker": "MSFT", "shares": 2, "action": "sell"},
+        ])
+        
+        assert net == {"NVDA": 2, "MSFT": -2}
+    
+    def test_allocate_partial_fill_pro_rata(self):
+        """Test that a partial broker fill is shared pro rata by the net side."""
+        orders = [
+            {"ticker": "NVDA", "shares": 6, "action": "buy"},
+            {"ticker": "NVDA", "shares": 2, "action": "buy"},
+            {"ticker": "NVDA", "shares": 4, "action": "sell"},
+        ]
+        # Net buy of 4, broker only fills 2: buyers get (4 crossed + 2) / 8
+        allocations = allocate_fill(orders, {"shares": 2, "price": 10.0})
+        
+        assert allocations[0]["shares"] == pytest.approx(4.5)
+        assert allocations[1]["shares"] == pytest.approx(1.5)
+        assert allocations[2]["shares"] == 4
+        assert allocations[0]["status"] == "partially_filled"
+        assert allocations[2]["status"] == "filled"
+    
+    @pytest.mark.anyio
+    async def test_concurrent_users_share_one_order_per_ticker(self, monkeypatch):
+        """Test that many users' orders reach the broker as one order per ticker."""
+        broker_batches = []
+        
+        async def record_batch(orders):
+            broker_batches.append(orders)
+            return [await broker_service._fill(o["ticker"], o["shares"], o["action"]) for o in orders]
+        
+        monkeypatch.setattr(broker_service, "execute_trades", record_batch)
+        aggregator = OrderAggregator(window_seconds=0.05)
+        
+        user_orders = [
+            [{"user_id": i, "ticker": "NVDA", "shares": 1.0, "action": "buy"},
+             {"user_id": i, "ticker": "MSFT", "shares": 2.0, "action": "buy"}]
+            for i in range(100)
+        ]
+        results = await asyncio.gather(*(aggregator.submit(orders) for orders in user_orders))
+        
+        assert len(broker_batches) == 1
+        assert sorted((o["ticker"], o["shares"]) for o in broker_batches[0]) == [("MSFT", 200.0), ("NVDA", 100.0)]
+        assert aggregator.orders_received == 200
+        assert aggregator.broker_orders_sent == 2
+        assert all(r[0]["shares"] == 1.0 and r[1]["shares"] == 2.0 for r in results)
+        assert results[0][0]["price"] == 850.0
+    
+    @pytest.mark.anyio
+    async def test_flushes_early_at_max_orders(self):
+        """Test that the window flushes as soon as the size limit is reached."""
+        aggregator = OrderAggregator(window_seconds=60, max_orders=2)
+        
+        fills = await asyncio.wait_for(
+            aggregator.submit([
+                {"ticker": "AAPL", "shares": 1.0, "action": "buy"},
+                {"ticker": "AAPL", "shares": 1.0, "action": "sell"},
+            ]),
+            timeout=5,
+        )
+        
+        # Fully crossed internally: nothing is sent to the broker
+        assert aggregator.broker_orders_sent == 0
+        assert [f["status"] for f in fills] == ["filled", "filled"]
+
+
 class TestTrackerService:
     """Tests for TrackerService."""
     
@@ -77,13 +330,683 @@ class TestTrackerService:
         holdings = service.get_tracker_holdings(mock_tracker_buffett.id, session)
         
         assert len(holdings) == 0
+    
+    def test_catalog_version_bumps_on_commit(self, session: Session, mock_tracker_with_holdings: Tracker):
+        """Test that cached catalog JSON is invalidated by holdings writes."""
+        tracker_service.invalidate_catalog()
+        first = tracker_service.get_tracker_holdings_json(mock_tracker_with_holdings.id, session)
+        assert tracker_service.get_tracker_holdings_json(mock_tracker_with_holdings.id, session) is first
+        
+        session.add(TrackerHolding(tracker_id=mock_tracker_with_holdings.id, ticker="TSLA", company_name="Tesla", allocation_percent=5.0))
+        session.commit()
+        
+        holdings = tracker_service.get_tracker_holdings_json(mock_tracker_with_holdings.id, session)
+        assert holdings.etag != first.etag
+        assert b"TSLA" in holdings.body
+    
+    def test_list_trackers_keyset_pagination(self, session: Session):
+        """Test that walking the cursors visits every matching tracker once, in order."""
+        session.add_all([
+            Tracker(name=f"Fund {i}", type="fund" if i % 2 else "politician", risk_level="High", ytd_return=float(i % 7))
+            for i in range(25)
+        ])
+        session.commit()
+        service = TrackerService()
+        
+        seen, cursor = [], None
+        while True:
+            page, cursor = service.list_trackers(session, tracker_type="fund", sort="ytd_return", limit=4, cursor=cursor)
+            seen.extend(page)
+            if cursor is None:
+                break
+        
+        assert len(seen) == 12
+        assert len({tracker.id for tracker in seen}) == 12
+        assert all(tracker.type == "fund" for tracker in seen)
+        keys = [(tracker.ytd_return, tracker.id) for tracker in seen]
+        assert keys == sorted(keys, reverse=True)
+    
+    def test_list_trackers_rejects_foreign_cursor(self, session: Session, mock_tracker_pelosi: Tracker, mock_tracker_buffett: Tracker):
+        """Test that a cursor from another sort order is refused."""
+        service = TrackerService()
+        _, cursor = service.list_trackers(session, sort="followers_count", limit=1)
+        
+        with pytest.raises(ValueError):
+            service.list_trackers(session, sort="ytd_return", cursor=cursor)
+        with pytest.raises(ValueError):
+            service.list_trackers(session, cursor="not-a-cursor")
+    
+    @pytest.mark.parametrize("tracker_count", [1, 50])
+    def test_list_trackers_with_holdings_query_count(self, engine, session: Session, tracker_count: int):
+        """Test that embedding holdings costs one extra query per page, not one per tracker."""
+        trackers = [Tracker(name=f"Fund {i}", type="fund", risk_level="Low") for i in range(tracker_count)]
+        session.add_all(trackers)
+        session.flush()
+        session.add_all([
+            TrackerHolding(tracker_id=tracker.id, ticker=ticker, company_name=ticker, allocation_percent=50.0)
+            for tracker in trackers for ticker in ("AAPL", "MSFT")
+        ])
+        session.commit()
+        session.expire_all()
+        
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            page, _ = TrackerService().list_trackers(session, include_holdings=True)
+            holdings = [[h.ticker for h in tracker.holdings] for tracker in page]
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        
+        assert len(statements) == 2
+        assert holdings == [["AAPL", "MSFT"]] * tracker_count
+    
+    @pytest.mark.parametrize("tracker_type, risk_level, sort, index", [
+        (None, None, "ytd_return", "ix_tracker_ytd_return_id"),
+        ("fund", None, "followers_count", "ix_tracker_type_followers_count_id"),
+        (None, "High", "average_delay", "ix_tracker_risk_level_average_delay_id"),
+        ("fund", "High", "ytd_return", "ix_tracker_type_risk_level_ytd_return_id"),
+        ("politician", None, "id", "ix_tracker_type_id"),
+    ])
+    def test_marketplace_queries_use_indexes(self, engine, session: Session, tracker_type, risk_level, sort, index):
+        """Test that every filter/sort combination is an index scan without a sort step."""
+        statement = _marketplace_statement(tracker_type, risk_level, sort, "desc", (1, 1), 101)
+        sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+        
+        plan = " ".join(row[-1] for row in session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+        
+        assert f"USING INDEX {index}" in plan
+        assert "TEMP B-TREE" not in plan
+    
+    def test_stale_read_is_not_cached(self):
+        """Test that a response read before a catalog write isn't stored."""
+        cache = CatalogCache(ttl_seconds=60)
+        version = cache.version
+        cache.bump()
+        cache.put("trackers", b"[]", version)
+        
+        assert cache.get("trackers") is None
+
+
+def _holdings(**allocations):
+    return [{"ticker": ticker, "company_name": f"{ticker} Inc.", "allocation_percent": percent} for ticker, percent in allocations.items()]
+
+
+class TestHoldingHistoryService:
+    """Tests for holdings snapshots and diffs."""
+    
+    Q1, Q2, Q3 = date(2025, 3, 31), date(2025, 6, 30), date(2025, 9, 30)
+    
+    def test_latest_diff_is_precomputed(self, session: Session, mock_tracker_buffett: Tracker):
+        """Test that recording a snapshot stores its diff against the previous period."""
+        tracker_id = mock_tracker_buffett.id
+        holding_history_service.record_snapshot(tracker_id, self.Q1, _holdings(AAPL=50.0, NVDA=30.0, MSFT=20.0), session)
+        holding_history_service.record_snapshot(tracker_id, self.Q2, _holdings(AAPL=40.0, NVDA=30.0, TSLA=30.0), session)
+        session.commit()
+        
+        stored = session.exec(select(HoldingChange).where(HoldingChange.tracker_id == tracker_id)).all()
+        assert [(c.ticker, c.change, c.delta_percent) for c in stored] == [
+            ("TSLA", "added", 30.0),
+            ("MSFT", "removed", -20.0),
+            ("AAPL", "reweighted", -10.0),
+        ]
+        assert {(c.period, c.previous_period) for c in stored} == {(self.Q2, self.Q1)}
+        
+        diff = holding_history_service.get_diff(tracker_id, session)
+        assert diff["from_period"] == "2025-03-31"
+        assert diff["to_period"] == "2025-06-30"
+        assert [c["ticker"] for c in diff["changes"]] == ["TSLA", "MSFT", "AAPL"]
+        assert diff["changes"][2] == {
+            "ticker": "AAPL", "company_name": "AAPL Inc.", "change": "reweighted",
+            "previous_percent": 50.0, "allocation_percent": 40.0, "delta_percent": -10.0,
+        }
+    
+    def test_diff_between_any_two_periods(self, session: Session, mock_tracker_buffett: Tracker):
+        """Test that non-latest diffs are computed from the snapshots and match the stored ones."""
+        tracker_id = mock_tracker_buffett.id
+        holding_history_service.record_snapshot(tracker_id, self.Q1, _holdings(AAPL=50.0, MSFT=50.0), session)
+        holding_history_service.record_snapshot(tracker_id, self.Q2, _holdings(AAPL=100.0), session)
+        holding_history_service.record_snapshot(tracker_id, self.Q3, _holdings(AAPL=60.0, MSFT=40.0), session)
+        session.commit()
+        
+        assert holding_history_service.get_periods(tracker_id, session) == [self.Q3, self.Q2, self.Q1]
+        
+        # Q1 -> Q3 nets out to a re-weighting of both positions
+        diff = holding_history_service.get_diff(tracker_id, session, from_period=self.Q1, to_period=self.Q3)
+        assert [(c["ticker"], c["change"]) for c in diff["changes"]] == [("AAPL", "reweighted"), ("MSFT", "reweighted")]
+        
+        # `from` defaults to the period before `to`
+        diff = holding_history_service.get_diff(tracker_id, session, to_period=self.Q2)
+        assert diff["from_period"] == "2025-03-31"
+        assert [(c["ticker"], c["change"]) for c in diff["changes"]] == [("MSFT", "removed"), ("AAPL", "reweighted")]
+        
+        # An unchanged position is not a change
+        holding_history_service.record_snapshot(tracker_id, self.Q3, _holdings(AAPL=100.0), session)
+        session.commit()
+        assert holding_history_service.get_diff(tracker_id, session)["changes"] == []
+    
+    def test_first_snapshot_and_unknown_period(self, session: Session, mock_tracker_buffett: Tracker):
+        """Test the first snapshot (everything added) and periods without a snapshot."""
+        tracker_id = mock_tracker_buffett.id
+        assert holding_history_service.get_diff(tracker_id, session)["changes"] == []
+        
+        holding_history_service.record_snapshot(tracker_id, self.Q1, _holdings(AAPL=100.0), session)
+        session.commit()
+        diff = holding_history_service.get_diff(tracker_id, session)
+        assert diff["from_period"] is None
+        assert [(c["ticker"], c["change"]) for c in diff["changes"]] == [("AAPL", "added")]
+        
+        with pytest.raises(ValueError):
+            holding_history_service.get_diff(tracker_id, session, from_period=self.Q2)
+
+
+class TestRebalanceService:
+    """Tests for the follower rebalancing engine."""
+    
+    def _add_followers(self, session: Session, tracker_id: int, values):
+        """One new user per value, each following the tracker with that amount."""
+        user_ids = session.exec(
+            insert(User).returning(User.id), params=[{"name": "Follower", "balance_clp": 0.0} for _ in values]
+        ).scalars().all()
+        session.exec(insert(PortfolioItem), params=[
+            {"user_id": user_id, "tracker_id": tracker_id, "invested_amount_clp": value, "current_value_clp": value}
+            for user_id, value in zip(user_ids, values)
+        ])
+        session.commit()
+    
+    def test_rebalance_matrix(self):
+        """Test the per-follower, per-ticker trade matrix."""
+        values = np.array([100.0, 200.0])
+        current = np.outer(values, [0.5, 0.5, 0.0])
+        deltas = rebalance_matrix(values, current, np.array([0.5, 0.0, 0.5]))
+        
+        assert deltas.tolist() == [[0.0, -50.0, 50.0], [0.0, -100.0, 100.0]]
+    
+    def test_plan_nets_followers_in_chunks(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker, mock_tracker_buffett: Tracker):
+        """Test that every follower is loaded (across chunks) and netted into one trade per ticker."""
+        self._add_followers(session, mock_tracker_pelosi.id, [100_000.0, 200_000.0, 300_000.0])
+        self._add_followers(session, mock_tracker_buffett.id, [1_000_000.0])
+        
+        plan = rebalance_service.plan(
+            mock_tracker_pelosi.id, {"AAPL": 50.0, "MSFT": 50.0}, {"AAPL": 50.0, "NVDA": 50.0}, session, chunk_size=2
+        )
+        
+        assert plan.followers == 3
+        assert plan.tickers == ["AAPL", "MSFT", "NVDA"]
+        assert plan.net_clp.tolist() == pytest.approx([0.0, -300_000.0, 300_000.0])
+        
+        orders = plan.orders({"AAPL": 1.0, "MSFT": 2.0, "NVDA": 4.0}, min_order_clp=0)
+        assert [(o["ticker"], o["action"]) for o in orders] == [("MSFT", "sell"), ("NVDA", "buy")]
+        assert orders[1]["shares"] == pytest.approx(300_000.0 / (4.0 * settings.USD_CLP_RATE))
+    
+    def test_plan_uses_positions(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker):
+        """Test that followers with positions are rebalanced from what they actually hold."""
+        self._add_followers(session, mock_tracker_pelosi.id, [100_000.0, 100_000.0])
+        first = session.exec(select(PortfolioItem).order_by(PortfolioItem.id)).first()
+        position_service.record_fills(first.id, first.user_id, [
+            {"success": True, "ticker": "AAPL", "shares": 1.0, "total_value": 80_000.0 / settings.USD_CLP_RATE},
+            {"success": True, "ticker": "TSLA", "shares": 1.0, "total_value": 20_000.0 / settings.USD_CLP_RATE},
+        ], session)
+        session.commit()
+        
+        plan = rebalance_service.plan(mock_tracker_pelosi.id, {"AAPL": 100.0}, {"AAPL": 50.0, "MSFT": 50.0}, session)
+        
+        # First follower: AAPL 80k -> 50k, TSLA 20k -> 0, MSFT 0 -> 50k; second holds 100k of AAPL
+        assert plan.tickers == ["AAPL", "MSFT", "TSLA"]
+        assert plan.net_clp.tolist() == pytest.approx([-80_000.0, 100_000.0, -20_000.0])
+    
+    def test_plan_keeps_value_held_before_positions(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker):
+        """Test that value invested before positions were tracked still counts at the previous weights."""
+        self._add_followers(session, mock_tracker_pelosi.id, [1_050_000.0])
+        item = session.exec(select(PortfolioItem)).one()
+        # A 50,000 top-up after positions were introduced
+        position_service.record_fills(item.id, item.user_id, [
+            {"success": True, "ticker": "MSFT", "shares": 1.0, "total_value": 50_000.0 / settings.USD_CLP_RATE},
+        ], session)
+        session.commit()
+        
+        plan = rebalance_service.plan(mock_tracker_pelosi.id, {"AAPL": 100.0}, {"AAPL": 50.0, "MSFT": 50.0}, session)
+        
+        # Holds AAPL 1,000,000 (untracked) and MSFT 50,000; targets 525,000 each
+        assert plan.tickers == ["AAPL", "MSFT"]
+        assert plan.net_clp.tolist() == pytest.approx([-475_000.0, 475_000.0])
+    
+    @pytest.mark.anyio
+    async def test_rebalance_latest_filing(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker, monkeypatch):
+        """Test that the latest snapshot change is sent to the broker as netted orders."""
+        tracker_id = mock_tracker_pelosi.id
+        assert rebalance_service.plan_latest_change(tracker_id, session) is None
+        
+        holding_history_service.record_snapshot(tracker_id, date(2025, 3, 31), [
+            {"ticker": "AAPL", "company_name": "Apple", "allocation_percent": 100.0},
+        ], session)
+        holding_history_service.record_snapshot(tracker_id, date(2025, 6, 30), [
+            {"ticker": "AAPL", "company_name": "Apple", "allocation_percent": 60.0},
+            {"ticker": "NVDA", "company_name": "NVIDIA", "allocation_percent": 40.0},
+        ], session)
+        self._add_followers(session, tracker_id, [50_000.0] * 20)
+        
+        batches = []
+        
+        async def record_batch(orders):
+            batches.append(orders)
+            return [{"success": True, "ticker": o["ticker"], "shares": o["shares"], "action": o["action"]} for o in orders]
+        monkeypatch.setattr(broker_service, "execute_trades", record_batch)
+        
+        plan = rebalance_service.plan_latest_change(tracker_id, session)
+        result = await rebalance_service.execute(plan, session)
+        
+        assert result.followers == 20
+        assert [(o["ticker"], o["action"], o["amount_clp"]) for o in result.orders] == [
+            ("AAPL", "sell", pytest.approx(400_000.0)),
+            ("NVDA", "buy", pytest.approx(400_000.0)),
+        ]
+        # 20 followers x 2 tickers reach the broker as 2 orders in one batch
+        assert len(batches) == 1
+        assert result.gross_clp == pytest.approx(800_000.0)
+    
+    @pytest.mark.anyio
+    async def test_fills_are_written_back_once(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker):
+        """Test that every follower gets its positions and transactions, and a repeated run trades nothing."""
+        tracker_id = mock_tracker_pelosi.id
+        self._add_followers(session, tracker_id, [50_000.0] * 3)
+        
+        plan = rebalance_service.plan(tracker_id, {"AAPL": 100.0}, {"AAPL": 60.0, "NVDA": 40.0}, session)
+        result = await rebalance_service.execute(plan, session)
+        
+        assert result.recorded == 3
+        positions = session.exec(select(Position.ticker, Position.market_value_clp)).all()
+        assert sorted(positions) == [("AAPL", pytest.approx(30_000.0))] * 3 + [("NVDA", pytest.approx(20_000.0))] * 3
+        transactions = session.exec(select(Transaction.type, Transaction.amount_clp)).all()
+        assert sorted(transactions) == [("buy", pytest.approx(20_000.0))] * 3 + [("sell", pytest.approx(20_000.0))] * 3
+        assert [item.current_value_clp for item in session.exec(select(PortfolioItem))] == [50_000.0] * 3
+        
+        plan = rebalance_service.plan(tracker_id, {"AAPL": 100.0}, {"AAPL": 60.0, "NVDA": 40.0}, session)
+        result = await rebalance_service.execute(plan, session)
+        
+        assert result.gross_clp == pytest.approx(0.0, abs=1.0)
+        assert result.orders == [] and result.recorded == 0
+        assert len(session.exec(select(Transaction)).all()) == 6
+    
+    @pytest.mark.anyio
+    async def test_short_fill_is_split_pro_rata(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker, monkeypatch):
+        """Test that crossed trades fill in full and the net side only gets what the broker filled."""
+        tracker_id = mock_tracker_pelosi.id
+        self._add_followers(session, tracker_id, [100_000.0, 50_000.0])
+        untracked, tracked = session.exec(select(PortfolioItem).order_by(PortfolioItem.id)).all()
+        position_service.record_fills(tracked.id, tracked.user_id, [
+            {"success": True, "ticker": "NVDA", "shares": 1.0, "total_value": 50_000.0 / settings.USD_CLP_RATE},
+        ], session)
+        session.commit()
+        
+        async def reject(orders):
+            return [{"success": False, "ticker": o["ticker"], "error": "market closed"} for o in orders]
+        monkeypatch.setattr(broker_service, "execute_trades", reject)
+        
+        plan = rebalance_service.plan(tracker_id, {"AAPL": 100.0}, {"AAPL": 50.0, "NVDA": 50.0}, session)
+        result = await rebalance_service.execute(plan, session)
+        
+        # The 25,000 the followers cross between them fills; the broker filled none of the net 25,000
+        assert [(o["ticker"], o["action"]) for o in result.orders] == [("AAPL", "sell"), ("NVDA", "buy")]
+        held = {
+            (item_id, ticker): value for item_id, ticker, value in
+            session.exec(select(Position.portfolio_item_id, Position.ticker, Position.market_value_clp))
+        }
+        assert held == {
+            (untracked.id, "AAPL"): pytest.approx(75_000.0),
+            (untracked.id, "NVDA"): pytest.approx(25_000.0),
+            (tracked.id, "AAPL"): pytest.approx(25_000.0),
+            (tracked.id, "NVDA"): pytest.approx(25_000.0),
+        }
+        
+        # The next run sends only what is still missing
+        plan = rebalance_service.plan(tracker_id, {"AAPL": 100.0}, {"AAPL": 50.0, "NVDA": 50.0}, session)
+        assert plan.net_clp.tolist() == pytest.approx([-25_000.0, 25_000.0])
+    
+    @pytest.mark.slow
+    def test_rebalance_scales_linearly(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker, mock_tracker_buffett: Tracker):
+        """Benchmark: planning 100k followers takes seconds and grows linearly with followers."""
+        previous = {f"T{i}": 1.0 for i in range(40)}
+        target = {f"T{i}": 1.0 + i % 3 for i in range(10, 50)}
+        rng = np.random.default_rng(3)
+        
+        timings = {}
+        for tracker, followers in ((mock_tracker_buffett, 10_000), (mock_tracker_pelosi, 100_000)):
+            self._add_followers(session, tracker.id, rng.uniform(10_000, 5_000_000, followers).tolist())
+            start = time.perf_counter()
+            plan = rebalance_service.plan(tracker.id, previous, target, session)
+            timings[followers] = time.perf_counter() - start
+            assert plan.followers == followers
+        
+        print(f"rebalance plan: 10k followers {timings[10_000]:.3f}s, 100k followers {timings[100_000]:.3f}s")
+        assert timings[100_000] < 30.0
+        # 10x the followers stays within ~linear cost (generous bound for noisy CI)
+        assert timings[100_000] < 25 * max(timings[10_000], 0.01)
+
+
+class TestValuationService:
+    """Tests for the bulk mark-to-market job."""
+    
+    AS_OF = date(2025, 11, 21)
+    
+    def _positions(self, session: Session, item: PortfolioItem, shares):
+        session.exec(insert(Position), params=[
+            {"portfolio_item_id": item.id, "user_id": item.user_id, "ticker": ticker,
+             "shares": count, "cost_basis_clp": 10_000.0, "market_value_clp": 10_000.0}
+            for ticker, count in shares.items()
+        ])
+        # As if bought with fills: the item's value includes the positions
+        item.current_value_clp += 10_000.0 * len(shares)
+        session.add(item)
+        session.commit()
+    
+    def test_revalue_rolls_up_to_items_and_summaries(self, session: Session, mock_portfolio_item: PortfolioItem):
+        """Test that positions are repriced and the totals flow into PortfolioItem and the summary."""
+        self._positions(session, mock_portfolio_item, {"AAPL": 10.0, "NVDA": 5.0, "XYZ": 1.0})
+        summary_service.rebuild(session)
+        valuation_service.store_prices(self.AS_OF, {"AAPL": 200.0, "NVDA": 100.0}, session)
+        valuation_service.store_prices(date(2025, 11, 20), {"AAPL": 1.0, "NVDA": 1.0, "XYZ": 1.0}, session)
+        session.commit()
+        
+        report = valuation_service.revalue(self.AS_OF, session, chunk_size=1)
+        
+        assert (report.positions, report.portfolio_items, report.summaries) == (2, 1, 1)
+        values = {p.ticker: p.market_value_clp for p in session.exec(select(Position)).all()}
+        rate = settings.USD_CLP_RATE
+        # XYZ has no price for the day and keeps its last value
+        assert values == {"AAPL": 10 * 200 * rate, "NVDA": 5 * 100 * rate, "XYZ": 10_000.0}
+        
+        # The fixture's 52,500 predates positions and is kept
+        total = (10 * 200 + 5 * 100) * rate + 10_000 + 52_500
+        session.refresh(mock_portfolio_item)
+        assert mock_portfolio_item.current_value_clp == pytest.approx(total)
+        assert session.get(PortfolioSummary, mock_portfolio_item.user_id).total_current_value_clp == pytest.approx(total)
+        assert summary_service.find_drift(session) == []
+        
+        # Re-running the day changes nothing
+        valuation_service.revalue(self.AS_OF, session, chunk_size=1)
+        session.refresh(mock_portfolio_item)
+        assert mock_portfolio_item.current_value_clp == pytest.approx(total)
+    
+    def test_revalue_is_set_based(self, engine, session: Session, mock_portfolio_item: PortfolioItem):
+        """Test that revaluation never loads positions: UPDATEs per chunk plus range lookups."""
+        self._positions(session, mock_portfolio_item, {f"T{i}": 1.0 for i in range(10)})
+        valuation_service.store_prices(self.AS_OF, {f"T{i}": 10.0 for i in range(10)}, session)
+        session.commit()
+        
+        statements = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.split()[0].upper())
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            valuation_service.revalue(self.AS_OF, session, chunk_size=4)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        
+        # 1 chunk of portfolio items (rollup and reprice), 1 of users; 2 min/max lookups
+        assert statements.count("UPDATE") == 3
+        assert statements.count("SELECT") == 2
+    
+    @pytest.mark.slow
+    def test_revalue_benchmark(self, session: Session, mock_portfolio_item: PortfolioItem):
+        """Benchmark: 200k positions are repriced and rolled up in seconds."""
+        tickers = [f"T{i}" for i in range(500)]
+        user_ids = session.exec(
+            insert(User).returning(User.id), params=[{"name": "Follower", "balance_clp": 0.0} for _ in range(20_000)]
+        ).scalars().all()
+        items = session.exec(insert(PortfolioItem).returning(PortfolioItem.id, PortfolioItem.user_id), params=[
+            {"user_id": user_id, "tracker_id": mock_portfolio_item.tracker_id,
+             "invested_amount_clp": 1.0, "current_value_clp": 1.0}
+            for user_id in user_ids
+        ]).all()
+        item_ids = [item.id for item in items]
+        session.exec(insert(Position), params=[
+            {"portfolio_item_id": item.id, "user_id": item.user_id, "ticker": tickers[(item.id + i) % 500], "shares": 1.0}
+            for item in items for i in range(10)
+        ])
+        valuation_service.store_prices(self.AS_OF, {ticker: 1.0 for ticker in tickers}, session)
+        session.commit()
+        
+        report = valuation_service.revalue(self.AS_OF, session)
+        
+        print(f"revalue: {report.positions} positions in {report.elapsed_seconds:.2f}s")
+        assert report.positions == len(item_ids) * 10
+        assert report.elapsed_seconds < 30.0
+
+
+class TestPriceStore:
+    """Tests for the local Parquet price history."""
+    
+    def _frame(self, days, closes):
+        return pl.DataFrame({"date": [date(2025, 1, day) for day in days], "close": closes})
+    
+    def test_write_merges_by_date(self, prices: PriceStore):
+        """Test that rewrites merge into the ticker's file and the newest close wins."""
+        assert prices.write("aapl", self._frame([3, 2], [102.0, 101.0])) == 2
+        version = prices.version
+        assert prices.write("AAPL", self._frame([3, 6], [103.0, 106.0])) == 3
+        
+        assert prices.version > version
+        assert prices.tickers() == ["AAPL"]
+        stored = pl.read_parquet(prices.path("AAPL"))
+        assert stored["date"].to_list() == [date(2025, 1, 2), date(2025, 1, 3), date(2025, 1, 6)]
+        assert stored["close"].to_list() == [101.0, 103.0, 106.0]
+    
+    def test_matrix_aligns_and_forward_fills(self, prices: PriceStore):
+        """Test that tickers are aligned on the union of days, in request order."""
+        prices.write("AAPL", self._frame([2, 3, 6, 7], [1.0, 2.0, 3.0, 4.0]))
+        prices.write("SAP.DE", self._frame([3, 7], [10.0, 11.0]))
+        
+        matrix = prices.matrix(["sap.de", "AAPL", "NOPE"], start=date(2025, 1, 3))
+        
+        assert matrix.columns == ["date", "SAP.DE", "AAPL"]
+        assert matrix["date"].to_list() == [date(2025, 1, day) for day in (3, 6, 7)]
+        assert matrix["SAP.DE"].to_list() == [10.0, 10.0, 11.0]
+        assert matrix["AAPL"].to_list() == [2.0, 3.0, 4.0]
+        assert prices.last_prices(["AAPL", "SAP.DE"], as_of=date(2025, 1, 6)) == {"AAPL": 3.0, "SAP.DE": 10.0}
+    
+    def test_date_filter_is_pushed_into_the_scan(self, prices: PriceStore):
+        """Test that date bounds are applied while reading Parquet, not after."""
+        prices.write("AAPL", self._frame([2, 3], [1.0, 2.0]))
+        
+        plan = prices.scan(["AAPL"], start=date(2025, 1, 3)).explain()
+        
+        scan = plan[plan.index("Parquet SCAN"):]
+        assert "SELECTION" in scan and "2025-01-03" in scan
+    
+    def test_invalid_ticker_is_rejected(self, prices: PriceStore):
+        """Test that tickers can't escape the store directory."""
+        with pytest.raises(ValueError):
+            prices.path("../etc/passwd")
+    
+    def test_backfill_reads_yfinance_and_long_csvs(self, tmp_path, prices: PriceStore):
+        """Test that the backfill job accepts Yahoo exports and date,ticker,close files."""
+        export = tmp_path / "msft.csv"
+        export.write_text(
+            "Date,Open,High,Low,Close,Adj Close,Volume\n"
+            "2025-01-02,1,1,1,420.0,418.5,100\n"
+            "2025-01-03,1,1,1,null,null,100\n"
+        )
+        long = tmp_path / "closes.csv"
+        long.write_text("date,ticker,close\n2025-01-02,aapl,243.8\n2025-01-02,NVDA,138.3\n")
+        
+        assert backfill_prices.main([str(export), str(long)]) == 0
+        
+        assert prices.tickers() == ["AAPL", "MSFT", "NVDA"]
+        assert prices.last_prices(["MSFT", "AAPL"]) == {"MSFT": 418.5, "AAPL": 243.8}
+
+
+class TestBacktestService:
+    """Tests for the batched tracker backtester."""
+    
+    DAYS: ClassVar[List[date]] = [date(2024, 12, 30) + timedelta(days=i) for i in range(11)]  # Through 2025-01-09
+    
+    def _store_prices(self, prices: PriceStore):
+        prices.write("AAPL", pl.DataFrame({"date": self.DAYS, "close": [100 * 1.01 ** i for i in range(11)]}))
+        prices.write("MSFT", pl.DataFrame({"date": self.DAYS, "close": [50.0] * 11}))
+    
+    def test_replay_switches_and_holds(self):
+        """Test buy-and-hold between switches, bought at the switch day's close."""
+        prices = np.array([[10.0, np.nan], [20.0, 5.0], [40.0, 10.0], [20.0, 20.0]])
+        # Tracker 0: all A from day 0, all B from day 2. Tracker 1: half/half from day 0 (B unpriced yet)
+        growth = replay(
+            prices,
+            starts=np.array([0, 2, 0]),
+            owners=np.array([0, 0, 1]),
+            weights=np.array([[1.0, 0.0], [0.0, 1.0], [0.5, 0.5]]),
+            trackers=2
+        )
+        
+        assert growth[:, 0].tolist() == pytest.approx([1.0, 2.0, 4.0, 8.0])
+        assert growth[:, 1].tolist() == pytest.approx([1.0, 2.0, 4.0, 2.0])
+    
+    def test_run_models_filing_delay(
+        self, session: Session, prices: PriceStore, returns, mock_tracker_buffett: Tracker, mock_tracker_with_holdings: Tracker
+    ):
+        """Test that a fund's filing is copied average_delay days after its period, and ytd_return is derived."""
+        self._store_prices(prices)
+        holding_history_service.record_snapshot(mock_tracker_buffett.id, date(2024, 6, 30), [
+            {"ticker": "MSFT", "company_name": "Microsoft", "allocation_percent": 100.0},
+        ], session)
+        # Public 90 days later, on 2025-01-03
+        holding_history_service.record_snapshot(mock_tracker_buffett.id, date(2024, 10, 5), [
+            {"ticker": "AAPL", "company_name": "Apple", "allocation_percent": 100.0},
+        ], session)
+        session.commit()
+        
+        report = backtest_service.run(session, end=date(2025, 1, 9), years=1)
+        
+        assert (report.trackers, report.days, report.missing_tickers) == (2, 11, ["NVDA"])
+        buffett = returns.series(mock_tracker_buffett.id)["value"].to_list()
+        assert buffett[:5] == pytest.approx([1.0] * 5)
+        assert buffett[-1] == pytest.approx(1.01 ** 6)
+        # Pelosi has no snapshots: current holdings throughout, NVDA (unpriced) left out
+        pelosi_id = mock_tracker_with_holdings.id
+        pelosi = returns.series(pelosi_id)["value"].to_list()
+        assert pelosi[-1] == pytest.approx(5 / 9 * 1.01 ** 10 + 4 / 9)
+        
+        session.refresh(mock_tracker_buffett)
+        assert mock_tracker_buffett.ytd_return == pytest.approx((1.01 ** 6 - 1) * 100, abs=0.01)
+        ytd = returns.cumulative(pelosi_id)
+        assert ytd["date"][0] == date(2024, 12, 31)
+        assert ytd["return_percent"][-1] == pytest.approx(session.get(Tracker, pelosi_id).ytd_return, abs=0.01)
+    
+    def test_run_invalidates_catalog_of_other_processes(self, session: Session, prices: PriceStore, returns, mock_tracker_buffett: Tracker):
+        """Test that an API process serves the new ytd_return once the job has replaced the returns store."""
+        # Another process: the job's commit can't bump this cache directly
+        api = TrackerService(returns_path=returns.path)
+        before = api.get_tracker_json(mock_tracker_buffett.id, session)
+        self._store_prices(prices)
+        holding_history_service.record_snapshot(mock_tracker_buffett.id, date(2024, 6, 30), [
+            {"ticker": "AAPL", "company_name": "Apple", "allocation_percent": 100.0},
+        ], session)
+        session.commit()
+        
+        backtest_service.run(session, end=date(2025, 1, 9), years=1)
+        
+        after = api.get_tracker_json(mock_tracker_buffett.id, session)
+        assert after.etag != before.etag
+        assert json.loads(after.body)["ytd_return"] == pytest.approx((1.01 ** 9 - 1) * 100, abs=0.01)
+    
+    @pytest.mark.slow
+    def test_backtest_benchmark(self, session: Session, prices: PriceStore, returns):
+        """Benchmark: 500 trackers with 40 quarterly filings each, over 10 years of 300 tickers."""
+        rng = np.random.default_rng(7)
+        days = [date(2015, 1, 1) + timedelta(days=i) for i in range(3653)]
+        tickers = [f"T{i}" for i in range(300)]
+        for ticker in tickers:
+            prices.write(ticker, pl.DataFrame({"date": days, "close": 100 * np.cumprod(1 + rng.normal(0, 0.01, len(days)))}))
+        session.exec(insert(Tracker), params=[
+            {"name": f"Fund {i}", "type": "fund", "risk_level": "Low", "average_delay": 45} for i in range(500)
+        ])
+        tracker_ids = session.exec(select(Tracker.id)).all()
+        quarters = [date(2015 + q // 4, 3 * (q % 4) + 1, 1) - timedelta(days=1) for q in range(1, 41)]
+        session.exec(insert(HoldingSnapshot), params=[
+            {"tracker_id": tracker_id, "period": period, "ticker": tickers[(tracker_id * 7 + q * 3 + k) % 300],
+             "company_name": "", "allocation_percent": 10.0}
+            for tracker_id in tracker_ids for q, period in enumerate(quarters) for k in range(10)
+        ])
+        session.commit()
+        
+        report = backtest_service.run(session, end=days[-1], years=10)
+        
+        print(f"backtest: {report.trackers} trackers, {report.switches} switches, {report.days} days in {report.elapsed_seconds:.2f}s")
+        assert report.trackers == 500
+        assert report.elapsed_seconds < 60.0
+
+
+class TestChartService:
+    """Tests for chart downsampling."""
+    
+    def _reference_lttb(self, x, y, max_points):
+        """Textbook, point-by-point LTTB."""
+        every = (len(x) - 2) / (max_points - 2)
+        kept, anchor = [0], 0
+        for bucket in range(max_points - 2):
+            start, end = int(bucket * every) + 1, int((bucket + 1) * every) + 1
+            next_end = min(int((bucket + 2) * every) + 1, len(x))
+            if bucket == max_points - 3:
+                next_x, next_y = x[-1], y[-1]
+            else:
+                next_x, next_y = np.mean(x[end:next_end]), np.mean(y[end:next_end])
+            areas = [abs((x[anchor] - next_x) * (y[i] - y[anchor]) - (x[anchor] - x[i]) * (next_y - y[anchor])) for i in range(start, end)]
+            anchor = start + int(np.argmax(areas))
+            kept.append(anchor)
+        return kept + [len(x) - 1]
+    
+    def test_lttb_matches_reference(self):
+        """Test the bucketed implementation against the point-by-point algorithm."""
+        rng = np.random.default_rng(3)
+        x = np.arange(1000, dtype=float)
+        y = np.cumsum(rng.normal(size=1000))
+        
+        kept = lttb_indices(x, y, 50)
+        
+        assert kept.tolist() == self._reference_lttb(x, y, 50)
+    
+    def test_lttb_keeps_extremes(self):
+        """Test that a one-day spike survives downsampling and short series are untouched."""
+        y = np.zeros(3650)
+        y[1234] = 50.0
+        
+        kept = lttb_indices(np.arange(3650), y, 100)
+        
+        assert len(kept) == 100 and kept[0] == 0 and kept[-1] == 3649
+        assert 1234 in kept
+        assert lttb_indices(np.arange(10), np.zeros(10), 100).tolist() == list(range(10))
+    
+    def test_downsample_columns_shares_one_index(self):
+        """Test that compared series are cut to one budget and keep each other's extremes."""
+        a, b = np.zeros(2000), np.zeros(2000)
+        a[300], b[1700] = 9.0, -9.0
+        frame = pl.DataFrame({"date": [date(2015, 1, 1) + timedelta(days=i) for i in range(2000)], "A": a, "B": b})
+        
+        reduced = downsample_columns(frame, 100)
+        
+        assert reduced.height <= 100
+        assert reduced["A"].max() == 9.0 and reduced["B"].min() == -9.0
+    
+    def test_downsample_columns_never_exceeds_budget(self):
+        """Test that the union of every series' points fits max_points, and smaller budgets are rejected."""
+        rng = np.random.default_rng(3)
+        frame = pl.DataFrame({
+            "date": [date(2015, 1, 1) + timedelta(days=i) for i in range(500)],
+            **{f"S{i}": rng.normal(size=500) for i in range(5)},
+        })
+        
+        assert downsample_columns(frame, 15).height <= 15
+        assert downsample_columns(frame, 17).height <= 17
+        with pytest.raises(ValueError):
+            downsample_columns(frame, 14)
 
 
 class TestInvestmentService:
     """Tests for InvestmentService."""
     
     @pytest.mark.anyio
-    async def test_execute_investment_success(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker):
+    async def test_execute_investment_success(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker, mock_tracker_with_holdings: Tracker):
         """Test successful investment execution."""
         service = InvestmentService()
         result = await service.execute_investment(
@@ -112,7 +1035,7 @@ class TestInvestmentService:
         assert "Insufficient funds" in result["error"]
     
     @pytest.mark.anyio
-    async def test_execute_investment_creates_portfolio_item(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker):
+    async def test_execute_investment_creates_portfolio_item(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker, mock_tracker_with_holdings: Tracker):
         """Test that investment creates a portfolio item."""
         service = InvestmentService()
         await service.execute_investment(
@@ -134,7 +1057,7 @@ class TestInvestmentService:
         assert portfolio_item.invested_amount_clp == 50_000
     
     @pytest.mark.anyio
-    async def test_execute_investment_updates_existing_portfolio_item(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker, mock_portfolio_item: PortfolioItem):
+    async def test_execute_investment_updates_existing_portfolio_item(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker, mock_tracker_with_holdings: Tracker, mock_portfolio_item: PortfolioItem):
         """Test that second investment updates existing portfolio item."""
         initial_invested = mock_portfolio_item.invested_amount_clp
         
@@ -149,6 +1072,200 @@ class TestInvestmentService:
         # Refresh and check updated amount
         session.refresh(mock_portfolio_item)
         assert mock_portfolio_item.invested_amount_clp == initial_invested + 30_000
+    
+    @pytest.mark.anyio
+    async def test_execute_investment_records_positions(self, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker):
+        """Test that fills are accumulated into one position per ticker."""
+        service = InvestmentService()
+        for amount in (75_000, 25_000):
+            await service.execute_investment(
+                user_id=mock_user.id,
+                tracker_id=mock_tracker_with_holdings.id,
+                amount_clp=amount,
+                session=session
+            )
+        
+        positions = session.exec(select(Position).where(Position.user_id == mock_user.id)).all()
+        assert sorted(p.ticker for p in positions) == ["AAPL", "MSFT", "NVDA"]
+        assert len({p.portfolio_item_id for p in positions}) == 1
+        by_ticker = {p.ticker: p for p in positions}
+        assert sum(p.cost_basis_clp for p in positions) == pytest.approx(100_000)
+        assert by_ticker["NVDA"].cost_basis_clp == pytest.approx(40_000)
+        assert by_ticker["NVDA"].market_value_clp == by_ticker["NVDA"].cost_basis_clp
+        assert by_ticker["NVDA"].shares > 0
+    
+    @pytest.mark.anyio
+    async def test_allocate_orders_splits_by_weight(self, session: Session, mock_tracker_with_holdings: Tracker):
+        """Test that the amount is split across holdings by normalised allocation."""
+        holdings = TrackerService().get_tracker_holdings(mock_tracker_with_holdings.id, session)
+        
+        service = InvestmentService()
+        orders = await service.allocate_orders(holdings, 75_000)
+        
+        by_ticker = {o["ticker"]: o for o in orders}
+        assert set(by_ticker) == {"AAPL", "NVDA", "MSFT"}
+        assert sum(o["amount_clp"] for o in orders) == pytest.approx(75_000)
+        assert by_ticker["NVDA"]["amount_clp"] == pytest.approx(30_000)
+        assert by_ticker["AAPL"]["shares"] == pytest.approx(25_000 / (195.0 * 950))
+    
+    @pytest.mark.anyio
+    async def test_execute_orders_runs_batches_concurrently(self, monkeypatch):
+        """Test that latency is bounded by the slowest batch, not the sum."""
+        monkeypatch.setattr(settings, "ORDER_NETTING_WINDOW_MS", 0)
+        monkeypatch.setattr(settings, "BROKER_BATCH_SIZE", 1)
+        orders = [{"ticker": f"T{i}", "amount_clp": 1_000, "shares": 1.0} for i in range(10)]
+        
+        service = InvestmentService()
+        started = time.perf_counter()
+        execution = await service.execute_orders(1, orders, max_concurrency=10)
+        elapsed = time.perf_counter() - started
+        
+        assert execution["success"] is True
+        assert len(execution["fills"]) == 10
+        assert elapsed < 1.5  # Serial execution would take ~5s
+    
+    @pytest.mark.anyio
+    async def test_execute_orders_batches_broker_calls(self, monkeypatch):
+        """Test that orders are grouped into BROKER_BATCH_SIZE requests."""
+        monkeypatch.setattr(settings, "ORDER_NETTING_WINDOW_MS", 0)
+        monkeypatch.setattr(settings, "BROKER_BATCH_SIZE", 4)
+        batch_sizes = []
+        
+        async def record_batch(orders):
+            batch_sizes.append(len(orders))
+            return [await broker_service._fill(o["ticker"], o["shares"], o["action"]) for o in orders]
+        
+        monkeypatch.setattr(broker_service, "execute_trades", record_batch)
+        orders = [{"ticker": "AAPL", "amount_clp": 1_000, "shares": 1.0} for _ in range(10)]
+        
+        execution = await InvestmentService().execute_orders(1, orders)
+        
+        assert execution["success"] is True
+        assert sorted(batch_sizes) == [2, 4, 4]
+    
+    @pytest.mark.anyio
+    async def test_execute_orders_reports_failed_legs(self, monkeypatch):
+        """Test that broker errors are surfaced as failed fills."""
+        async def failing_trades(orders):
+            raise RuntimeError("broker unavailable")
+        
+        monkeypatch.setattr(broker_service, "execute_trades", failing_trades)
+        
+        service = InvestmentService()
+        execution = await service.execute_orders(1, [{"ticker": "AAPL", "amount_clp": 1_000, "shares": 1.0}])
+        
+        assert execution["success"] is False
+        assert execution["fills"][0]["error"] == "broker unavailable"
+    
+    @pytest.mark.anyio
+    async def test_failed_leg_is_refunded_and_filled_legs_kept(self, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker, monkeypatch):
+        """Test that a failed leg's budget is refunded while the filled legs are recorded, not given away."""
+        async def nvda_rejected(orders):
+            return [
+                {"success": False, "ticker": o["ticker"], "error": "rejected"} if o["ticker"] == "NVDA"
+                else {"success": True, "ticker": o["ticker"], "shares": o["shares"], "price": 1.0,
+                      "total_value": o["shares"], "action": o["action"], "status": "filled"}
+                for o in orders
+            ]
+        monkeypatch.setattr(broker_service, "execute_trades", nvda_rejected)
+        balance = mock_user.balance_clp
+        
+        result = await InvestmentService().execute_investment(mock_user.id, mock_tracker_with_holdings.id, 100_000, session)
+        
+        # NVDA is 40% of the tracker
+        assert result["success"] is True
+        assert result["invested_clp"] == pytest.approx(60_000)
+        assert result["refunded_clp"] == pytest.approx(40_000)
+        assert "NVDA" in result["message"]
+        session.refresh(mock_user)
+        assert mock_user.balance_clp == pytest.approx(balance - 60_000)
+        assert session.exec(select(PortfolioItem)).one().invested_amount_clp == pytest.approx(60_000)
+        assert session.exec(select(Transaction)).one().amount_clp == pytest.approx(60_000)
+        assert sorted(p.ticker for p in session.exec(select(Position)).all()) == ["AAPL", "MSFT"]
+    
+    @pytest.mark.anyio
+    async def test_broker_error_releases_reserved_funds(self, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker, monkeypatch):
+        """Test that funds reserved before placing orders are credited back when the quote lookup raises."""
+        async def quotes_down(tickers):
+            raise RuntimeError("quotes unavailable")
+        monkeypatch.setattr(broker_service, "get_current_prices", quotes_down)
+        balance = mock_user.balance_clp
+        
+        result = await InvestmentService().execute_investment(mock_user.id, mock_tracker_with_holdings.id, 100_000, session)
+        
+        assert result == {"success": False, "error": "Order execution failed: quotes unavailable"}
+        session.refresh(mock_user)
+        assert mock_user.balance_clp == balance
+        assert session.exec(select(Transaction)).all() == []
+    
+    @pytest.mark.anyio
+    async def test_tracker_without_holdings_is_refunded(self, async_session: AsyncSession, session: Session, mock_user: User, mock_tracker_pelosi: Tracker):
+        """Test that investing in a tracker with no holdings fails and refunds instead of reporting success."""
+        balance = mock_user.balance_clp
+        
+        result = await AsyncInvestmentService().execute_investment(mock_user.id, mock_tracker_pelosi.id, 100_000, async_session)
+        
+        assert result == {"success": False, "error": "Tracker has no holdings to invest in"}
+        session.refresh(mock_user)
+        assert mock_user.balance_clp == balance
+        assert session.exec(select(PortfolioItem)).all() == []
+    
+    @pytest.mark.anyio
+    async def test_emptied_item_is_not_counted_as_new(self, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker):
+        """Test that adding to an existing item holding nothing doesn't count the tracker twice."""
+        session.add(PortfolioItem(
+            user_id=mock_user.id, tracker_id=mock_tracker_with_holdings.id, invested_amount_clp=0.0, current_value_clp=0.0
+        ))
+        session.commit()
+        summary_service.rebuild(session)
+        session.commit()
+        
+        result = await InvestmentService().execute_investment(mock_user.id, mock_tracker_with_holdings.id, 100_000, session)
+        
+        assert result["success"] is True
+        assert session.exec(select(PortfolioItem)).one().invested_amount_clp == pytest.approx(100_000)
+        assert session.get(PortfolioSummary, mock_user.id).tracker_count == 1
+        assert summary_service.find_drift(session) == []
+    
+    @pytest.mark.anyio
+    async def test_partial_fill_records_only_filled_value(self, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker, monkeypatch):
+        """Test that when the broker fills less than requested, only the filled value is invested and the rest refunded."""
+        async def half_nvda(orders):
+            fills = []
+            for o in orders:
+                shares = o["shares"] / 2 if o["ticker"] == "NVDA" else o["shares"]
+                fills.append({"success": True, "ticker": o["ticker"], "shares": shares, "price": 1.0, "total_value": shares,
+                              "action": o["action"], "status": "partially_filled" if shares < o["shares"] else "filled"})
+            return fills
+        monkeypatch.setattr(broker_service, "execute_trades", half_nvda)
+        balance = mock_user.balance_clp
+        
+        result = await InvestmentService().execute_investment(mock_user.id, mock_tracker_with_holdings.id, 100_000, session)
+        
+        # Half of NVDA's 40k did not fill
+        assert result["invested_clp"] == pytest.approx(80_000)
+        assert result["refunded_clp"] == pytest.approx(20_000)
+        assert "Partially filled: NVDA" in result["message"]
+        session.refresh(mock_user)
+        assert mock_user.balance_clp == pytest.approx(balance - 80_000)
+        assert session.exec(select(PortfolioItem)).one().current_value_clp == pytest.approx(80_000)
+        assert session.exec(select(Transaction)).one().amount_clp == pytest.approx(80_000)
+        assert session.get(PortfolioSummary, mock_user.id).total_invested_clp == pytest.approx(80_000)
+    
+    @pytest.mark.anyio
+    async def test_execute_investment_places_order_per_holding(self, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker):
+        """Test that investing places one filled order per tracker holding."""
+        service = InvestmentService()
+        result = await service.execute_investment(
+            user_id=mock_user.id,
+            tracker_id=mock_tracker_with_holdings.id,
+            amount_clp=100_000,
+            session=session
+        )
+        
+        assert result["success"] is True
+        assert sorted(f["ticker"] for f in result["fills"]) == ["AAPL", "MSFT", "NVDA"]
+        assert all(f["status"] == "filled" for f in result["fills"])
 
 
 class TestPortfolioService:
@@ -217,3 +1334,442 @@ class TestPortfolioService:
         
         assert "error" in portfolio
         assert portfolio["error"] == "User not found"
+    
+    @pytest.mark.parametrize("tracker_count", [1, 500])
+    def test_get_user_portfolio_query_count(self, engine, session: Session, mock_user: User, tracker_count: int):
+        """Test that the number of statements doesn't grow with the trackers followed."""
+        trackers = [Tracker(name=f"Tracker {i}", type="fund", risk_level="low") for i in range(tracker_count)]
+        session.add_all(trackers)
+        session.flush()
+        session.add_all([
+            PortfolioItem(user_id=mock_user.id, tracker_id=tracker.id, invested_amount_clp=1_000, current_value_clp=1_100)
+            for tracker in trackers
+        ])
+        summary_service.rebuild(session)
+        session.commit()
+        user_id = mock_user.id
+        
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            portfolio = PortfolioService().get_user_portfolio(user_id, session)
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        
+        assert len(statements) == 2
+        assert len(portfolio["active_trackers"]) == tracker_count
+        assert portfolio["total_invested_clp"] == 1_000 * tracker_count
+
+
+class TestSummaryService:
+    """Tests for the PortfolioSummary read model."""
+    
+    @pytest.mark.anyio
+    async def test_investment_and_balance_changes_update_summary(self, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker, monkeypatch):
+        """Test that every write path keeps the summary equal to a full recompute."""
+        monkeypatch.setattr(settings, "ORDER_NETTING_WINDOW_MS", 0)
+        service = InvestmentService()
+        
+        await service.execute_investment(mock_user.id, mock_tracker_with_holdings.id, 100_000, session)
+        await service.execute_investment(mock_user.id, mock_tracker_with_holdings.id, 50_000, session)
+        BalanceService().credit(mock_user.id, 20_000, session)
+        session.commit()
+        
+        summary = session.get(PortfolioSummary, mock_user.id)
+        assert summary.available_balance_clp == 870_000
+        assert summary.total_invested_clp == 150_000
+        assert summary.tracker_count == 1
+        assert summary_service.find_drift(session) == []
+    
+    def test_summary_created_from_existing_data(self, session: Session, mock_user: User, mock_portfolio_item: PortfolioItem):
+        """Test that a user's first write seeds the summary from their existing items."""
+        BalanceService().debit(mock_user.id, 1_000, session)
+        session.commit()
+        
+        summary = session.get(PortfolioSummary, mock_user.id)
+        assert summary.available_balance_clp == 999_000
+        assert summary.total_invested_clp == 50_000
+        assert summary.total_current_value_clp == 52_500
+        assert summary.tracker_count == 1
+    
+    def test_find_drift_and_rebuild(self, session: Session, mock_user: User, mock_portfolio_item: PortfolioItem):
+        """Test that drifted or missing summaries are reported and repaired."""
+        drift = summary_service.find_drift(session)
+        assert [row["user_id"] for row in drift] == [mock_user.id]
+        
+        summary_service.rebuild(session)
+        session.commit()
+        assert summary_service.find_drift(session) == []
+        
+        mock_portfolio_item.current_value_clp = 60_000
+        session.add(mock_portfolio_item)
+        session.commit()
+        drift = summary_service.find_drift(session)
+        assert drift[0]["total_current_value_clp"] == 60_000
+        assert drift[0]["stored_total_current_value_clp"] == 52_500
+
+
+class TestAsyncServices:
+    """Tests for the AsyncSession-based services."""
+    
+    @pytest.mark.anyio
+    async def test_async_execute_investment(self, async_session: AsyncSession, mock_user: User, mock_tracker_with_holdings: Tracker):
+        """Test investing through the async service."""
+        result = await AsyncInvestmentService().execute_investment(
+            user_id=mock_user.id,
+            tracker_id=mock_tracker_with_holdings.id,
+            amount_clp=50_000,
+            session=async_session
+        )
+        
+        assert result["success"] is True
+        assert result["remaining_balance"] == 950_000
+        assert len(result["fills"]) == 3
+    
+    @pytest.mark.anyio
+    async def test_async_execute_investment_insufficient_funds(self, async_session: AsyncSession, mock_user_low_balance: User, mock_tracker_pelosi: Tracker):
+        """Test that the async service rejects investments above buying power."""
+        result = await AsyncInvestmentService().execute_investment(
+            user_id=mock_user_low_balance.id,
+            tracker_id=mock_tracker_pelosi.id,
+            amount_clp=50_000,
+            session=async_session
+        )
+        
+        assert "Insufficient funds" in result["error"]
+    
+    @pytest.mark.anyio
+    async def test_async_portfolio_matches_sync(self, session: Session, async_session: AsyncSession, mock_user: User, mock_portfolio_item: PortfolioItem):
+        """Test that the async portfolio summary matches the sync one."""
+        sync_portfolio = PortfolioService().get_user_portfolio(mock_user.id, session)
+        async_portfolio = await AsyncPortfolioService().get_user_portfolio(mock_user.id, async_session)
+        
+        assert async_portfolio == sync_portfolio
+    
+    @pytest.mark.anyio
+    async def test_async_user_transactions(self, session: Session, async_session: AsyncSession, mock_user: User, mock_tracker_pelosi: Tracker):
+        """Test listing transactions through the async service."""
+        session.add(Transaction(user_id=mock_user.id, tracker_id=mock_tracker_pelosi.id, type="buy", amount_clp=10_000))
+        session.commit()
+        
+        transactions = await AsyncTransactionService().get_user_transactions(mock_user.id, async_session)
+        
+        assert len(transactions) == 1
+        assert transactions[0]["tracker_name"] == "Nancy Pelosi"
+
+
+class TestBalanceService:
+    """Tests for atomic balance debits and credits."""
+    
+    def test_debit_and_credit(self, session: Session, mock_user: User):
+        """Test that debit and credit return the updated balance."""
+        service = BalanceService()
+        
+        assert service.debit(mock_user.id, 400_000, session).balance_clp == 600_000
+        assert service.credit(mock_user.id, 50_000, session).balance_clp == 650_000
+        session.commit()
+        
+        session.refresh(mock_user)
+        assert mock_user.balance_clp == 650_000
+    
+    def test_debit_rejects_overdraft(self, session: Session, mock_user_low_balance: User):
+        """Test that a debit above the balance matches no row."""
+        service = BalanceService()
+        
+        assert service.debit(mock_user_low_balance.id, 20_001, session) is None
+        assert service.debit(999, 1, session) is None
+    
+    def test_concurrent_withdrawals_never_overdraw(self, engine, mock_user: User):
+        """Stress test: 20 simultaneous 100k debits against a 1M balance."""
+        barrier = threading.Barrier(20)
+        
+        def withdraw(_):
+            with Session(engine) as worker_session:
+                barrier.wait()
+                debited = BalanceService().debit(mock_user.id, 100_000, worker_session)
+                worker_session.commit()
+                return debited is not None
+        
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(withdraw, range(20)))
+        
+        with Session(engine) as check_session:
+            balance = check_session.get(User, mock_user.id).balance_clp
+        assert sum(results) == 10
+        assert balance == 0
+    
+    @pytest.mark.anyio
+    async def test_concurrent_investments_never_overdraw(self, async_engine, mock_user: User, mock_tracker_pelosi: Tracker, mock_tracker_with_holdings: Tracker):
+        """Stress test: concurrent async investments for the same user."""
+        async def invest():
+            async with AsyncSession(async_engine, expire_on_commit=False) as worker_session:
+                result = await AsyncInvestmentService().execute_investment(
+                    user_id=mock_user.id,
+                    tracker_id=mock_tracker_pelosi.id,
+                    amount_clp=300_000,
+                    session=worker_session
+                )
+                return result["success"]
+        
+        results = await asyncio.gather(*(invest() for _ in range(10)))
+        
+        async with AsyncSession(async_engine) as check_session:
+            balance = (await check_session.get(User, mock_user.id)).balance_clp
+        assert sum(results) == 3
+        assert balance == 100_000
+
+
+class TestIdempotencyService:
+    """Tests for IdempotencyService."""
+    
+    @pytest.mark.anyio
+    async def test_concurrent_duplicates_run_once(self, async_engine):
+        """Test that concurrent requests with one key wait for the first."""
+        calls = []
+        
+        async def handler():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"order": len(calls)}
+        
+        service = IdempotencyService()
+        
+        async def request():
+            async with AsyncSession(async_engine, expire_on_commit=False) as request_session:
+                response = await service.run("key-1", "invest", {"amount": 1}, handler, request_session)
+                return response.body
+        
+        bodies = await asyncio.gather(*(request() for _ in range(5)))
+        
+        assert len(calls) == 1
+        assert len(set(bodies)) == 1
+    
+    @pytest.mark.anyio
+    async def test_replays_from_table_after_restart(self, async_engine):
+        """Test that a new worker (empty LRU) replays the stored response."""
+        async def handler():
+            return {"ok": True}
+        
+        async with AsyncSession(async_engine, expire_on_commit=False) as first_session:
+            await IdempotencyService().run("key-2", "invest", {}, handler, first_session)
+        
+        async def must_not_run():
+            raise AssertionError("handler ran twice")
+        
+        async with AsyncSession(async_engine, expire_on_commit=False) as retry_session:
+            response = await IdempotencyService().run("key-2", "invest", {}, must_not_run, retry_session)
+        
+        assert response.headers["Idempotent-Replayed"] == "true"
+    
+    @pytest.mark.anyio
+    async def test_unexpected_error_releases_key(self, async_session: AsyncSession):
+        """Test that a crashed request can be retried with the same key."""
+        async def crash():
+            raise RuntimeError("boom")
+        
+        async def succeed():
+            return {"ok": True}
+        
+        service = IdempotencyService()
+        with pytest.raises(RuntimeError):
+            await service.run("key-3", "invest", {}, crash, async_session)
+        response = await service.run("key-3", "invest", {}, succeed, async_session)
+        
+        assert response.status_code == 200
+    
+    @pytest.mark.anyio
+    async def test_expired_claim_is_taken_over(self, async_session: AsyncSession):
+        """Test that a claim abandoned by a crashed worker before it changed anything is retried after its lease."""
+        stale = datetime.utcnow() - timedelta(seconds=120)
+        async_session.add(IdempotencyKey(
+            scope="invest", key="key-4", request_hash=request_fingerprint({}), created_at=stale, claimed_at=stale
+        ))
+        await async_session.commit()
+        
+        async def succeed():
+            return {"ok": True}
+        
+        response = await IdempotencyService(lease_seconds=60).run("key-4", "invest", {}, succeed, async_session)
+        
+        assert response.status_code == 200
+        assert "Idempotent-Replayed" not in response.headers
+    
+    @pytest.mark.anyio
+    async def test_unfinished_claims_are_not_run_again(self, async_session: AsyncSession):
+        """Test that live claims and applied ones (even stale) answer 409, and 422 for another payload."""
+        stale = datetime.utcnow() - timedelta(seconds=120)
+        async_session.add(IdempotencyKey(scope="invest", key="live", request_hash=request_fingerprint({})))
+        async_session.add(IdempotencyKey(
+            scope="invest", key="applied", request_hash=request_fingerprint({}), status="applied",
+            created_at=stale, claimed_at=stale
+        ))
+        await async_session.commit()
+        
+        async def must_not_run():
+            raise AssertionError("handler ran while the key was unfinished")
+        
+        service = IdempotencyService(lease_seconds=60)
+        for key, payload, status_code in (("live", {}, 409), ("applied", {}, 409), ("live", {"amount": 2}, 422)):
+            with pytest.raises(HTTPException) as exc_info:
+                await service.run(key, "invest", payload, must_not_run, async_session)
+            assert exc_info.value.status_code == status_code
+    
+    @pytest.mark.anyio
+    async def test_crash_after_commit_is_never_retried(self, async_session: AsyncSession, mock_user: User):
+        """Test that a handler that committed its changes and then crashed is not run again, even after the lease."""
+        async def deposit_then_crash():
+            await async_session.exec(update(User).where(User.id == mock_user.id).values(balance_clp=User.balance_clp + 1_000))
+            await async_session.commit()
+            raise RuntimeError("crashed before storing the response")
+        
+        service = IdempotencyService(lease_seconds=60)
+        with pytest.raises(RuntimeError):
+            await service.run("key-7", "deposit", {}, deposit_then_crash, async_session)
+        
+        assert (await async_session.exec(select(IdempotencyKey.status))).one() == "applied"
+        await async_session.exec(update(IdempotencyKey).values(claimed_at=datetime.utcnow() - timedelta(seconds=120)))
+        await async_session.commit()
+        with pytest.raises(HTTPException) as exc_info:
+            await IdempotencyService(lease_seconds=60).run("key-7", "deposit", {}, deposit_then_crash, async_session)
+        assert exc_info.value.status_code == 409
+    
+    @pytest.mark.anyio
+    async def test_slow_handler_cannot_commit_after_takeover(self, async_session: AsyncSession, async_engine, mock_user: User):
+        """Test that a handler whose claim was taken over has its changes rolled back instead of applied twice."""
+        balance = mock_user.balance_clp
+        
+        async def slow_deposit():
+            # Meanwhile the lease expired and a retry took the claim over
+            async with AsyncSession(async_engine) as retry_session:
+                await retry_session.exec(update(IdempotencyKey).values(claimed_at=datetime.utcnow() + timedelta(seconds=1)))
+                await retry_session.commit()
+            await async_session.exec(update(User).where(User.id == mock_user.id).values(balance_clp=User.balance_clp + 1_000))
+            await async_session.commit()
+            return {"ok": True}
+        
+        response = await IdempotencyService().run("key-6", "deposit", {}, slow_deposit, async_session)
+        
+        assert response.status_code == 409
+        assert (await async_session.get(User, mock_user.id, populate_existing=True)).balance_clp == balance
+        assert (await async_session.exec(select(IdempotencyKey.status))).one() == "in_progress"
+    
+    @pytest.mark.anyio
+    async def test_prune_deletes_only_old_keys(self, async_session: AsyncSession):
+        """Test that pruning removes keys older than the cutoff."""
+        now = datetime.utcnow()
+        async_session.add(IdempotencyKey(scope="invest", key="old", request_hash="h", status="completed", created_at=now - timedelta(days=2)))
+        async_session.add(IdempotencyKey(scope="invest", key="new", request_hash="h", status="completed", created_at=now))
+        await async_session.commit()
+        
+        pruned = await IdempotencyService().prune(now - timedelta(days=1), async_session)
+        
+        assert pruned == 1
+        keys = (await async_session.exec(select(IdempotencyKey.key))).all()
+        assert keys == ["new"]
+
+
+class TestOrderWorkerPool:
+    """Tests for the queued order workers."""
+    
+    @pytest.mark.anyio
+    async def test_claims_are_disjoint_batches(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker, order_workers):
+        """Test that concurrent claims never hand the same order to two workers."""
+        for _ in range(5):
+            session.add(InvestmentOrder(user_id=mock_user.id, tracker_id=mock_tracker_pelosi.id, amount_clp=1_000))
+        session.commit()
+        order_workers.batch_size = 2
+        
+        batches = await asyncio.gather(*(order_workers.claim() for _ in range(4)))
+        
+        claimed = [order.id for batch in batches for order in batch]
+        assert len(claimed) == 5
+        assert len(set(claimed)) == 5
+        assert max(len(batch) for batch in batches) == 2
+        assert all(order.status == "submitted" for order in session.exec(select(InvestmentOrder)).all())
+    
+    @pytest.mark.anyio
+    async def test_workers_drain_queue(self, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker, order_workers):
+        """Test that started workers pick up queued orders and fill them."""
+        for _ in range(3):
+            session.add(InvestmentOrder(user_id=mock_user.id, tracker_id=mock_tracker_with_holdings.id, amount_clp=10_000))
+        session.commit()
+        
+        order_workers.start()
+        order_workers.notify()
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            orders = session.exec(select(InvestmentOrder).execution_options(populate_existing=True)).all()
+            if all(order.status == "filled" for order in orders):
+                break
+        await order_workers.stop()
+        
+        assert [order.status for order in orders] == ["filled"] * 3
+        assert session.exec(select(PortfolioItem)).one().invested_amount_clp == 30_000
+    
+    @pytest.mark.anyio
+    async def test_concurrent_workers_share_one_portfolio_item(self, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker, async_engine):
+        """Test that orders for one (user, tracker) on several workers add up in a single item."""
+        for _ in range(6):
+            session.add(InvestmentOrder(user_id=mock_user.id, tracker_id=mock_tracker_with_holdings.id, amount_clp=10_000))
+        session.commit()
+        pools = [
+            OrderWorkerPool(workers=1, batch_size=1, session_factory=lambda: AsyncSession(async_engine, expire_on_commit=False))
+            for _ in range(3)
+        ]
+        
+        await asyncio.gather(*(pool.drain() for pool in pools))
+        
+        item = session.exec(select(PortfolioItem)).one()
+        assert item.invested_amount_clp == 60_000
+        assert session.get(PortfolioSummary, mock_user.id).tracker_count == 1
+    
+    @pytest.mark.anyio
+    async def test_reap_refunds_expired_leases(self, session: Session, mock_user: User, mock_tracker_with_holdings: Tracker, order_workers):
+        """Test that orders stuck in 'submitted' past the lease are expired and refunded, and a late worker still records its fills."""
+        balance = mock_user.balance_clp
+        stale, fresh = (
+            InvestmentOrder(user_id=mock_user.id, tracker_id=mock_tracker_with_holdings.id, amount_clp=10_000,
+                            status="submitted", updated_at=datetime.utcnow() - timedelta(seconds=age))
+            for age in (order_workers.lease_seconds + 1, 0)
+        )
+        session.add_all([stale, fresh])
+        session.commit()
+        
+        assert await order_workers.reap() == 1
+        
+        session.refresh(stale)
+        session.refresh(fresh)
+        session.refresh(mock_user)
+        assert (stale.status, stale.error, fresh.status) == ("expired", "Order lease expired", "submitted")
+        assert mock_user.balance_clp == balance + 10_000
+        
+        # The worker still holding the reaped order was only slow: its shares
+        # are recorded and the refund is taken back
+        await order_workers._process(stale)
+        session.refresh(stale)
+        session.refresh(mock_user)
+        assert (stale.status, stale.error) == ("filled", None)
+        assert session.exec(select(PortfolioItem)).one().invested_amount_clp == pytest.approx(10_000)
+        assert sorted(p.ticker for p in session.exec(select(Position)).all()) == ["AAPL", "MSFT", "NVDA"]
+        assert mock_user.balance_clp == pytest.approx(balance)
+        assert summary_service.find_drift(session) == []
+    
+    @pytest.mark.anyio
+    async def test_unexpected_error_fails_and_refunds(self, session: Session, mock_user: User, mock_tracker_pelosi: Tracker, order_workers, monkeypatch):
+        """Test that an order whose processing crashes is failed and refunded instead of left 'submitted'."""
+        balance = mock_user.balance_clp
+        session.add(InvestmentOrder(user_id=mock_user.id, tracker_id=mock_tracker_pelosi.id, amount_clp=10_000))
+        session.commit()
+        
+        async def crash(service, order, async_session):
+            raise RuntimeError("boom")
+        monkeypatch.setattr(AsyncInvestmentService, "process_order", crash)
+        
+        assert await order_workers.drain() == 1
+        
+        order = session.exec(select(InvestmentOrder)).one()
+        session.refresh(mock_user)
+        assert (order.status, order.error) == ("failed", "Order processing failed: boom")
+        assert mock_user.balance_clp == balance + 10_000
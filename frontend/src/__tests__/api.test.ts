@@ -235,16 +235,16 @@ describe('API Client', () => {
   });
 
   describe('Chart API', () => {
-    it('should call chart test endpoint without trailing slash', async () => {
-      const mockPost = vi.fn().mockResolvedValue({ data: { spec: {} } });
+    it('should get the tracker chart for a range without trailing slash', async () => {
+      const mockGet = vi.fn().mockResolvedValue({ data: { spec: {} } });
       mockedAxios.create.mockReturnValue({
-        post: mockPost,
+        get: mockGet,
       } as any);
 
-      await chartApi.getChart();
+      await chartApi.getChart(1, '1y', 200);
 
-      expect(mockPost).toHaveBeenCalledWith('chart/test', expect.anything());
-      expect(mockPost).not.toHaveBeenCalledWith('chart/test/', expect.anything());
+      expect(mockGet).toHaveBeenCalledWith('chart/trackers/1', { params: { range: '1y', max_points: 200 } });
+      expect(mockGet).not.toHaveBeenCalledWith('chart/trackers/1/', expect.anything());
     });
   });
 
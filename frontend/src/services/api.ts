@@ -36,6 +36,23 @@ export const trackerApi = {
     return response.data;
   },
 
+  // Filtered/sorted marketplace page; pass nextCursor back as `cursor` for the next page
+  getTrackerPage: async (params: {
+    type?: string;
+    risk_level?: string;
+    sort?: "id" | "ytd_return" | "followers_count" | "average_delay";
+    order?: "asc" | "desc";
+    limit?: number;
+    cursor?: string;
+    include?: "holdings"; // Nest each tracker's holdings (one request for the whole page)
+  }) => {
+    const response = await apiClient.get("trackers/", { params });
+    return {
+      trackers: response.data,
+      nextCursor: (response.headers["x-next-cursor"] as string | undefined) ?? null,
+    };
+  },
+
   getTrackerDetails: async (trackerId: number) => {
     const response = await apiClient.get(`trackers/${trackerId}`);
     return response.data;
@@ -45,6 +62,30 @@ export const trackerApi = {
     const response = await apiClient.get(`trackers/${trackerId}/holdings`);
     return response.data;
   },
+
+  // Filing periods with a holdings snapshot, newest first (ISO dates)
+  getHoldingPeriods: async (trackerId: number) => {
+    const response = await apiClient.get(`trackers/${trackerId}/holdings/periods`);
+    return response.data;
+  },
+
+  // What changed between two filings; defaults to the latest one vs the previous
+  getHoldingsDiff: async (trackerId: number, from?: string, to?: string) => {
+    const response = await apiClient.get(`trackers/${trackerId}/holdings/diff`, {
+      params: { from, to },
+    });
+    return response.data;
+  },
+};
+
+// Daily closes aligned on one date axis: { tickers, dates, prices: { TICKER: [...] } }
+export const priceApi = {
+  getPriceMatrix: async (tickers: string[], start?: string, end?: string) => {
+    const response = await apiClient.get("prices", {
+      params: { tickers: tickers.join(","), start, end },
+    });
+    return response.data;
+  },
 };
 
 // Investment API
@@ -61,6 +102,12 @@ export const investmentApi = {
     });
     return response.data;
   },
+
+  // Investments are queued (202); poll until status is 'filled' or 'failed'
+  getOrderStatus: async (orderId: number) => {
+    const response = await apiClient.get(`invest/orders/${orderId}`);
+    return response.data;
+  },
 };
 
 // Portfolio API
@@ -72,10 +119,39 @@ export const portfolioApi = {
 };
 
 export const chartApi = {
-  getChart: async (trackerId?: number) => {
-    const response = await apiClient.post("chart/test", {
-      val: 1,
-      tracker_id: trackerId,
+  // Cumulative return chart as a Vega-Lite spec; range is one of 1m, 3m, 6m, ytd, 1y, 5y, max.
+  // maxPoints caps the points sent (server-side downsampling), e.g. to the chart's pixel width
+  getChart: async (trackerId: number, range: string = "ytd", maxPoints?: number) => {
+    const response = await apiClient.get(`chart/trackers/${trackerId}`, {
+      params: { range, max_points: maxPoints },
+    });
+    return response.data;
+  },
+
+  // Data-only mode: cache the style's spec once (getChartSpec) and fetch just the
+  // "series" dataset as parallel arrays; x holds days since 1970-01-01
+  getChartSpec: async (style: "area" | "comparison") => {
+    const response = await apiClient.get(`chart/specs/${style}`);
+    return response.data;
+  },
+
+  getChartColumns: async (trackerId: number, range: string = "ytd", maxPoints?: number) => {
+    const response = await apiClient.get(`chart/trackers/${trackerId}`, {
+      params: { range, max_points: maxPoints },
+      headers: { Accept: "application/vnd.hedgie.columns+json" },
+    });
+    return response.data;
+  },
+
+  // Several trackers and a benchmark (default S&P 500 / SPY; "" for none) on one layered chart
+  getComparisonChart: async (
+    trackerIds: number[],
+    benchmark?: string,
+    range: string = "ytd",
+    maxPoints?: number
+  ) => {
+    const response = await apiClient.get("chart/compare", {
+      params: { trackers: trackerIds.join(","), benchmark, range, max_points: maxPoints },
     });
     return response.data;
   },
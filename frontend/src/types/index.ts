@@ -21,6 +21,7 @@ export interface Tracker {
   average_delay: number;
   risk_level: string; // 'low' | 'medium' | 'high'
   followers_count: number;
+  holdings?: TrackerHolding[]; // Present when requested with include=holdings
 }
 
 export interface TrackerHolding {
@@ -31,6 +32,36 @@ export interface TrackerHolding {
   allocation_percent: number;
 }
 
+export interface HoldingChange {
+  ticker: string;
+  company_name: string;
+  change: string; // 'added' | 'removed' | 'reweighted'
+  previous_percent: number;
+  allocation_percent: number;
+  delta_percent: number;
+}
+
+export interface HoldingsDiff {
+  tracker_id: number;
+  from_period: string | null; // ISO date of the earlier filing
+  to_period: string | null;
+  changes: HoldingChange[];
+}
+
+// Data-only chart response (Accept: application/vnd.hedgie.columns+json)
+export interface ChartColumns {
+  style: "area" | "comparison";
+  dataset: string; // Named dataset of the style's spec
+  range: string;
+  columns: { x: number[]; y: number[]; [field: string]: (number | string | boolean)[] }; // x: epoch days
+}
+
+export interface PriceMatrix {
+  tickers: string[];
+  dates: string[]; // ISO dates, shared by every ticker
+  prices: Record<string, (number | null)[]>; // null before a ticker's first close
+}
+
 export interface ActiveTracker {
   tracker_id: number;
   tracker_name: string;